@@ -0,0 +1,134 @@
+# salesforce_snowflake_sync/api_governor.py
+
+import logging
+import re
+import threading
+import time
+import requests
+from config import APP_CONFIG
+from metrics import metrics
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+API_USAGE_PATTERN = re.compile(r'(?:^|[^-])api-usage=(\d+)/(\d+)')
+
+
+class ApiLimitReached(Exception):
+    """Raised instead of sending a request while the daily API budget is below the pause threshold"""
+
+
+class ApiGovernor:
+    """Keeps the org's daily API budget from running dry.
+
+    Every Salesforce response carries 'Sforce-Limit-Info: api-usage=<used>/<total>'. Below
+    api_throttle_threshold of the budget remaining each request is delayed by api_throttle_delay;
+    below api_pause_threshold requests are refused with ApiLimitReached until a refresh shows
+    the budget has recovered. Independently, requests are spaced to at most
+    api_max_requests_per_second across all threads (0 disables the cap).
+    """
+
+    def __init__(self, throttle_threshold=None, pause_threshold=None, throttle_delay=None, max_requests_per_second=None):
+        self.throttle_threshold = APP_CONFIG['api_throttle_threshold'] if throttle_threshold is None else throttle_threshold
+        self.pause_threshold = APP_CONFIG['api_pause_threshold'] if pause_threshold is None else pause_threshold
+        self.throttle_delay = APP_CONFIG['api_throttle_delay'] if throttle_delay is None else throttle_delay
+        rate = APP_CONFIG['api_max_requests_per_second'] if max_requests_per_second is None else max_requests_per_second
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.used = None
+        self.total = None
+        self.requests_sent = 0
+        self.probing = False
+
+    @property
+    def remaining_fraction(self):
+        if not self.total:
+            return None
+        return max(self.total - self.used, 0) / self.total
+
+    @property
+    def state(self):
+        remaining = self.remaining_fraction
+        if remaining is None or remaining > self.throttle_threshold:
+            return 'ok'
+        if remaining > self.pause_threshold:
+            return 'throttled'
+        return 'paused'
+
+    @property
+    def paused(self):
+        return self.state == 'paused'
+
+    def check(self):
+        if self.paused and not self.probing:
+            raise ApiLimitReached(f"Salesforce API budget nearly exhausted ({self.used}/{self.total} used); "
+                                  f"pausing below {self.pause_threshold:.0%} remaining.")
+
+    def before_request(self):
+        self.check()
+        with self.lock:
+            now = time.monotonic()
+            delay = self.throttle_delay if self.state == 'throttled' else 0.0
+            slot = max(now + delay, self.next_slot)
+            self.next_slot = slot + self.min_interval
+            self.requests_sent += 1
+        if slot > now:
+            time.sleep(slot - now)
+
+    def observe(self, limit_info):
+        match = API_USAGE_PATTERN.search(limit_info or '')
+        if not match:
+            return
+        previous_state = self.state
+        with self.lock:
+            self.used, self.total = int(match.group(1)), int(match.group(2))
+        state = self.state
+        if state != previous_state:
+            logger.warning(f"Salesforce API budget {self.used}/{self.total} used; governor state {previous_state} -> {state}.")
+
+    def exhausted(self):
+        """Record that Salesforce refused a request for exceeding the daily limit"""
+        with self.lock:
+            self.total = self.total or 1
+            self.used = self.total
+        logger.error("Salesforce reported REQUEST_LIMIT_EXCEEDED; pausing API calls.")
+
+    def usage(self):
+        """Current consumption as a dict, for logging by the integration loop"""
+        remaining = self.remaining_fraction
+        return {
+            'used': self.used,
+            'total': self.total,
+            'remaining_pct': None if remaining is None else round(remaining * 100, 1),
+            'state': self.state,
+            'requests_sent': self.requests_sent,
+        }
+
+
+class GovernedAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that passes every request through an ApiGovernor
+
+    A transport adapter (e.g. FakeSalesforceAdapter) answers the requests instead of the network when given.
+    """
+
+    def __init__(self, governor, transport=None, **kwargs):
+        self.governor = governor
+        self.transport = transport
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.governor.before_request()
+        start = time.perf_counter()
+        try:
+            if self.transport is not None:
+                response = self.transport.send(request, **kwargs)
+            else:
+                response = super().send(request, **kwargs)
+        except Exception:
+            metrics.observe_salesforce_request(request, time.perf_counter() - start)
+            raise
+        metrics.observe_salesforce_request(request, time.perf_counter() - start, response.status_code)
+        self.governor.observe(response.headers.get('Sforce-Limit-Info'))
+        if response.status_code == 403 and b'REQUEST_LIMIT_EXCEEDED' in response.content:
+            self.governor.exhausted()
+        return response
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Track Snowflake extraction time and peak memory as the order volume grows.
+
+For every scale factor the synthetic generator writes orders_per_day * scale orders per day for
+10 days into a fresh fake Snowflake (SQLite) database; the 7-day orders query then runs through
+SnowflakeClient exactly as in production, once materialized (fetch_orders) and once streamed
+(iter_orders). Times come from a run without tracemalloc, peaks from a second run with it.
+
+    python benchmarks/extraction_scale.py --orders-per-day 200 --scales 1,10,100
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import APP_CONFIG
+APP_CONFIG['snowflake_backend'] = 'fake'
+
+import fake_snowflake
+from synthetic_orders import SyntheticOrderGenerator
+from snowflake_pool import SnowflakeConnectionPool
+from snowflake_client import SnowflakeClient
+
+
+def extract(client, method):
+    if method == 'fetch':
+        return len(client.fetch_orders())
+    return sum(1 for _ in client.iter_orders())
+
+
+def measure(client, method):
+    start = time.perf_counter()
+    orders = extract(client, method)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    extract(client, method)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return orders, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders-per-day', type=int, default=200)
+    parser.add_argument('--items', type=int, default=8, help="Average line items per order")
+    parser.add_argument('--posted-ratio', type=float, default=0.7)
+    parser.add_argument('--null-rate', type=float, default=0.02)
+    parser.add_argument('--scales', default='1,10')
+    parser.add_argument('--query-modes', default='rows,aggregated')
+    args = parser.parse_args()
+
+    APP_CONFIG['LOAD_METHOD'] = 'last_7_days'
+    print(f"{'scale':>6}{'rows':>10}{'load s':>9}  {'query':<11}{'method':<7}{'orders':>9}{'s':>9}"
+          f"{'orders/s':>11}{'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in [int(s) for s in args.scales.split(',')]:
+            APP_CONFIG['fake_snowflake_path'] = os.path.join(directory, f"scale_{scale}.db")
+            generator = SyntheticOrderGenerator(orders_per_day=args.orders_per_day * scale,
+                                                items_per_order=args.items, posted_ratio=args.posted_ratio,
+                                                null_rate=args.null_rate)
+            start = time.perf_counter()
+            rows = fake_snowflake.populate(APP_CONFIG['fake_snowflake_path'], generator)
+            load_time = time.perf_counter() - start
+            client = SnowflakeClient({}, pool=SnowflakeConnectionPool({}))
+            for query_mode in args.query_modes.split(','):
+                APP_CONFIG['query_mode'] = query_mode
+                for method in ('fetch', 'stream'):
+                    orders, elapsed, peak = measure(client, method)
+                    print(f"{scale:>6}{rows:>10}{load_time:>9.2f}  {query_mode:<11}{method:<7}{orders:>9}"
+                          f"{elapsed:>9.2f}{orders / elapsed:>11.0f}{peak / 1e6:>9.1f}")
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Measure end-to-end throughput of run_integration_cycle against the in-memory fake Salesforce.
+
+Synthetic orders come from an in-memory Snowflake connection and are written to the fake server
+of fake_salesforce.py, so the numbers cover the integration's own work plus the configured fake
+latency, not Salesforce. The first cycle creates every order and item. Before each later cycle,
+--change-fraction of the orders (all by default) get a new purchase order number and shipped
+quantities, so the update cycles send real updates despite APP_DIFF_UPDATES; with 0 they measure
+a cycle in which nothing changed.
+With --snapshot the orders are replayed from a recorded extract snapshot (APP_SNAPSHOT_DIR)
+instead, so the run uses real data shapes; Accounts are seeded for its customers.
+
+    python benchmarks/integration_throughput.py --orders 2000 --items 8 --latency-ms 20 --workers 1,8
+    python benchmarks/integration_throughput.py --snapshot snapshots/20250101T000000000000Z
+"""
+
+import argparse
+import dataclasses
+import logging
+import os
+import sys
+import time
+import zlib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import APP_CONFIG
+APP_CONFIG['salesforce_backend'] = 'fake'
+
+import fake_salesforce
+from query_modes import synthetic_rows, aggregate_rows, Pool
+from snowflake_client import SnowflakeClient
+from snapshots import SnapshotReplaySource
+from salesforce_client import SalesforceClient
+from integration import SalesforceSnowflakeIntegration
+
+
+def synthetic_accounts(customers=500, divisions=3):
+    """(name, customer number, AR division) of every customer/AR division of the synthetic rows"""
+    return [(f"Customer {customer}", f"C{customer:05d}", f"{division:02d}")
+            for customer in range(customers) for division in range(1, divisions + 1)]
+
+
+def snapshot_accounts(snapshot):
+    """(name, customer number, AR division) of every customer/AR division in a snapshot"""
+    return sorted({(order.customer_name, order.customer_number, order.ar_division_number)
+                   for _, order in SnapshotReplaySource(snapshot).iter_orders()}, key=str)
+
+
+def seed_accounts(server, accounts):
+    for name, customer_number, division in accounts:
+        server.insert('Account', {'Name': name, 'LOP_Customer_Number__c': customer_number,
+                                  'AR_Div_Number__c': division})
+
+
+class ChangingSource:
+    """Wraps an order source; from the second cycle on, a fixed share of the orders comes back with
+    changed update fields"""
+
+    def __init__(self, source, fraction):
+        self.source = source
+        self.fraction = fraction
+        self.cycle = 0
+
+    def changed(self, orders):
+        for son, order in orders:
+            # The same orders change in every cycle, picked by a stable hash of their number
+            if self.cycle and zlib.crc32(son.encode('utf-8')) % 1000 < self.fraction * 1000:
+                order = dataclasses.replace(
+                    order, customer_po_number=f"{order.customer_po_number}-R{self.cycle}",
+                    items=[dataclasses.replace(item, qty_shipped=(item.qty_shipped or 0) + self.cycle)
+                           for item in order.items])
+            yield son, order
+
+    def iter_orders(self):
+        return self.changed(self.source.iter_orders())
+
+    def fetch_orders(self):
+        return dict(self.changed(self.source.fetch_orders().items()))
+
+    def commit_watermark(self):
+        self.source.commit_watermark()
+
+    def close(self):
+        self.source.close()
+
+
+def run(make_source, accounts, write_mode, workers, cycles, change_fraction=1.0):
+    APP_CONFIG['write_mode'] = write_mode
+    APP_CONFIG['workers'] = workers
+    server = fake_salesforce.default_server()
+    server.reset()
+    seed_accounts(server, accounts)
+    source = ChangingSource(make_source(), change_fraction)
+    integration = SalesforceSnowflakeIntegration(source,
+                                                 SalesforceClient({'username': 'benchmark', 'password': '',
+                                                                   'security_token': '', 'domain': 'fake'}))
+    rows = []
+    for cycle in range(cycles):
+        source.cycle = cycle
+        calls = server.api_used
+        start = time.perf_counter()
+        created_orders, created_items, updated_orders, updated_items = integration.run_integration_cycle()
+        elapsed = time.perf_counter() - start
+        orders = created_orders + updated_orders
+        items = created_items + updated_items
+        rows.append((write_mode, workers, 'create' if cycle == 0 else 'update', orders, items, elapsed,
+                     server.api_used - calls))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=8, help="Average line items per order")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Fake Salesforce latency per request")
+    parser.add_argument('--write-modes', default='record,batch')
+    parser.add_argument('--workers', default='1', help="Comma-separated APP_WORKERS values for the record mode")
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--change-fraction', type=float, default=1.0,
+                        help="Share of the orders changed before each update cycle; 0 leaves them all unchanged")
+    parser.add_argument('--snapshot', help="Replay this extract snapshot instead of synthetic orders")
+    args = parser.parse_args()
+
+    logging.getLogger('sf_snowflake_integration').setLevel(logging.WARNING)
+    if args.snapshot:
+        accounts = snapshot_accounts(args.snapshot)
+        manifest = SnapshotReplaySource(args.snapshot).manifest
+        make_source = lambda: SnapshotReplaySource(args.snapshot)
+        description = f"Snapshot {args.snapshot}: {manifest['orders']} orders, {manifest['rows']} line items"
+    else:
+        rows = synthetic_rows(args.orders, args.items)
+        results = {'rows': rows, 'aggregated': aggregate_rows(rows)}
+        accounts = synthetic_accounts()
+        make_source = lambda: SnowflakeClient({}, pool=Pool(results))
+        description = f"{args.orders} orders, {len(rows)} line items"
+    APP_CONFIG.update({'arrow_fetch': False, 'LOAD_METHOD': 'last_7_days', 'account_cache': False,
+                       'metrics_summary_path': '', 'fake_sf_latency_ms': args.latency_ms})
+    fake_salesforce.default_server().latency_ms = args.latency_ms
+
+    print(f"{description}, {args.latency_ms:g} ms fake latency")
+    print(f"{'mode':<8}{'workers':>8}{'cycle':>8}{'orders':>9}{'items':>9}{'s':>9}"
+          f"{'orders/s':>10}{'items/s':>10}{'calls':>8}{'calls/order':>13}")
+    for write_mode in args.write_modes.split(','):
+        for workers in ([int(w) for w in args.workers.split(',')] if write_mode == 'record' else [1]):
+            for mode, w, cycle, orders, items, elapsed, calls in run(make_source, accounts, write_mode, workers,
+                                                                          args.cycles, args.change_fraction):
+                # A cycle that wrote nothing has no per-order cost; its calls are lookups only
+                per_order = f"{calls / orders:.2f}" if orders else 'unchanged'
+                print(f"{mode:<8}{w:>8}{cycle:>8}{orders:>9}{items:>9}{elapsed:>9.2f}{orders / elapsed:>10.1f}"
+                      f"{items / elapsed:>10.1f}{calls:>8}{per_order:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark the 'rows' and 'aggregated' Snowflake query modes on a synthetic dataset.
+
+Both modes are fed result sets shaped like the connector's (DECIMAL, DATE and VARIANT-as-JSON
+values) through an in-memory connection, so the numbers cover the bytes of each result set and
+the Python work of turning it into orders_dict, not Snowflake itself.
+
+    python benchmarks/query_modes.py --orders 20000 --items 8
+"""
+
+import argparse
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import APP_CONFIG
+from snowflake_client import SnowflakeClient
+
+
+def synthetic_rows(orders, items_per_order, seed=7):
+    """One row per line item in the column order of SnowflakeClient.build_orders_query"""
+    return list(iter_synthetic_rows(orders, items_per_order, seed))
+
+
+def iter_synthetic_rows(orders, items_per_order, seed=7):
+    rng = random.Random(seed)
+    start = datetime.date.today() - datetime.timedelta(days=6)
+    for n in range(orders):
+        son = f"SO{n:08d}"
+        posted = rng.random() < 0.7
+        customer = rng.randrange(500)
+        header = [son, f"Customer {customer}", f"ACCT{customer:05d}", f"PO-{rng.randrange(10 ** 6):06d}",
+                  f"C{customer:05d}", f"{rng.randrange(1, 4):02d}", start + datetime.timedelta(days=rng.randrange(7)),
+                  start + datetime.timedelta(days=6) if posted else None, f"INV{n:08d}" if posted else None,
+                  Decimal(f"{rng.uniform(10, 5000):.2f}"), Decimal(f"{rng.uniform(10, 5000):.2f}")]
+        for i in range(rng.randint(1, 2 * items_per_order - 1)):
+            yield tuple(header + [
+                f"ITEM{rng.randrange(5000):05d}", f"Item description {i}", Decimal(rng.randint(1, 50)),
+                Decimal(rng.randint(0, 50)), Decimal(f"{rng.uniform(1, 200):.2f}"), Decimal('0.00'),
+                Decimal(f"{rng.uniform(0, 5):.2f}"), '' if rng.random() < 0.8 else 'Backordered'
+            ])
+
+
+def aggregate_rows(rows):
+    """What the ARRAY_AGG query returns for the same data: one row per order, items as JSON text"""
+    orders = {}
+    for row in rows:
+        header, item = row[:11], row[11:]
+        entry = orders.setdefault(row[0], [header, []])
+        entry[1].append({str(i): float(value) if isinstance(value, Decimal) else value
+                         for i, value in enumerate(item)})
+    return [tuple(header) + (json.dumps(items, separators=(',', ':')),) for header, items in orders.values()]
+
+
+class Cursor:
+    def __init__(self, results):
+        self.results = results
+        self.description = None
+
+    def execute(self, query):
+        aggregated = 'ARRAY_AGG' in query
+        columns = ['SALES_ORDER_NUMBER'] + SnowflakeClient.ORDER_COLUMNS
+        columns += ['ITEMS'] if aggregated else SnowflakeClient.ITEM_COLUMNS
+        self.description = [(name,) for name in columns]
+        self.rows = self.results['aggregated' if aggregated else 'rows']
+        self.position = 0
+
+    def fetchmany(self, size):
+        batch = self.rows[self.position:self.position + size]
+        self.position += len(batch)
+        return batch
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, results):
+        self.results = results
+
+    def cursor(self):
+        return Cursor(self.results)
+
+
+class Pool:
+    """Stands in for SnowflakeConnectionPool with one in-memory connection"""
+
+    def __init__(self, results):
+        self.conn = Connection(results)
+
+    def checkout(self):
+        return self
+
+    def checkin(self, pooled, discard=False):
+        pass
+
+    def connection(self):
+        return contextlib.nullcontext(self.conn)
+
+
+def result_bytes(rows):
+    """Size of the result set as CSV text, raw and gzip-compressed (Snowflake compresses result chunks)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    raw = buffer.getvalue().encode('utf-8')
+    return len(raw), len(gzip.compress(raw, compresslevel=6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--items', type=int, default=8, help="Average line items per order")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.orders, args.items)
+    results = {'rows': rows, 'aggregated': aggregate_rows(rows)}
+    APP_CONFIG['arrow_fetch'] = False
+    APP_CONFIG['LOAD_METHOD'] = 'last_7_days'
+    client = SnowflakeClient({}, pool=Pool(results))
+
+    print(f"{args.orders} orders, {len(rows)} line items")
+    print(f"{'mode':<12}{'rows':>10}{'cells':>12}{'MB':>10}{'gzip MB':>10}{'best s':>10}")
+    fetched = {}
+    for mode in ('rows', 'aggregated'):
+        APP_CONFIG['query_mode'] = mode
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fetched[mode] = client.fetch_orders()
+            timings.append(time.perf_counter() - start)
+        mode_rows = results[mode]
+        cells = len(mode_rows) * len(mode_rows[0])
+        raw, compressed = result_bytes(mode_rows)
+        print(f"{mode:<12}{len(mode_rows):>10}{cells:>12}{raw / 1e6:>10.2f}{compressed / 1e6:>10.2f}{min(timings):>10.3f}")
+
+    print("orders_dict identical:", fetched['rows'] == fetched['aggregated'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Measure the memory held by orders_dict as Order/LineItem records versus the former nested dicts.
+
+Rows are generated batch by batch, and every string cell is decoded into a new object as the
+connector does. The peak and retained sizes therefore reflect one fetch_orders() call, with the
+rows released after each batch.
+
+    python benchmarks/record_memory.py --orders 50000 --items 8
+"""
+
+import argparse
+import gc
+import itertools
+import os
+import sys
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import APP_CONFIG
+from snowflake_client import SnowflakeClient
+from query_modes import Pool, iter_synthetic_rows
+
+
+class StreamingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = [(name,) for name in
+                            ['SALES_ORDER_NUMBER'] + SnowflakeClient.ORDER_COLUMNS + SnowflakeClient.ITEM_COLUMNS]
+
+    def execute(self, query):
+        pass
+
+    def fetchmany(self, size):
+        return [tuple(value.encode('utf-8').decode('utf-8') if isinstance(value, str) else value for value in row)
+                for row in itertools.islice(self.rows, size)]
+
+    def close(self):
+        pass
+
+
+def legacy_orders_dict(client, cursor):
+    """The dict-of-dicts shape fetch_orders returned before Order/LineItem"""
+    orders_dict = {}
+    for rows in iter(lambda: cursor.fetchmany(APP_CONFIG['fetch_batch_size']), []):
+        for row in rows:
+            record = client.normalize_record(dict(zip([c[0] for c in cursor.description], row)))
+            son = record['SALES_ORDER_NUMBER'] or ''
+            if son not in orders_dict:
+                order = {name: record.get(name) for name in SnowflakeClient.ORDER_COLUMNS}
+                order['SALES_ORDER_NUMBER'] = son
+                order['ITEMS'] = []
+                orders_dict[son] = order
+            orders_dict[son]['ITEMS'].append({name: record.get(name) for name in SnowflakeClient.ITEM_COLUMNS})
+    return orders_dict
+
+
+def record_orders_dict(client, cursor):
+    orders_dict = {}
+    for son, order_values, item in client.iter_row_records(cursor):
+        if son not in orders_dict:
+            orders_dict[son] = client.build_order(son, order_values)
+        orders_dict[son].items.append(item)
+    return orders_dict
+
+
+def measure(build, client, args):
+    gc.collect()
+    tracemalloc.start()
+    result = build(client, StreamingCursor(iter_synthetic_rows(args.orders, args.items)))
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--items', type=int, default=8, help="Average line items per order")
+    args = parser.parse_args()
+
+    APP_CONFIG['LOAD_METHOD'] = 'last_7_days'
+    # Cursors are passed in directly; the pool only satisfies the client's startup checkout
+    client = SnowflakeClient({}, pool=Pool({}))
+
+    print(f"{'representation':<16}{'retained MB':>14}{'peak MB':>10}")
+    sizes = {}
+    for name, build in (('dicts', legacy_orders_dict), ('records', record_orders_dict)):
+        result, retained, peak = measure(build, client, args)
+        sizes[name] = retained
+        line_items = sum(len(order['ITEMS'] if isinstance(order, dict) else order.items) for order in result.values())
+        del result
+        print(f"{name:<16}{retained / 1e6:>14.1f}{peak / 1e6:>10.1f}")
+    print(f"{args.orders} orders, {line_items} line items; records retain "
+          f"{1 - sizes['records'] / sizes['dicts']:.0%} less memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# salesforce_snowflake_sync/bulk_loader.py
+
+import csv
+import glob
+import logging
+import os
+import tempfile
+from config import APP_CONFIG
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+# Bulk API 2.0 leaves a field unchanged when its CSV value is blank; '#N/A' sets it to null
+BULK_NULL = '#N/A'
+# Hard-delete errors of records that no longer exist, e.g. deleted by an interrupted earlier run
+ALREADY_DELETED_ERRORS = ('ENTITY_IS_DELETED', 'INVALID_CROSS_REFERENCE_KEY')
+
+
+class BulkLoader:
+    """Bulk API 2.0 upserts with a file-based retry queue for failed rows.
+
+    Failed rows of each ingest job are downloaded into retry_dir as
+    '<object>.<attempt>.<job id>.csv' and resubmitted at the start of the next load,
+    until bulk_max_attempts is reached and the file is renamed to '*.failed.csv'.
+    """
+
+    def __init__(self, salesforce_client, retry_dir=None, max_attempts=None):
+        self.salesforce_client = salesforce_client
+        self.retry_dir = retry_dir or APP_CONFIG['bulk_retry_dir']
+        self.max_attempts = max_attempts or APP_CONFIG['bulk_max_attempts']
+        os.makedirs(self.retry_dir, exist_ok=True)
+
+    def upsert_rows(self, object_name, rows, external_id_field, fieldnames):
+        """Stream rows (dicts) to a CSV file and upsert it. Returns (created, updated, failed) counts."""
+        fd, path = tempfile.mkstemp(prefix=f"{object_name}.", suffix='.csv', dir=self.retry_dir)
+        count = 0
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, lineterminator='\n')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({field: self._csv_value(row.get(field)) for field in fieldnames})
+                count += 1
+
+        try:
+            if not count:
+                return 0, 0, 0
+            logger.info(f"Bulk upserting {count} {object_name} records on {external_id_field}...")
+            return self._upsert_file(object_name, path, external_id_field, attempt=1)
+        finally:
+            os.remove(path)
+
+    def hard_delete(self, object_name, record_ids):
+        """Hard-delete records with Bulk API 2.0. Returns the set of Ids that are gone, including those
+        that were already deleted; failures are logged, not queued, since rerunning the caller retries them."""
+        record_ids = list(record_ids)
+        if not record_ids:
+            return set()
+        fd, path = tempfile.mkstemp(prefix=f"{object_name}.delete.", suffix='.csv', dir=self.retry_dir)
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            f.write('Id\n')
+            f.writelines(f"{record_id}\n" for record_id in record_ids)
+
+        deleted = set(record_ids)
+        try:
+            logger.info(f"Bulk hard-deleting {len(record_ids)} {object_name} records...")
+            for job in self.salesforce_client.bulk_hard_delete(object_name, path):
+                if not job['numberRecordsFailed']:
+                    continue
+                failed_path = f"{path}.{job['job_id']}.failed.csv"
+                self.salesforce_client.download_bulk_results(object_name, job['job_id'], 'failedResults', failed_path)
+                try:
+                    with open(failed_path, newline='', encoding='utf-8') as failed:
+                        for row in csv.DictReader(failed):
+                            # sf__Error reads '<status code>:<message>:<fields>'
+                            if (row.get('sf__Error') or '').split(':', 1)[0] in ALREADY_DELETED_ERRORS:
+                                continue
+                            deleted.discard(row.get('Id') or row.get('sf__Id'))
+                            logger.error(f"Salesforce error (hard delete {object_name} {row.get('Id')}): {row.get('sf__Error')}")
+                finally:
+                    os.remove(failed_path)
+        finally:
+            os.remove(path)
+        logger.info(f"Bulk hard delete {object_name}: {len(deleted)}/{len(record_ids)} succeeded.")
+        return deleted
+
+    def drain_retry_queue(self, object_name, external_id_field):
+        """Resubmit queued failures of earlier loads. Returns (created, updated, failed) counts."""
+        totals = [0, 0, 0]
+        for path in sorted(glob.glob(os.path.join(self.retry_dir, f"{object_name}.*.*.csv"))):
+            parts = os.path.basename(path)[len(object_name) + 1:].split('.')
+            if len(parts) != 3 or not parts[0].isdigit():
+                continue
+            attempt = int(parts[0]) + 1
+            if attempt > self.max_attempts:
+                continue
+
+            logger.info(f"Retrying queued {object_name} failures from {path} (attempt {attempt}/{self.max_attempts})")
+            clean_path = self._strip_result_columns(path)
+            try:
+                created, updated, failed = self._upsert_file(object_name, clean_path, external_id_field, attempt)
+            finally:
+                os.remove(clean_path)
+            os.remove(path)
+            totals[0] += created
+            totals[1] += updated
+            totals[2] += failed
+        return tuple(totals)
+
+    def _upsert_file(self, object_name, path, external_id_field, attempt):
+        created = updated = failed = 0
+        jobs = self.salesforce_client.bulk_upsert(object_name, path, external_id_field)
+        for job in jobs:
+            job_id = job['job_id']
+            failed += job['numberRecordsFailed']
+            job_created, job_updated = self._count_successes(object_name, job_id)
+            created += job_created
+            updated += job_updated
+
+            if job['numberRecordsFailed']:
+                queue_path = os.path.join(self.retry_dir, f"{object_name}.{attempt}.{job_id}.csv")
+                self.salesforce_client.download_bulk_results(object_name, job_id, 'failedResults', queue_path)
+                if attempt >= self.max_attempts:
+                    failed_path = queue_path[:-len('.csv')] + '.failed.csv'
+                    os.replace(queue_path, failed_path)
+                    logger.error(f"{job['numberRecordsFailed']} {object_name} records failed in job {job_id} "
+                                 f"after {attempt} attempts; see {failed_path}")
+                else:
+                    logger.warning(f"{job['numberRecordsFailed']} {object_name} records failed in job {job_id}; "
+                                   f"queued for retry in {queue_path}")
+
+        logger.info(f"Bulk upsert {object_name}: {created} created, {updated} updated, {failed} failed.")
+        return created, updated, failed
+
+    def _count_successes(self, object_name, job_id):
+        fd, path = tempfile.mkstemp(prefix=f"{object_name}.{job_id}.", suffix='.success.csv', dir=self.retry_dir)
+        os.close(fd)
+        try:
+            self.salesforce_client.download_bulk_results(object_name, job_id, 'successfulResults', path)
+            created = updated = 0
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('sf__Created') == 'true':
+                        created += 1
+                    else:
+                        updated += 1
+            return created, updated
+        finally:
+            os.remove(path)
+
+    def _strip_result_columns(self, path):
+        fd, clean_path = tempfile.mkstemp(prefix='retry.', suffix='.csv', dir=self.retry_dir)
+        with open(path, newline='', encoding='utf-8') as src, os.fdopen(fd, 'w', newline='', encoding='utf-8') as dst:
+            reader = csv.DictReader(src)
+            fieldnames = [field for field in reader.fieldnames if not field.startswith('sf__')]
+            writer = csv.DictWriter(dst, fieldnames=fieldnames, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+            for row in reader:
+                writer.writerow(row)
+        return clean_path
+
+    @staticmethod
+    def _csv_value(value):
+        if value is None or value == '':
+            return BULK_NULL
+        return value
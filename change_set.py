@@ -0,0 +1,140 @@
+# salesforce_snowflake_sync/change_set.py
+
+import logging
+import math
+from dataclasses import dataclass, field
+from config import APP_CONFIG
+from metrics import metrics
+from salesforce_client import SalesforceClient
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+# sObjects in dependency order: a change only references records of the levels before its own
+LEVELS = ('Account', 'Sales_Order__c', 'Sales_Order_Item__c')
+LEVEL_PHASES = {'Account': 'write_accounts', 'Sales_Order__c': 'write_orders', 'Sales_Order_Item__c': 'write_items'}
+
+
+@dataclass(slots=True)
+class Change:
+    """One planned create or update.
+
+    ref names the record inside the change set. references maps payload fields to the refs of
+    records created earlier in the set; their Ids are filled in when the change runs. requires
+    lists refs that must have succeeded first without setting a field. rows counts the extract
+    rows folded into the change. An update whose record already has the planned values is marked
+    'unchanged' and not sent.
+    """
+    object_name: str
+    ref: str
+    action: str
+    payload: dict
+    key: str = ''
+    record_id: str | None = None
+    references: dict = field(default_factory=dict)
+    requires: list = field(default_factory=list)
+    rows: int = 1
+    status: str = 'planned'
+
+    def describe(self):
+        target = self.record_id or self.ref
+        links = ', '.join([f"{name} -> {ref}" for name, ref in self.references.items()] +
+                          [f"after {ref}" for ref in self.requires])
+        return f"{self.action:<7}{self.object_name:<21}{target}" + (f"  ({links})" if links else '')
+
+
+class ChangeSet:
+    """The creates and updates of one extract, grouped by sObject level"""
+
+    def __init__(self):
+        self.changes = {object_name: [] for object_name in LEVELS}
+        self.by_ref = {}
+
+    def add(self, change):
+        self.changes[change.object_name].append(change)
+        self.by_ref[change.ref] = change
+        return change
+
+    def get(self, ref):
+        return self.by_ref.get(ref)
+
+    def __len__(self):
+        return len(self.by_ref)
+
+    def counts(self):
+        """{(sObject, action): changes}, with 'unchanged' as the action of updates that will not be sent"""
+        counts = {}
+        for object_name, changes in self.changes.items():
+            for change in changes:
+                action = 'unchanged' if change.status == 'unchanged' else change.action
+                counts[(object_name, action)] = counts.get((object_name, action), 0) + 1
+        return counts
+
+    def estimate_calls(self, batch_size=None):
+        """API calls to write the set, as a pair: (calls with sObject Collections, calls one record at a time)"""
+        batch_size = min(batch_size or APP_CONFIG['collection_batch_size'], SalesforceClient.COLLECTION_MAX_RECORDS)
+        counts = [count for (_, action), count in self.counts().items() if action != 'unchanged']
+        return sum(math.ceil(count / batch_size) for count in counts), sum(counts)
+
+    def describe(self, details=True):
+        """The plan as text: every change in execution order, then counts and the API-call estimate"""
+        lines = []
+        if details:
+            for object_name in LEVELS:
+                lines.extend(change.describe() for change in self.changes[object_name] if change.status != 'unchanged')
+        counts = self.counts()
+        for object_name in LEVELS:
+            lines.append(f"{object_name}: {counts.get((object_name, 'create'), 0)} creates, "
+                         f"{counts.get((object_name, 'update'), 0)} updates, "
+                         f"{counts.get((object_name, 'unchanged'), 0)} already up to date")
+        batched, per_record = self.estimate_calls()
+        lines.append(f"Estimated API calls: {batched} with sObject Collections, {per_record} one record at a time "
+                     f"(plus retries and the lookups already made while planning)")
+        return '\n'.join(lines)
+
+
+class ChangeSetExecutor:
+    """Runs a change set level by level through sObject Collections.
+
+    Each level is written in batches once the level before it has finished, and the Ids it gets
+    back resolve the references of the next level. A change whose references did not resolve
+    (because the record it points to failed) is skipped.
+    """
+
+    def __init__(self, salesforce_client):
+        self.salesforce_client = salesforce_client
+
+    def execute(self, change_set):
+        ids = {}
+        for object_name in LEVELS:
+            with metrics.phase(LEVEL_PHASES[object_name]):
+                self.execute_level(object_name, change_set.changes[object_name], ids)
+        return change_set
+
+    def execute_level(self, object_name, changes, ids):
+        sf = self.salesforce_client
+        creates = []
+        updates = []
+        for change in changes:
+            if change.status == 'unchanged':
+                ids[change.ref] = change.record_id
+                continue
+            if any(ref not in ids for ref in list(change.references.values()) + change.requires):
+                change.status = 'skipped'
+                continue
+            for field_name, ref in change.references.items():
+                change.payload[field_name] = ids[ref]
+            (creates if change.action == 'create' else updates).append(change)
+
+        if creates:
+            for change, record_id in zip(creates, sf.safely_create_salesforce_batch(
+                    object_name, [change.payload for change in creates])):
+                change.record_id = record_id
+                change.status = 'done' if record_id else 'failed'
+        if updates:
+            for change, result in zip(updates, sf.safely_update_salesforce_batch(
+                    object_name, [(change.record_id, change.payload) for change in updates])):
+                change.status = 'done' if result else 'failed'
+
+        for change in creates + updates:
+            if change.status == 'done':
+                ids[change.ref] = change.record_id
@@ -1,142 +1,225 @@
 #!/usr/bin/env python3
 """
-Cleanup script to identify and optionally remove duplicate orders.
+Cleanup script to identify and remove duplicate orders.
 This script helps clean up the duplicate orders that were created before the fix.
+
+Runs in two steps, both non-interactive:
+
+    python cleanup_duplicates.py plan --keep oldest
+    python cleanup_duplicates.py execute --confirm
+
+'plan' streams every Sales Order sorted by Sales_Order_Number__c and writes one JSON line per
+duplicated order number to the plan file: the order kept, the orders deleted, and what happens to
+the line items of the deleted orders. An item moves to the kept order unless that order already has
+an item with the same product code; then it is deleted. 'execute' works through the plan in chunks,
+deleting an order only after all of its items were moved or deleted, and appends every finished
+order number to '<plan>.done', so an interrupted run resumes where it stopped. Without --confirm
+it only reports what it would do.
 """
 
-import sys
+import argparse
+import itertools
+import json
 import os
+import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config import SF_CONFIG
 from salesforce_client import SalesforceClient
+from bulk_loader import BulkLoader
 from logger import configure_logger
-from simple_salesforce import Salesforce
 
-def find_duplicate_orders():
-    """Find duplicate orders in Salesforce"""
-    logger = configure_logger()
-    
-    try:
-        # Initialize Salesforce client
-        sf_client = SalesforceClient(SF_CONFIG)
-        
-        # Query to find duplicate orders
-        query = """
-        SELECT Id, Name, Sales_Order_Number__c, Invoice_Number__c, CreatedDate
-        FROM Sales_Order__c 
-        WHERE Sales_Order_Number__c IS NOT NULL
-        ORDER BY Sales_Order_Number__c, CreatedDate
-        """
-        
-        logger.info("Searching for duplicate orders...")
-        result = sf_client.sf.query_all(query)
-        
-        # Group by Sales_Order_Number__c to find duplicates
-        orders_by_number = {}
-        for record in result['records']:
-            order_number = record.get('Sales_Order_Number__c')
-            if order_number:
-                if order_number not in orders_by_number:
-                    orders_by_number[order_number] = []
-                orders_by_number[order_number].append(record)
-        
-        # Find duplicates
-        duplicates = {}
-        for order_number, orders in orders_by_number.items():
-            if len(orders) > 1:
-                duplicates[order_number] = orders
-        
-        if duplicates:
-            logger.info(f"Found {len(duplicates)} order numbers with duplicates:")
-            for order_number, orders in duplicates.items():
-                logger.info(f"\nOrder Number: {order_number}")
-                for i, order in enumerate(orders, 1):
-                    logger.info(f"  {i}. ID: {order['Id']}, Invoice: {order.get('Invoice_Number__c', 'None')}, Created: {order['CreatedDate']}")
-        else:
-            logger.info("No duplicate orders found!")
-        
-        return duplicates
-        
-    except Exception as e:
-        logger.error(f"Error finding duplicates: {e}")
-        return {}
-    
-    finally:
-        sf_client.close()
-
-def remove_duplicate_orders(duplicates, keep_oldest=True):
-    """Remove duplicate orders, keeping either the oldest or newest"""
-    logger = configure_logger()
-    
-    if not duplicates:
-        logger.info("No duplicates to remove.")
-        return
-    
+logger = configure_logger()
+
+ORDER_QUERY = ("SELECT Id, Sales_Order_Number__c, Invoice_Number__c, CreatedDate FROM Sales_Order__c "
+               "WHERE Sales_Order_Number__c != null ORDER BY Sales_Order_Number__c, CreatedDate, Id")
+# Duplicate groups whose items are looked up together while planning
+PLAN_ITEM_CHUNK = 200
+
+
+def iter_duplicate_groups(sf_client):
+    """Yield (order number, orders) for every Sales_Order_Number__c held by more than one Sales Order.
+
+    Orders arrive sorted by number, page by page, so only the current group is held in memory.
+    Within a group they are sorted by CreatedDate, oldest first.
+    """
+    current_key = None
+    group = []
+    scanned = 0
+    for record in sf_client.iter_query_records(ORDER_QUERY):
+        scanned += 1
+        key = sf_client.lookup_key(record['Sales_Order_Number__c'])
+        if key != current_key:
+            if len(group) > 1:
+                yield group[0]['Sales_Order_Number__c'], group
+            current_key = key
+            group = []
+        group.append({field: record.get(field) for field in ('Id', 'Invoice_Number__c', 'CreatedDate',
+                                                             'Sales_Order_Number__c')})
+    if len(group) > 1:
+        yield group[0]['Sales_Order_Number__c'], group
+    logger.info(f"{scanned} Sales Orders scanned for duplicates.")
+
+
+def plan_group(order_number, orders, keep_oldest=True):
+    keep = orders[0] if keep_oldest else orders[-1]
+    logger.debug(f"Order {order_number}: keeping {keep['Id']} (created {keep['CreatedDate']}), deleting "
+                 f"{', '.join(order['Id'] for order in orders if order is not keep)}")
+    return {'order_number': order_number, 'keep': keep['Id'],
+            'delete': [order['Id'] for order in orders if order is not keep],
+            'move_items': [], 'delete_items': []}
+
+
+def plan_items(sf_client, entries):
+    """Fill in move_items / delete_items of plan entries from the items of their orders"""
+    items_by_order = {}
+    order_ids = [order_id for entry in entries for order_id in [entry['keep']] + entry['delete']]
+    for item in sf_client.iter_sales_order_items(order_ids):
+        items_by_order.setdefault(item['Sales_Order_Number__c'], []).append(item)
+
+    for entry in entries:
+        product_codes = {sf_client.lookup_key(item['Product_Code__c'])
+                         for item in items_by_order.get(entry['keep'], []) if item.get('Product_Code__c')}
+        for order_id in entry['delete']:
+            for item in items_by_order.get(order_id, []):
+                code = item.get('Product_Code__c')
+                if code and sf_client.lookup_key(code) in product_codes:
+                    entry['delete_items'].append(item['Id'])
+                else:
+                    entry['move_items'].append(item['Id'])
+                    if code:
+                        product_codes.add(sf_client.lookup_key(code))
+    return entries
+
+
+def write_plan(sf_client, plan_path, keep_oldest=True):
+    """Detect duplicates and write the plan; the file only appears once it is complete"""
+    groups = orders = move_items = delete_items = 0
+    duplicates = (plan_group(number, orders, keep_oldest) for number, orders in iter_duplicate_groups(sf_client))
+    with open(plan_path + '.tmp', 'w') as f:
+        for entries in itertools.batched(duplicates, PLAN_ITEM_CHUNK):
+            for entry in plan_items(sf_client, entries):
+                f.write(json.dumps(entry) + '\n')
+                groups += 1
+                orders += len(entry['delete'])
+                move_items += len(entry['move_items'])
+                delete_items += len(entry['delete_items'])
+    os.replace(plan_path + '.tmp', plan_path)
+    if os.path.exists(plan_path + '.done'):
+        os.remove(plan_path + '.done')
+    logger.info(f"Plan written to {plan_path}: {groups} order numbers with duplicates, {orders} orders to delete, "
+                f"{move_items} items to move and {delete_items} items to delete.")
+    return groups
+
+
+def iter_plan(plan_path, done):
+    with open(plan_path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['order_number'] not in done:
+                yield entry
+
+
+def load_done(done_path):
+    if not os.path.exists(done_path):
+        return set()
+    with open(done_path) as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def delete_records(sf_client, loader, object_name, record_ids):
+    """Delete through sObject Collections, or hard-delete with Bulk API 2.0 when loader is set.
+    Returns the set of Ids that are gone."""
+    if not record_ids:
+        return set()
+    if loader is not None:
+        return loader.hard_delete(object_name, record_ids)
+    return set(filter(None, sf_client.safely_delete_salesforce_batch(object_name, record_ids)))
+
+
+def execute_entries(sf_client, loader, entries):
+    """Apply a chunk of plan entries; returns the order numbers that were fully cleaned up"""
+    moves = [(item_id, {'Sales_Order_Number__c': entry['keep']})
+             for entry in entries for item_id in entry['move_items']]
+    moved = set(filter(None, sf_client.safely_update_salesforce_batch('Sales_Order_Item__c', moves))) if moves else set()
+    deleted_items = delete_records(sf_client, loader, 'Sales_Order_Item__c',
+                                   [item_id for entry in entries for item_id in entry['delete_items']])
+
+    # An order whose items could not all be moved or deleted stays, so none of them is lost or orphaned
+    ready = [entry for entry in entries
+             if moved.issuperset(entry['move_items']) and deleted_items.issuperset(entry['delete_items'])]
+    deleted_orders = delete_records(sf_client, loader, 'Sales_Order__c',
+                                    [order_id for entry in ready for order_id in entry['delete']])
+    return [entry['order_number'] for entry in ready if deleted_orders.issuperset(entry['delete'])]
+
+
+def execute_plan(sf_client, plan_path, chunk_size=1000, bulk=False, confirm=False):
+    """Carry out a plan, skipping order numbers already in '<plan>.done'. Returns the count of
+    order numbers left unfinished."""
+    done_path = plan_path + '.done'
+    done = load_done(done_path)
+    if done:
+        logger.info(f"Resuming {plan_path}: {len(done)} order numbers already cleaned up.")
+    loader = BulkLoader(sf_client) if bulk and confirm else None
+    finished = unfinished = orders = items = 0
+
+    for entries in itertools.batched(iter_plan(plan_path, done), chunk_size):
+        if not confirm:
+            finished += len(entries)
+            orders += sum(len(entry['delete']) for entry in entries)
+            items += sum(len(entry['move_items']) + len(entry['delete_items']) for entry in entries)
+            continue
+        completed = execute_entries(sf_client, loader, entries)
+        with open(done_path, 'a') as f:
+            f.writelines(f"{order_number}\n" for order_number in completed)
+        finished += len(completed)
+        unfinished += len(entries) - len(completed)
+        logger.info(f"{finished} order numbers cleaned up so far, {unfinished} left for a rerun.")
+
+    if not confirm:
+        logger.info(f"Dry run: would delete {orders} duplicate orders of {finished} order numbers and move or "
+                    f"delete {items} of their items. Rerun with --confirm to apply the plan.")
+    else:
+        logger.info(f"Duplicate cleanup finished: {finished} order numbers cleaned up, {unfinished} failed.")
+    return unfinished
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find and remove duplicate Sales Orders")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    plan = subparsers.add_parser('plan', help="Detect duplicates and write the cleanup plan")
+    plan.add_argument('--keep', choices=('oldest', 'newest'), default='oldest',
+                      help="Which order of each duplicate group to keep, by CreatedDate (default: oldest)")
+    execute = subparsers.add_parser('execute', help="Apply a cleanup plan, resuming an interrupted run")
+    execute.add_argument('--confirm', action='store_true', help="Actually delete; without it this is a dry run")
+    execute.add_argument('--method', choices=('collections', 'bulk'), default='collections',
+                         help="Delete through sObject Collections (recycle bin) or Bulk API 2.0 hard-delete jobs, "
+                              "which need the 'Bulk API Hard Delete' permission (default: collections)")
+    execute.add_argument('--chunk-size', type=int, default=1000,
+                         help="Order numbers per step; progress is saved after each step (default: 1000)")
+    for subparser in (plan, execute):
+        subparser.add_argument('--plan', default='duplicates_plan.jsonl', help="Plan file (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Main function; returns the process exit code"""
+    args = parse_args(argv)
+    logger.info("Salesforce Duplicate Order Cleanup Tool")
+    sf_client = None
     try:
-        # Initialize Salesforce client
         sf_client = SalesforceClient(SF_CONFIG)
-        
-        logger.info(f"Removing duplicates for {len(duplicates)} order numbers...")
-        
-        for order_number, orders in duplicates.items():
-            logger.info(f"\nProcessing duplicates for order {order_number}:")
-            
-            # Sort by creation date
-            sorted_orders = sorted(orders, key=lambda x: x['CreatedDate'])
-            
-            # Keep the oldest (index 0) or newest (index -1)
-            keep_index = 0 if keep_oldest else -1
-            orders_to_delete = [order for i, order in enumerate(sorted_orders) if i != keep_index]
-            
-            logger.info(f"  Keeping: {sorted_orders[keep_index]['Id']} (Created: {sorted_orders[keep_index]['CreatedDate']})")
-            
-            for order in orders_to_delete:
-                logger.info(f"  Deleting: {order['Id']} (Created: {order['CreatedDate']})")
-                try:
-                    # Note: This is commented out for safety. Uncomment to actually delete.
-                    # sf_client.sf.Sales_Order__c.delete(order['Id'])
-                    logger.info(f"    (Would delete {order['Id']} - uncomment line above to actually delete)")
-                except Exception as e:
-                    logger.error(f"    Error deleting {order['Id']}: {e}")
-        
-        logger.info("Duplicate removal completed!")
-        
+        if args.command == 'plan':
+            write_plan(sf_client, args.plan, keep_oldest=args.keep == 'oldest')
+            return 0
+        return 1 if execute_plan(sf_client, args.plan, args.chunk_size, args.method == 'bulk', args.confirm) else 0
     except Exception as e:
-        logger.error(f"Error removing duplicates: {e}")
-    
+        logger.error(f"Duplicate cleanup failed: {e}")
+        return 1
     finally:
-        sf_client.close()
+        if sf_client is not None:
+            sf_client.close()
 
-def main():
-    """Main function"""
-    logger = configure_logger()
-    
-    logger.info("Salesforce Duplicate Order Cleanup Tool")
-    logger.info("=====================================")
-    
-    # Find duplicates
-    duplicates = find_duplicate_orders()
-    
-    if duplicates:
-        print("\nOptions:")
-        print("1. View duplicates only (no action)")
-        print("2. Remove duplicates (keep oldest)")
-        print("3. Remove duplicates (keep newest)")
-        print("4. Exit")
-        
-        choice = input("\nEnter your choice (1-4): ").strip()
-        
-        if choice == "2":
-            remove_duplicate_orders(duplicates, keep_oldest=True)
-        elif choice == "3":
-            remove_duplicate_orders(duplicates, keep_oldest=False)
-        elif choice == "4":
-            logger.info("Exiting without changes.")
-        else:
-            logger.info("Showing duplicates only.")
-    else:
-        logger.info("No duplicates found. No action needed.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -23,8 +23,108 @@ SNOWFLAKE_CONFIG = {
 APP_CONFIG = {
     'max_retries': int(os.getenv('APP_MAX_RETRIES', '99')),
     'retry_wait': int(os.getenv('APP_RETRY_WAIT', '5')),
+    # Retries back off exponentially with jitter from retry_wait up to retry_max_wait seconds
+    'retry_max_wait': int(os.getenv('APP_RETRY_MAX_WAIT', '60')),
+    # Retries shared by all calls of one cycle (0 = unlimited)
+    'retry_budget': int(os.getenv('APP_RETRY_BUDGET', '100')),
+    'breaker_failure_threshold': int(os.getenv('APP_BREAKER_FAILURE_THRESHOLD', '5')),
+    'breaker_reset_timeout': int(os.getenv('APP_BREAKER_RESET_TIMEOUT', '60')),
     'cycle_wait': int(os.getenv('APP_CYCLE_WAIT', '1000')),
     'log_level': os.getenv('APP_LOG_LEVEL', 'INFO'),
     'log_file': os.getenv('APP_LOG_FILE', 'sf_snowflake_integration.log'),
+    # Rotate the log file at log_max_bytes, keeping log_backup_count old files; 0 never rotates
+    'log_max_bytes': int(os.getenv('APP_LOG_MAX_BYTES', '0')),
+    'log_backup_count': int(os.getenv('APP_LOG_BACKUP_COUNT', '5')),
+    # 'text' or 'json' (one object per line with structured fields)
+    'log_format': os.getenv('APP_LOG_FORMAT', 'text'),
+    # Write log records on a background thread instead of in the calling thread
+    'log_async': os.getenv('APP_LOG_ASYNC', 'false').lower() == 'true',
+    # Level of the per-order/per-item messages (empty follows log_level), and log only every Nth of them
+    'record_log_level': os.getenv('APP_RECORD_LOG_LEVEL', ''),
+    'record_log_sample': int(os.getenv('APP_RECORD_LOG_SAMPLE', '1')),
+    # 'last_7_days' re-reads a rolling 7-day window; 'incremental' reads rows past the stored watermark
     'LOAD_METHOD': os.getenv('APP_LOAD_METHOD', 'last_7_days'),
+    'watermark_column': os.getenv('APP_WATERMARK_COLUMN', 'LAST_MODIFIED_DATE'),
+    # Stream orders from Snowflake and process them in chunks instead of loading the whole window first
+    'stream_orders': os.getenv('APP_STREAM_ORDERS', 'true').lower() == 'true',
+    'fetch_batch_size': int(os.getenv('APP_FETCH_BATCH_SIZE', '10000')),
+    'stream_chunk_orders': int(os.getenv('APP_STREAM_CHUNK_ORDERS', '500')),
+    # 'rows' fetches one row per line item; 'aggregated' has Snowflake group items per order with ARRAY_AGG
+    'query_mode': os.getenv('APP_QUERY_MODE', 'rows'),
+    # Read Arrow result batches and normalize numeric/date columns column-wise (needs pyarrow)
+    'arrow_fetch': os.getenv('APP_ARROW_FETCH', 'true').lower() == 'true',
+    # Snowflake connection pool: connections open at once, recycled after max_age / max_idle seconds;
+    # a connection idle for liveness_interval seconds is checked with a session heartbeat before reuse
+    'snowflake_pool_size': int(os.getenv('APP_SNOWFLAKE_POOL_SIZE', '4')),
+    'snowflake_pool_max_age': int(os.getenv('APP_SNOWFLAKE_POOL_MAX_AGE', '14400')),
+    'snowflake_pool_max_idle': int(os.getenv('APP_SNOWFLAKE_POOL_MAX_IDLE', '3600')),
+    'snowflake_liveness_interval': int(os.getenv('APP_SNOWFLAKE_LIVENESS_INTERVAL', '60')),
+    # Concurrent queries the orders window is split into by hash of SALES_ORDER_NUMBER; keep
+    # snowflake_pool_size at least this large
+    'extract_partitions': int(os.getenv('APP_EXTRACT_PARTITIONS', '1')),
+    # Record every orders extract under this directory as an Arrow IPC ('arrow') or Parquet snapshot with
+    # a manifest, for replay with main.py --replay; empty disables recording (needs pyarrow)
+    'snapshot_dir': os.getenv('APP_SNAPSHOT_DIR', ''),
+    'snapshot_format': os.getenv('APP_SNAPSHOT_FORMAT', 'arrow'),
+    # Newest snapshots kept in snapshot_dir; 0 keeps all
+    'snapshot_keep': int(os.getenv('APP_SNAPSHOT_KEEP', '10')),
+    # Resolve existing Sales Orders and items with chunked IN (...) queries instead of one query per record
+    'bulk_lookup': os.getenv('APP_BULK_LOOKUP', 'true').lower() == 'true',
+    # Read the current values of the updated fields with the bulk lookups and send only fields that differ;
+    # numbers closer than diff_float_tolerance count as equal
+    'diff_updates': os.getenv('APP_DIFF_UPDATES', 'true').lower() == 'true',
+    'diff_float_tolerance': float(os.getenv('APP_DIFF_FLOAT_TOLERANCE', '0.005')),
+    # Max characters of one IN (...) value list; keeps the URL-encoded GET query under Salesforce's URI limit
+    'soql_in_max_length': int(os.getenv('APP_SOQL_IN_MAX_LENGTH', '4000')),
+    # 'record' writes one REST call per record; 'batch' flushes writes through sObject Collections;
+    # 'bulk' upserts orders and items with Bulk API 2.0 (for large backfills)
+    'write_mode': os.getenv('APP_WRITE_MODE', 'batch'),
+    # Plan one cycle's changes and print them with an API-call estimate instead of writing anything
+    'dry_run': os.getenv('APP_DRY_RUN', 'false').lower() == 'true',
+    'collection_batch_size': int(os.getenv('APP_COLLECTION_BATCH_SIZE', '200')),
+    'bulk_item_external_id': os.getenv('APP_BULK_ITEM_EXTERNAL_ID', 'Sales_Order_Item_Key__c'),
+    'bulk_retry_dir': os.getenv('APP_BULK_RETRY_DIR', 'bulk_retry'),
+    'bulk_max_attempts': int(os.getenv('APP_BULK_MAX_ATTEMPTS', '3')),
+    'bulk_poll_interval': int(os.getenv('APP_BULK_POLL_INTERVAL', '5')),
+    # Skip orders and items whose mapped payload is unchanged since the last successful sync
+    'skip_unchanged': os.getenv('APP_SKIP_UNCHANGED', 'true').lower() == 'true',
+    'sync_state_path': os.getenv('APP_SYNC_STATE_PATH', 'sync_state.db'),
+    # Sync state records not written for this many days are dropped each cycle; 0 keeps them forever
+    'sync_state_retention_days': int(os.getenv('APP_SYNC_STATE_RETENTION_DAYS', '30')),
+    # Keep the Account index in the sync state and refresh it by SystemModstamp instead of reloading it every cycle
+    'account_cache': os.getenv('APP_ACCOUNT_CACHE', 'true').lower() == 'true',
+    'account_full_refresh_hours': float(os.getenv('APP_ACCOUNT_FULL_REFRESH_HOURS', '24')),
+    # Threads processing orders concurrently in 'record' write mode; 1 processes them one at a time
+    'workers': int(os.getenv('APP_WORKERS', '1')),
+    # Fractions of the daily API budget left at which requests are slowed down, then refused until it recovers
+    'api_throttle_threshold': float(os.getenv('APP_API_THROTTLE_THRESHOLD', '0.2')),
+    'api_pause_threshold': float(os.getenv('APP_API_PAUSE_THRESHOLD', '0.05')),
+    'api_throttle_delay': float(os.getenv('APP_API_THROTTLE_DELAY', '1.0')),
+    # Cap on Salesforce requests per second across all workers; 0 means no cap
+    'api_max_requests_per_second': float(os.getenv('APP_API_MAX_REQUESTS_PER_SECOND', '0')),
+    # 'live' talks to Salesforce, 'fake' to the in-memory server in fake_salesforce.py (offline runs and benchmarks)
+    'salesforce_backend': os.getenv('APP_SALESFORCE_BACKEND', 'live'),
+    'fake_sf_latency_ms': float(os.getenv('APP_FAKE_SF_LATENCY_MS', '0')),
+    'fake_sf_error_rate': float(os.getenv('APP_FAKE_SF_ERROR_RATE', '0')),
+    'fake_sf_lock_error_rate': float(os.getenv('APP_FAKE_SF_LOCK_ERROR_RATE', '0')),
+    'fake_sf_daily_api_limit': int(os.getenv('APP_FAKE_SF_DAILY_API_LIMIT', '100000')),
+    'fake_sf_page_size': int(os.getenv('APP_FAKE_SF_PAGE_SIZE', '2000')),
+    # 'live' reads Snowflake, 'fake' a SQLite file of synthetic view rows (see fake_snowflake.py)
+    'snowflake_backend': os.getenv('APP_SNOWFLAKE_BACKEND', 'live'),
+    'fake_snowflake_path': os.getenv('APP_FAKE_SNOWFLAKE_PATH', 'fake_snowflake.db'),
+    # Scale of the synthetic rows generated into an empty fake Snowflake database
+    'synthetic_orders_per_day': int(os.getenv('APP_SYNTHETIC_ORDERS_PER_DAY', '200')),
+    'synthetic_items_per_order': int(os.getenv('APP_SYNTHETIC_ITEMS_PER_ORDER', '8')),
+    'synthetic_posted_ratio': float(os.getenv('APP_SYNTHETIC_POSTED_RATIO', '0.7')),
+    'synthetic_null_rate': float(os.getenv('APP_SYNTHETIC_NULL_RATE', '0.02')),
+    # Port of the OpenMetrics endpoint (/metrics); 0 disables it
+    'metrics_port': int(os.getenv('APP_METRICS_PORT', '0')),
+    'metrics_host': os.getenv('APP_METRICS_HOST', '127.0.0.1'),
+    # JSON Lines file receiving one metrics summary per cycle; empty disables it
+    'metrics_summary_path': os.getenv('APP_METRICS_SUMMARY_PATH', 'cycle_metrics.jsonl'),
+    # Profile cycle 1 and every Nth cycle after it with cProfile; 0 disables profiling
+    'profile_every': int(os.getenv('APP_PROFILE_EVERY', '0')),
+    'profile_dir': os.getenv('APP_PROFILE_DIR', 'profiles'),
+    # Also trace memory with tracemalloc in profiled cycles, reporting the peak per phase
+    'profile_memory': os.getenv('APP_PROFILE_MEMORY', 'true').lower() == 'true',
 }
@@ -0,0 +1,338 @@
+# salesforce_snowflake_sync/fake_salesforce.py
+
+import collections
+import datetime
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import requests
+from config import APP_CONFIG
+
+API_VERSION_PATH = re.compile(r'^/services/data/v[\d.]+/')
+ID_PREFIXES = {'Account': '001', 'Sales_Order__c': 'a01', 'Sales_Order_Item__c': 'a02'}
+LOGIN_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns="urn:partner.soap.sforce.com">
+<soapenv:Body><loginResponse><result>
+<serverUrl>https://fake.my.salesforce.com/services/Soap/u/59.0/00DFAKE</serverUrl>
+<sessionId>00DFAKE!session</sessionId>
+</result></loginResponse></soapenv:Body></soapenv:Envelope>"""
+
+SOQL_PATTERN = re.compile(
+    r'^\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<object>\w+)'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>.+?))?(?:\s+LIMIT\s+(?P<limit>\d+))?\s*$',
+    re.IGNORECASE | re.DOTALL)
+CONDITION_PATTERN = re.compile(
+    r"\s*(?P<field>\w+)\s*(?:(?P<null>IS\s+(?:NOT\s+)?NULL)"
+    r"|(?P<op>NOT\s+IN|IN|!=|>=|<=|=|>|<)\s*(?P<value>\((?:'(?:[^'\\]|\\.)*'|[^)'])*\)|'(?:[^'\\]|\\.)*'|[^\s)]+))"
+    r"\s*(?:AND\s+|$)",
+    re.IGNORECASE | re.DOTALL)
+STRING_PATTERN = re.compile(r"'((?:[^'\\]|\\.)*)'")
+LIST_ITEM_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|[^,\s]+")
+DATETIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+
+def soql_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+class FakeSalesforceServer:
+    """In-memory stand-in for the Salesforce REST endpoints this project uses.
+
+    Covers SOAP login, query/queryAll with queryMore paging, sObject create/update/delete,
+    sObject Collections and limits. Records live in dicts per object. Every response carries
+    'Sforce-Limit-Info: api-usage=<used>/<daily_api_limit>'; past the limit requests get
+    REQUEST_LIMIT_EXCEEDED. latency_ms delays each request, error_rate fails that share of requests
+    with a connection error, and lock_error_rate fails that share of collection records with
+    UNABLE_TO_LOCK_ROW. Bulk API 2.0 is not implemented.
+    """
+
+    def __init__(self, latency_ms=None, error_rate=None, lock_error_rate=None, daily_api_limit=None, page_size=None,
+                 seed=None):
+        self.latency_ms = APP_CONFIG['fake_sf_latency_ms'] if latency_ms is None else latency_ms
+        self.error_rate = APP_CONFIG['fake_sf_error_rate'] if error_rate is None else error_rate
+        self.lock_error_rate = APP_CONFIG['fake_sf_lock_error_rate'] if lock_error_rate is None else lock_error_rate
+        self.daily_api_limit = APP_CONFIG['fake_sf_daily_api_limit'] if daily_api_limit is None else daily_api_limit
+        self.page_size = page_size or APP_CONFIG['fake_sf_page_size']
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Drop all records, cursors and counters"""
+        with self.lock:
+            self.objects = collections.defaultdict(dict)
+            self.cursors = {}
+            self.ids = itertools.count(1)
+            self.api_used = 0
+            self.calls = collections.Counter()
+
+    def adapter(self):
+        return FakeSalesforceAdapter(self)
+
+    def insert(self, object_name, fields):
+        """Add a record directly, without a request; returns its Id"""
+        with self.lock:
+            record_id = f"{ID_PREFIXES.get(object_name, 'a0Z')}{next(self.ids):015d}"
+            now = soql_now()
+            self.objects[object_name][record_id] = dict(fields, Id=record_id, IsDeleted=False, CreatedDate=now,
+                                                        LastModifiedDate=now, SystemModstamp=now)
+            return record_id
+
+    def records(self, object_name, include_deleted=False):
+        return [record for record in self.objects[object_name].values() if include_deleted or not record['IsDeleted']]
+
+    # Request handling
+
+    def handle(self, request):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise requests.exceptions.ConnectionError("Fake Salesforce: simulated connection failure", request=request)
+
+        url = urllib.parse.urlsplit(request.url)
+        if url.path.startswith('/services/Soap/u/'):
+            self.calls['login'] += 1
+            return self.response(request, 200, LOGIN_RESPONSE.encode('utf-8'), content_type='text/xml')
+
+        with self.lock:
+            self.api_used += 1
+            if self.api_used > self.daily_api_limit:
+                return self.json_response(request, 403, [{'errorCode': 'REQUEST_LIMIT_EXCEEDED',
+                                                          'message': 'TotalRequests Limit exceeded.'}])
+        path = API_VERSION_PATH.sub('', url.path).strip('/')
+        params = urllib.parse.parse_qs(url.query)
+        body = self.request_json(request)
+        try:
+            return self.route(request, request.method, path.split('/'), params, body)
+        except SoqlError as e:
+            return self.json_response(request, 400, [{'errorCode': 'MALFORMED_QUERY', 'message': str(e)}])
+        except KeyError as e:
+            return self.json_response(request, 404, [{'errorCode': 'NOT_FOUND', 'message': f"Not found: {e}"}])
+
+    def route(self, request, method, parts, params, body):
+        if parts[0] in ('query', 'queryAll') and method == 'GET':
+            include_deleted = parts[0] == 'queryAll'
+            if len(parts) > 1:
+                self.calls['query_more'] += 1
+                return self.json_response(request, 200, self.query_more(parts[1]))
+            self.calls['query'] += 1
+            return self.json_response(request, 200, self.query(params['q'][0], include_deleted))
+        if parts == ['limits'] and method == 'GET':
+            self.calls['limits'] += 1
+            remaining = max(self.daily_api_limit - self.api_used, 0)
+            return self.json_response(request, 200, {'DailyApiRequests': {'Max': self.daily_api_limit,
+                                                                          'Remaining': remaining}})
+        if parts[0] == 'sobjects' and len(parts) == 2 and method == 'POST':
+            self.calls['create'] += 1
+            record_id = self.insert(parts[1], body)
+            return self.json_response(request, 201, {'id': record_id, 'success': True, 'errors': []})
+        if parts[0] == 'sobjects' and len(parts) == 3:
+            record = self.objects[parts[1]][parts[2]]
+            if method == 'GET':
+                self.calls['retrieve'] += 1
+                return self.json_response(request, 200, record)
+            if method == 'PATCH':
+                self.calls['update'] += 1
+                self.update(record, body)
+                return self.response(request, 204, b'')
+            if method == 'DELETE':
+                self.calls['delete'] += 1
+                record['IsDeleted'] = True
+                return self.response(request, 204, b'')
+        if parts == ['composite', 'sobjects']:
+            self.calls[f"collection_{method.lower()}"] += 1
+            if method == 'DELETE':
+                ids = params['ids'][0].split(',')
+                return self.json_response(request, 200, [self.collection_delete(record_id) for record_id in ids])
+            return self.json_response(request, 200, [self.collection_write(method, record)
+                                                     for record in body['records']])
+        return self.json_response(request, 404, [{'errorCode': 'NOT_FOUND',
+                                                  'message': f"Fake Salesforce has no {method} /{'/'.join(parts)}"}])
+
+    def update(self, record, fields):
+        with self.lock:
+            record.update({name: value for name, value in fields.items() if name not in ('Id', 'attributes')})
+            record['LastModifiedDate'] = record['SystemModstamp'] = soql_now()
+
+    def collection_write(self, method, record):
+        if self.lock_error_rate and self.random.random() < self.lock_error_rate:
+            return {'success': False, 'errors': [{'statusCode': 'UNABLE_TO_LOCK_ROW',
+                                                  'message': 'unable to obtain exclusive access to this record'}]}
+        record = dict(record)
+        object_name = record.pop('attributes')['type']
+        if method == 'POST':
+            return {'id': self.insert(object_name, record), 'success': True, 'errors': []}
+        existing = self.objects[object_name].get(record.get('Id'))
+        if existing is None:
+            return {'id': record.get('Id'), 'success': False,
+                    'errors': [{'statusCode': 'ENTITY_IS_DELETED', 'message': 'entity is deleted'}]}
+        self.update(existing, record)
+        return {'id': existing['Id'], 'success': True, 'errors': []}
+
+    def collection_delete(self, record_id):
+        for records in self.objects.values():
+            if record_id in records and not records[record_id]['IsDeleted']:
+                records[record_id]['IsDeleted'] = True
+                return {'id': record_id, 'success': True, 'errors': []}
+        return {'id': record_id, 'success': False,
+                'errors': [{'statusCode': 'ENTITY_IS_DELETED', 'message': 'entity is deleted'}]}
+
+    # SOQL
+
+    def query(self, soql, include_deleted):
+        match = SOQL_PATTERN.match(soql)
+        if not match:
+            raise SoqlError(f"Unsupported query: {soql}")
+        fields = [field.strip() for field in match.group('fields').split(',')]
+        conditions = parse_conditions(match.group('where') or '')
+        with self.lock:
+            records = [record for record in self.records(match.group('object'), include_deleted)
+                       if all(condition(record) for condition in conditions)]
+        if match.group('order'):
+            for term in reversed([term.split() for term in match.group('order').split(',')]):
+                # Like SOQL, text sorts case-insensitively
+                records.sort(key=lambda record: (record.get(term[0]) is None, comparable(record.get(term[0])) or ''),
+                             reverse=len(term) > 1 and term[1].upper() == 'DESC')
+        if match.group('limit'):
+            records = records[:int(match.group('limit'))]
+        rows = [dict({'attributes': {'type': match.group('object')}},
+                     **{field: record.get(field) for field in fields}) for record in records]
+        return self.page(rows)
+
+    def query_more(self, cursor):
+        with self.lock:
+            rows = self.cursors.pop(cursor)
+        return self.page(rows)
+
+    def page(self, rows):
+        result = {'totalSize': len(rows), 'done': len(rows) <= self.page_size, 'records': rows[:self.page_size]}
+        if not result['done']:
+            cursor = f"01gFAKE{next(self.ids):012d}"
+            with self.lock:
+                self.cursors[cursor] = rows[self.page_size:]
+            result['nextRecordsUrl'] = f"/services/data/v59.0/query/{cursor}"
+        return result
+
+    # HTTP helpers
+
+    @staticmethod
+    def request_json(request):
+        if not request.body:
+            return None
+        body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+        return json.loads(body)
+
+    def json_response(self, request, status, payload):
+        return self.response(request, status, json.dumps(payload).encode('utf-8'))
+
+    def response(self, request, status, content, content_type='application/json'):
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response.headers['Content-Type'] = content_type
+        response.headers['Sforce-Limit-Info'] = f"api-usage={min(self.api_used, self.daily_api_limit)}/{self.daily_api_limit}"
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        response.reason = requests.status_codes._codes.get(status, ('',))[0].upper()
+        return response
+
+
+class SoqlError(Exception):
+    pass
+
+
+def parse_conditions(where):
+    """Turn 'A = 'x' AND B IN ('y', 'z') AND C IS NOT NULL' into record predicates (AND only)"""
+    conditions = []
+    position = 0
+    while position < len(where):
+        match = CONDITION_PATTERN.match(where, position)
+        if not match or match.end() == position:
+            raise SoqlError(f"Unsupported WHERE clause: {where}")
+        conditions.append(build_condition(match))
+        position = match.end()
+    return conditions
+
+
+def parse_literal(token):
+    token = token.strip()
+    string = STRING_PATTERN.fullmatch(token)
+    if string:
+        return re.sub(r'\\(.)', r'\1', string.group(1))
+    if token.upper() in ('TRUE', 'FALSE'):
+        return token.upper() == 'TRUE'
+    if token.upper() == 'NULL':
+        return None
+    if DATETIME_PATTERN.match(token):
+        return token
+    try:
+        return float(token)
+    except ValueError:
+        raise SoqlError(f"Unsupported literal: {token}")
+
+
+def comparable(value):
+    # SOQL compares strings case-insensitively and datetimes by instant
+    if isinstance(value, str):
+        if DATETIME_PATTERN.match(value):
+            return value[:19]
+        return value.lower()
+    return value
+
+
+def build_condition(match):
+    field = match.group('field')
+    if match.group('null'):
+        is_null = 'NOT' not in match.group('null').upper()
+        return lambda record: (record.get(field) is None) == is_null
+
+    op = ' '.join(match.group('op').upper().split())
+    value = match.group('value')
+    if op in ('IN', 'NOT IN'):
+        values = {comparable(parse_literal(literal)) for literal in LIST_ITEM_PATTERN.findall(value[1:-1])}
+        if op == 'IN':
+            return lambda record: comparable(record.get(field)) in values
+        return lambda record: comparable(record.get(field)) not in values
+
+    literal = comparable(parse_literal(value))
+    compare = {
+        '=': lambda a: a == literal,
+        '!=': lambda a: a != literal,
+        '>': lambda a: a is not None and a > literal,
+        '>=': lambda a: a is not None and a >= literal,
+        '<': lambda a: a is not None and a < literal,
+        '<=': lambda a: a is not None and a <= literal,
+    }[op]
+    return lambda record: compare(comparable(record.get(field)))
+
+
+class FakeSalesforceAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter answering every request from a FakeSalesforceServer"""
+
+    def __init__(self, server):
+        super().__init__()
+        self.server = server
+
+    def send(self, request, **kwargs):
+        return self.server.handle(request)
+
+    def close(self):
+        pass
+
+
+default_server_instance = None
+default_server_lock = threading.Lock()
+
+
+def default_server():
+    """The process-wide fake used when APP_SALESFORCE_BACKEND=fake"""
+    global default_server_instance
+    with default_server_lock:
+        if default_server_instance is None:
+            default_server_instance = FakeSalesforceServer()
+        return default_server_instance
@@ -0,0 +1,209 @@
+# salesforce_snowflake_sync/fake_snowflake.py
+
+import datetime
+import hashlib
+import itertools
+import logging
+import re
+import sqlite3
+from decimal import Decimal
+from config import APP_CONFIG
+from synthetic_orders import VIEW_COLUMNS, SyntheticOrderGenerator
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+TABLE = 'VW_SALES_ORDER_INVOICING_SUMMARY'
+DECIMAL_COLUMNS = {'GROSS_SALES', 'NET_SALES', 'QTY_ORDERED', 'QTY_SHIPPED', 'UNIT_PRICE', 'DISCOUNT', 'DEDUCTION'}
+DATE_COLUMNS = {'SALES_ORDER_DATE', 'POSTING_DATE'}
+TIMESTAMP_COLUMNS = {'LAST_MODIFIED_DATE', 'WATERMARK_VALUE'}
+
+# Snowflake-only syntax used by SnowflakeClient and its SQLite equivalent
+TRANSLATIONS = [
+    (re.compile(r'\bSALESFORCE_INTEGRATION\.'), ''),
+    (re.compile(r'\b(\w+)::FLOAT\b'), r'CAST(\1 AS REAL)'),
+    (re.compile(r'\bARRAY_AGG\('), 'json_group_array('),
+    (re.compile(r'\bOBJECT_CONSTRUCT_KEEP_NULL\('), 'json_object('),
+]
+
+
+def translate(query):
+    for pattern, replacement in TRANSLATIONS:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def to_sqlite(value):
+    # Decimals are stored as text so they come back exactly
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def converter(name):
+    """Turn stored text back into what the connector returns for the column: Decimal, date or datetime"""
+    if name in DECIMAL_COLUMNS:
+        return lambda value: Decimal(value) if isinstance(value, str) else value
+    if name in DATE_COLUMNS:
+        return lambda value: datetime.date.fromisoformat(value) if isinstance(value, str) else value
+    if name in TIMESTAMP_COLUMNS:
+        return lambda value: datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+    return None
+
+
+def snowflake_hash(*values):
+    """Stand-in for Snowflake's HASH(): a stable signed 64-bit integer (not the same values)"""
+    text = str(values[0]) if len(values) == 1 else repr(values)
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class MinBy:
+    """Snowflake's MIN_BY(value, key) aggregate: the value of the row with the lowest non-null key"""
+
+    def __init__(self):
+        self.key = None
+        self.value = None
+
+    def step(self, value, key):
+        if key is not None and (self.key is None or key < self.key):
+            self.key = key
+            self.value = value
+
+    def finalize(self):
+        return self.value
+
+
+class FakeSnowflakeCursor:
+    """The part of the connector's cursor SnowflakeClient uses, over a sqlite3 cursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.description = None
+        self.converters = []
+
+    def execute(self, query, params=()):
+        self.cursor.execute(translate(query), params)
+        self.description = self.cursor.description
+        self.converters = [(i, convert) for i, convert in
+                           enumerate(converter(column[0].upper()) for column in self.description or ()) if convert]
+        return self
+
+    def convert(self, rows):
+        if not self.converters:
+            return rows
+        converted = []
+        for row in rows:
+            row = list(row)
+            for i, convert in self.converters:
+                row[i] = convert(row[i])
+            converted.append(tuple(row))
+        return converted
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        return self.convert([row])[0] if row is not None else None
+
+    def fetchmany(self, size=1):
+        return self.convert(self.cursor.fetchmany(size))
+
+    def fetchall(self):
+        return self.convert(self.cursor.fetchall())
+
+    def fetch_arrow_batches(self, batch_size=None):
+        """Yield pyarrow Tables; Decimals become decimal128 and dates date32, as with the connector"""
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for fetch_arrow_batches")
+        names = [column[0] for column in self.description]
+        while True:
+            rows = self.fetchmany(batch_size or APP_CONFIG['fetch_batch_size'])
+            if not rows:
+                return
+            yield pyarrow.table({name: list(values) for name, values in zip(names, zip(*rows))})
+
+    def close(self):
+        self.cursor.close()
+
+
+class FakeSnowflakeConnection:
+    """Stand-in for a snowflake.connector connection, backed by a SQLite file"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.create_function('HASH', -1, snowflake_hash, deterministic=True)
+        self.db.create_aggregate('MIN_BY', 2, MinBy)
+        self.db.create_function('MOD', 2, lambda a, b: None if a is None or b is None else a % b, deterministic=True)
+        self.closed = False
+
+    def cursor(self):
+        return FakeSnowflakeCursor(self.db.cursor())
+
+    def is_closed(self):
+        return self.closed
+
+    def is_valid(self):
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+        self.db.close()
+
+
+def create_table(db):
+    # Everything is TEXT: NUMERIC affinity would turn '12.30' into the float 12.3
+    columns = ', '.join(f"{name} TEXT" for name in VIEW_COLUMNS)
+    db.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} ({columns})")
+    for column in ('SALES_ORDER_NUMBER', 'SALES_ORDER_DATE', 'POSTING_DATE', 'LAST_MODIFIED_DATE'):
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_{column.lower()} ON {TABLE} ({column})")
+
+
+def load_rows(db, rows, batch_size=10000):
+    """Insert VIEW_COLUMNS tuples in batches; returns the number of rows"""
+    create_table(db)
+    insert = f"INSERT INTO {TABLE} ({', '.join(VIEW_COLUMNS)}) VALUES ({', '.join('?' * len(VIEW_COLUMNS))})"
+    total = 0
+    rows = iter(rows)
+    while True:
+        batch = [tuple(to_sqlite(value) for value in row) for row in itertools.islice(rows, batch_size)]
+        if not batch:
+            break
+        db.executemany(insert, batch)
+        total += len(batch)
+    db.commit()
+    return total
+
+
+def populate(path, generator):
+    """Replace the view's rows in the SQLite file with the generator's"""
+    db = sqlite3.connect(path)
+    try:
+        db.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        return load_rows(db, generator.generate_rows())
+    finally:
+        db.close()
+
+
+def connect(path=None, **kwargs):
+    """Drop-in for snowflake.connector.connect; credentials are ignored.
+
+    An empty database is filled from SyntheticOrderGenerator with the APP_SYNTHETIC_* settings.
+    """
+    path = path or APP_CONFIG['fake_snowflake_path']
+    conn = FakeSnowflakeConnection(path)
+    create_table(conn.db)
+    if conn.db.execute(f"SELECT 1 FROM {TABLE} LIMIT 1").fetchone() is None:
+        generator = SyntheticOrderGenerator(orders_per_day=APP_CONFIG['synthetic_orders_per_day'],
+                                            items_per_order=APP_CONFIG['synthetic_items_per_order'],
+                                            posted_ratio=APP_CONFIG['synthetic_posted_ratio'],
+                                            null_rate=APP_CONFIG['synthetic_null_rate'])
+        rows = load_rows(conn.db, generator.generate_rows())
+        logger.info(f"Loaded {rows} synthetic rows into the fake Snowflake database {path}.")
+    return conn
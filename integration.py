@@ -1,198 +1,836 @@
 # salesforce_snowflake_sync/integration.py
 
+import dataclasses
 import logging
+import threading
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from config import APP_CONFIG
 from utils import Utils
+from bulk_loader import BulkLoader
+from sync_state import SyncStateStore
+from api_governor import ApiLimitReached
+from retry import CircuitOpenError, retry_budget, resilience_state
+from metrics import metrics
+from change_set import Change, ChangeSet, ChangeSetExecutor
+import profiling
 
 logger = logging.getLogger('sf_snowflake_integration')
+# Per-order and per-item messages; see APP_RECORD_LOG_LEVEL / APP_RECORD_LOG_SAMPLE
+record_logger = logging.getLogger('sf_snowflake_integration.records')
 
 class SalesforceSnowflakeIntegration:
-    def __init__(self, snowflake_client, salesforce_client):
+    BULK_ORDER_FIELDS = [
+        'Name', 'Sales_Order_Number__c', 'Account_Name__c', 'Sales_Order_Date__c', 'Posting_Date__c',
+        'Invoice_Number__c', 'Order_Type__c', 'Customer_Purchase_Order_Number__c', 'Account_ID__c', 'Order_Status__c'
+    ]
+    BULK_ITEM_FIELDS = [
+        'Product_Code__c', 'Product_Description__c', 'Quantity_Ordered__c', 'Quantity_Shipped__c', 'Unit_Price__c',
+        'Discount_Dollars__c', 'Deduction_Dollars__c', 'LOP_Order_Comments__c', 'Name'
+    ]
+    # Items reference their parent through the order's external Id instead of its record Id
+    BULK_ITEM_PARENT_REFERENCE = 'Sales_Order_Number__r.Sales_Order_Number__c'
+    # Fields of the update payloads, read along with the bulk lookups when APP_DIFF_UPDATES is on
+    ORDER_UPDATE_FIELDS = ['Posting_Date__c', 'Order_Status__c', 'Customer_Purchase_Order_Number__c']
+    ITEM_UPDATE_FIELDS = ['Quantity_Shipped__c', 'Unit_Price__c', 'Discount_Dollars__c', 'Deduction_Dollars__c',
+                          'LOP_Order_Comments__c']
+
+    def __init__(self, snowflake_client, salesforce_client, sync_state=None):
         self.snowflake_client = snowflake_client
         self.salesforce_client = salesforce_client
+        self.sync_state = sync_state
         self.utils = Utils()
+        self.pending_hashes = {}
+        self.synced_records = {}
+        self.failed_records = set()
+        self.state_lock = threading.Lock()
 
-    def process_orders(self, orders_dict):
-        total_orders_processed = 0
-        total_items_processed = 0
-        total_orders_updated = 0
-        total_items_updated = 0
+    def prefetch_existing_orders(self, orders_dict):
+        with metrics.phase('bulk_lookup'):
+            self._prefetch_existing_orders(orders_dict)
+
+    def _prefetch_existing_orders(self, orders_dict):
+        invoice_numbers = set()
+        order_numbers = set()
+        for order_number, order_data in orders_dict.items():
+            invoice_number = order_data.invoice_number
+            if invoice_number:
+                invoice_numbers.add(invoice_number)
+            elif order_number:
+                order_numbers.add(order_number)
+        diff_updates = APP_CONFIG['diff_updates']
+        self.salesforce_client.prefetch_sales_orders(invoice_numbers, order_numbers,
+                                                     self.ORDER_UPDATE_FIELDS if diff_updates else ())
+
+        parent_ids = (set(self.salesforce_client.sales_orders_by_invoice.values()) |
+                      set(self.salesforce_client.sales_orders_by_number.values()))
+        self.salesforce_client.prefetch_sales_order_items(parent_ids, self.ITEM_UPDATE_FIELDS if diff_updates else ())
+
+    def build_account_payload(self, customer_name, customer_number, ar_division_number):
+        return {
+            'Name': customer_name,
+            'Region__c': 'None',
+            'Customer_Type__c': 'Warehouse Distributor',
+            'Description': 'Script-created',
+            'AR_Div_Number__c': ar_division_number,
+            'LOP_Customer_Number__c': customer_number
+        }
+
+    def build_order_create_payload(self, order_number, order_data, account_id):
+        posting_date = order_data.posting_date
+        return {
+            'Name': f"{order_data.customer_name.strip()} - {order_number}",
+            'Sales_Order_Number__c': order_number,
+            'Account_Name__c': account_id,
+            'Sales_Order_Date__c': order_data.sales_order_date,
+            'Posting_Date__c': posting_date,
+            'Invoice_Number__c': order_data.invoice_number,
+            'Order_Type__c': 'Performance',
+            'Customer_Purchase_Order_Number__c': order_data.customer_po_number,
+            'Account_ID__c': order_data.customer_number.strip(),
+            'Order_Status__c': "Closed" if posting_date else "Open"
+        }
+
+    def build_order_update_payload(self, order_data, current=None):
+        posting_date = order_data.posting_date
+        return self.changed_fields({
+            'Posting_Date__c': posting_date,
+            'Order_Status__c': "Closed" if posting_date else "Open",
+            'Customer_Purchase_Order_Number__c': order_data.customer_po_number
+        }, current)
+
+    def build_item_create_payload(self, item, sales_order_id):
+        return {
+            'Product_Code__c': item.item_code,
+            'Product_Description__c': item.item_code_desc,
+            'Quantity_Ordered__c': self.utils.to_float_if_decimal(item.qty_ordered),
+            'Quantity_Shipped__c': self.utils.to_float_if_decimal(item.qty_shipped),
+            'Unit_Price__c': self.utils.to_float_if_decimal(item.unit_price),
+            'Discount_Dollars__c': self.utils.to_float_if_decimal(item.discount),
+            'Deduction_Dollars__c': self.utils.to_float_if_decimal(item.deduction),
+            'LOP_Order_Comments__c': item.invoice_detail_comment,
+            'Sales_Order_Number__c': sales_order_id,
+            'Name': 'TempName'
+        }
+
+    def build_item_update_payload(self, item, current=None):
+        return self.changed_fields({
+            'Quantity_Shipped__c': self.utils.to_float_if_decimal(item.qty_shipped),
+            'Unit_Price__c': self.utils.to_float_if_decimal(item.unit_price),
+            'Discount_Dollars__c': self.utils.to_float_if_decimal(item.discount),
+            'Deduction_Dollars__c': self.utils.to_float_if_decimal(item.deduction),
+            'LOP_Order_Comments__c': item.invoice_detail_comment
+        }, current)
+
+    def changed_fields(self, payload, current):
+        """The fields of an update payload whose value differs from the record's current Salesforce values
+        (dates by day, numbers within diff_float_tolerance); the whole payload when current is None"""
+        if current is None:
+            return payload
+        tolerance = APP_CONFIG['diff_float_tolerance']
+        return {name: value for name, value in payload.items()
+                if not self.utils.same_value(current.get(name), value, tolerance)}
+
+    def item_state_key(self, order_number, product_code):
+        return f"{order_number}|{self.salesforce_client.lookup_key(product_code)}"
+
+    def skip_unchanged_orders(self, orders_dict):
+        """Drop orders and items whose mapped payload hash matches the sync state.
+
+        An order is dropped when its header and all of its items are unchanged. Otherwise only
+        its changed items are kept, and the header is sent again with them.
+        """
+        items_by_order = {}
+        for order_number, order_data in orders_dict.items():
+            items_by_code = {}
+            for item in order_data.items:
+                if order_number and item.item_code:
+                    items_by_code.setdefault(self.item_state_key(order_number, item.item_code), []).append(item)
+            items_by_order[order_number] = items_by_code
+        # Only the hashes of this chunk's records are read, so a streamed cycle never rescans the whole state
+        order_hashes = self.sync_state.load_hashes('order', [order_number for order_number in orders_dict if order_number])
+        item_hashes = self.sync_state.load_hashes('item', [key for items_by_code in items_by_order.values()
+                                                           for key in items_by_code])
+        self.pending_hashes = {}
+        changed_orders = {}
+        skipped_orders = 0
+        skipped_items = 0
 
         for order_number, order_data in orders_dict.items():
             if not order_number:
-                logger.warning("Order with empty SALES_ORDER_NUMBER, skipping.")
+                changed_orders[order_number] = order_data
                 continue
 
-            invoice_number = order_data.get('INVOICE_NUMBER', '')
-            posting_date = order_data.get('POSTING_DATE', None)
+            items_by_code = items_by_order[order_number]
 
-            # Process both open and posted orders
-            if not posting_date:
-                logger.info(f"Processing open order {order_number} (no posting date yet)")
+            changed_keys = set()
+            for item_key, items in items_by_code.items():
+                # Rows repeating a product code end up in one Salesforce record, so they are hashed together
+                item_hash = SyncStateStore.payload_hash([self.build_item_create_payload(item, None) for item in items])
+                if item_hashes.get(item_key) == item_hash:
+                    skipped_items += len(items)
+                    continue
+                self.pending_hashes[('item', item_key)] = item_hash
+                changed_keys.add(item_key)
 
-            customer_name = order_data.get('CUSTOMER_NAME', '').strip()
-            customer_number = order_data.get('CUSTOMER_NUMBER', '').strip()
-            ar_division_number = order_data.get('AR_DIVISION_NUMBER', '')
+            order_hash = SyncStateStore.payload_hash(self.build_order_create_payload(order_number, order_data, None))
+            if order_hashes.get(order_number) == order_hash and not changed_keys:
+                skipped_orders += 1
+                continue
+            self.pending_hashes[('order', order_number)] = order_hash
 
-            if not customer_number or not ar_division_number:
-                logger.warning(f"Missing CUSTOMER_NUMBER or AR_DIVISION_NUMBER for order {order_number}, skipping.")
+            changed_items = [item for item in order_data.items
+                             if not item.item_code
+                             or self.item_state_key(order_number, item.item_code) in changed_keys]
+            changed_orders[order_number] = dataclasses.replace(order_data, items=changed_items)
+
+        logger.info(f"Skipping {skipped_orders} unchanged orders and {skipped_items} unchanged items; "
+                    f"{len(changed_orders)} orders to process.")
+        return changed_orders
+
+    def mark_synced(self, kind, key, sf_id):
+        with self.state_lock:
+            if (kind, key) in self.pending_hashes:
+                self.synced_records[(kind, key)] = sf_id
+
+    def mark_failed(self, kind, key):
+        with self.state_lock:
+            self.failed_records.add((kind, key))
+
+    def save_sync_state(self):
+        records = [(kind, key, sf_id, self.pending_hashes[(kind, key)])
+                   for (kind, key), sf_id in self.synced_records.items()
+                   if (kind, key) not in self.failed_records]
+        self.sync_state.save(records)
+        self.pending_hashes = {}
+        self.synced_records = {}
+
+    def process_order_stream(self, orders):
+        """Process an iterable of (order_number, order_data) in chunks of stream_chunk_orders orders"""
+        chunk_size = APP_CONFIG['stream_chunk_orders']
+        totals = [0, 0, 0, 0]
+        chunk = {}
+
+        def flush():
+            self.salesforce_client.governor.check()
+            for i, count in enumerate(self.process_orders(chunk)):
+                totals[i] += count
+            chunk.clear()
+
+        for order_number, order_data in orders:
+            if order_number in chunk:
+                chunk[order_number].items.extend(order_data.items)
                 continue
+            if len(chunk) >= chunk_size:
+                flush()
+            chunk[order_number] = order_data
+        if chunk:
+            flush()
+        return tuple(totals)
 
-            account_id, existing_account_name = self.salesforce_client.find_account_by_customer_data(customer_number, ar_division_number)
-
-            if not account_id:
-                account_id, existing_account_name = self.salesforce_client.check_existing_account_in_salesforce(customer_number, ar_division_number)
-
-            if not account_id:
-                new_account_data = {
-                    'Name': customer_name,
-                    'Region__c': 'None',
-                    'Customer_Type__c': 'Warehouse Distributor',
-                    'Description': 'Script-created',
-                    'AR_Div_Number__c': ar_division_number,
-                    'LOP_Customer_Number__c': customer_number
-                }
-                account_id = self.salesforce_client.safely_create_salesforce('Account', new_account_data)
-                if account_id:
-                    logger.info(f"Created new Account Name='{customer_name}', ID={account_id}")
-                    key = f"{customer_number.strip()}|{ar_division_number.strip()}"
-                    self.salesforce_client.accounts_by_lop[key] = {
-                        'Id': account_id,
-                        'Name': customer_name
-                    }
-                else:
-                    logger.error(f"Failed to create Account for {customer_name}, skipping order {order_number}")
-                    continue
+    def process_orders(self, orders_dict):
+        if not isinstance(orders_dict, dict):
+            return self.process_order_stream(orders_dict)
+
+        if APP_CONFIG['dry_run']:
+            return self.dry_run_orders(orders_dict)
+
+        write_mode = APP_CONFIG['write_mode']
+        if write_mode == 'bulk':
+            # Bulk jobs report failures per file, not per record, so they bypass the sync state
+            return self.process_orders_bulk(orders_dict)
+
+        if self.sync_state is None:
+            return self.process_orders_batched(orders_dict) if write_mode == 'batch' else self.process_orders_per_record(orders_dict)
+
+        with metrics.phase('skip_unchanged'):
+            orders_dict = self.skip_unchanged_orders(orders_dict)
+        try:
+            if write_mode == 'batch':
+                return self.process_orders_batched(orders_dict)
+            return self.process_orders_per_record(orders_dict)
+        finally:
+            with metrics.phase('save_sync_state'):
+                self.save_sync_state()
+
+    def process_orders_per_record(self, orders_dict):
+        bulk_lookup = APP_CONFIG['bulk_lookup']
+        if bulk_lookup:
+            self.prefetch_existing_orders(orders_dict)
+
+        with metrics.phase('write_records'):
+            if APP_CONFIG['workers'] > 1:
+                totals = self.process_orders_concurrently(orders_dict, bulk_lookup)
             else:
-                logger.info(f"Using existing Account {account_id} (Name='{existing_account_name}')")
+                totals = [0, 0, 0, 0]
+                for order_number, order_data in orders_dict.items():
+                    for i, count in enumerate(self.process_single_order(order_number, order_data, bulk_lookup)):
+                        totals[i] += count
+        total_orders_processed, total_items_processed, total_orders_updated, total_items_updated = totals
+
+        logger.info(
+            f"Processing completed: {total_orders_processed} new orders, {total_orders_updated} updated orders, "
+            f"{total_items_processed} new items, and {total_items_updated} updated items."
+        )
+        return total_orders_processed, total_items_processed, total_orders_updated, total_items_updated
+
+    def process_orders_concurrently(self, orders_dict, bulk_lookup):
+        """Process orders on a pool of APP_CONFIG['workers'] threads.
+
+        Orders of one CUSTOMER_NUMBER|AR_DIVISION_NUMBER key run in sequence on a single worker, so an
+        Account is never created twice and each account's orders keep their input order.
+        """
+        orders_by_account = {}
+        for order_number, order_data in orders_dict.items():
+            key = f"{(order_data.customer_number or '').strip()}|{(order_data.ar_division_number or '').strip()}"
+            orders_by_account.setdefault(key, []).append((order_number, order_data))
+
+        def process_group(orders):
+            counts = [0, 0, 0, 0]
+            for order_number, order_data in orders:
+                for i, count in enumerate(self.process_single_order(order_number, order_data, bulk_lookup)):
+                    counts[i] += count
+            return counts
+
+        workers = APP_CONFIG['workers']
+        logger.info(f"Processing {len(orders_dict)} orders for {len(orders_by_account)} accounts on {workers} workers")
+        totals = [0, 0, 0, 0]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='order-worker') as executor:
+            for counts in executor.map(process_group, orders_by_account.values()):
+                for i, count in enumerate(counts):
+                    totals[i] += count
+        return totals
+
+    def process_single_order(self, order_number, order_data, bulk_lookup):
+        """Sync one order and its items. Returns (created orders, created items, updated orders, updated items)."""
+        counts = [0, 0, 0, 0]
+        self.salesforce_client.governor.check()
+        if not order_number:
+            record_logger.warning("Order with empty SALES_ORDER_NUMBER, skipping.")
+            return counts
+
+        invoice_number = order_data.invoice_number
+        posting_date = order_data.posting_date
 
-            sales_order_date = order_data.get('SALES_ORDER_DATE', None)
-            customer_po_number = order_data.get('CUSTOMER_PO_NUMBER', '')
+        # Process both open and posted orders
+        if not posting_date:
+            record_logger.info("Processing open order %s (no posting date yet)", order_number)
 
+        customer_name = order_data.customer_name.strip()
+        customer_number = order_data.customer_number.strip()
+        ar_division_number = order_data.ar_division_number
+
+        if not customer_number or not ar_division_number:
+            record_logger.warning("Missing CUSTOMER_NUMBER or AR_DIVISION_NUMBER for order %s, skipping.", order_number)
+            return counts
+
+        account_id, existing_account_name = self.salesforce_client.find_account_by_customer_data(customer_number, ar_division_number)
+
+        if not account_id:
+            account_id, existing_account_name = self.salesforce_client.check_existing_account_in_salesforce(customer_number, ar_division_number)
+
+        if not account_id:
+            new_account_data = self.build_account_payload(customer_name, customer_number, ar_division_number)
+            account_id = self.salesforce_client.safely_create_salesforce('Account', new_account_data)
+            if account_id:
+                record_logger.info("Created new Account Name='%s', ID=%s", customer_name, account_id,
+                                   extra={'sobject': 'Account', 'record_id': account_id})
+                key = f"{customer_number.strip()}|{ar_division_number.strip()}"
+                self.salesforce_client.register_account(key, account_id, customer_name)
+            else:
+                record_logger.error("Failed to create Account for %s, skipping order %s", customer_name, order_number,
+                                    extra={'sobject': 'Account', 'order_number': order_number})
+                self.mark_failed('order', order_number)
+                return counts
+        else:
+            record_logger.info("Using existing Account %s (Name='%s')", account_id, existing_account_name)
+
+        if bulk_lookup:
+            existing_order_id = self.salesforce_client.find_sales_order(invoice_number, order_number)
+        else:
             existing_order_id = self.salesforce_client.check_existing_sales_order_by_invoice(invoice_number, order_number)
 
-            if not existing_order_id:
-                # Create new order
-                order_type = "posted" if posting_date else "open"
-                logger.info(f"Creating new {order_type} order {order_number} (Invoice: {invoice_number or 'None'})")
-                so_data = {
-                    'Name': f"{customer_name} - {order_number}",
-                    'Sales_Order_Number__c': order_number,
-                    'Account_Name__c': account_id,
-                    'Sales_Order_Date__c': sales_order_date,
-                    'Posting_Date__c': posting_date,
-                    'Invoice_Number__c': invoice_number,
-                    'Order_Type__c': 'Performance',
-                    'Customer_Purchase_Order_Number__c': customer_po_number,
-                    'Account_ID__c': customer_number,
-                    'Order_Status__c': "Closed" if posting_date else "Open"
-                }
-                sales_order_id = self.salesforce_client.safely_create_salesforce('Sales_Order__c', so_data)
-                if not sales_order_id:
-                    logger.error(f"Failed to create Sales_Order__c for invoice {invoice_number}, skipping items.")
-                    continue
-                logger.info(f"Created new Sales Order {sales_order_id} (Invoice: {invoice_number}, Number: {order_number})")
-                total_orders_processed += 1
+        if not existing_order_id:
+            # Create new order
+            order_type = "posted" if posting_date else "open"
+            record_logger.info("Creating new %s order %s (Invoice: %s)", order_type, order_number, invoice_number or 'None')
+            so_data = self.build_order_create_payload(order_number, order_data, account_id)
+            sales_order_id = self.salesforce_client.safely_create_salesforce('Sales_Order__c', so_data)
+            if not sales_order_id:
+                record_logger.error("Failed to create Sales_Order__c for invoice %s, skipping items.", invoice_number,
+                                    extra={'sobject': 'Sales_Order__c', 'order_number': order_number})
+                self.mark_failed('order', order_number)
+                return counts
+            record_logger.info("Created new Sales Order %s (Invoice: %s, Number: %s)", sales_order_id, invoice_number,
+                               order_number, extra={'sobject': 'Sales_Order__c', 'order_number': order_number,
+                                                    'record_id': sales_order_id})
+            if bulk_lookup:
+                self.salesforce_client.register_sales_order(sales_order_id, invoice_number, order_number)
+            self.mark_synced('order', order_number, sales_order_id)
+            counts[0] += 1
+        else:
+            # Update existing order with current information
+            sales_order_id = existing_order_id
+            order_type = "posted" if posting_date else "open"
+            update_data = self.build_order_update_payload(
+                order_data, self.salesforce_client.current_values(existing_order_id))
+            if not update_data:
+                record_logger.info("Existing %s order %s is already up to date in Salesforce", order_type, order_number)
+                self.mark_synced('order', order_number, existing_order_id)
             else:
-                # Update existing order with current information
-                sales_order_id = existing_order_id
-                order_type = "posted" if posting_date else "open"
-                logger.info(f"Updating existing {order_type} order {order_number} (Invoice: {invoice_number or 'None'})")
-                update_data = {
-                    'Posting_Date__c': posting_date,
-                    'Order_Status__c': "Closed" if posting_date else "Open",
-                    'Customer_Purchase_Order_Number__c': customer_po_number
-                }
+                record_logger.info("Updating existing %s order %s (Invoice: %s)", order_type, order_number,
+                                   invoice_number or 'None')
                 result = self.salesforce_client.safely_update_salesforce('Sales_Order__c', existing_order_id, update_data)
                 if result is not None:
-                    logger.info(f"Updated existing Sales Order {existing_order_id} (Invoice: {invoice_number}, Number: {order_number})")
-                    total_orders_updated += 1
+                    record_logger.info("Updated existing Sales Order %s (Invoice: %s, Number: %s)", existing_order_id,
+                                       invoice_number, order_number,
+                                       extra={'sobject': 'Sales_Order__c', 'order_number': order_number,
+                                              'record_id': existing_order_id})
+                    self.salesforce_client.remember_values(existing_order_id, update_data)
+                    self.mark_synced('order', order_number, existing_order_id)
+                    counts[2] += 1
                 else:
-                    logger.error(f"Failed to update Sales Order {existing_order_id}")
+                    record_logger.error("Failed to update Sales Order %s", existing_order_id,
+                                        extra={'sobject': 'Sales_Order__c', 'order_number': order_number,
+                                               'record_id': existing_order_id})
+                    self.mark_failed('order', order_number)
+
+        items = order_data.items
+        if not items:
+            record_logger.info("No items for invoice %s", invoice_number)
+            return counts
 
-            items = order_data.get('ITEMS', [])
-            if not items:
-                logger.info(f"No items for invoice {invoice_number}")
+        record_logger.info("Processing %d items for invoice %s", len(items), invoice_number)
+        for item in items:
+            product_code = item.item_code
+            if not product_code:
+                record_logger.warning("Item with no PRODUCT_CODE for invoice %s, skipping.", invoice_number)
                 continue
 
-            logger.info(f"Processing {len(items)} items for invoice {invoice_number}")
-            for item in items:
-                product_code = item.get('ITEM_CODE', '')
-                if not product_code:
-                    logger.warning(f"Item with no PRODUCT_CODE for invoice {invoice_number}, skipping.")
+            if bulk_lookup:
+                existing_item_id = self.salesforce_client.find_sales_order_item(sales_order_id, product_code)
+            else:
+                existing_item_id = self.salesforce_client.check_existing_sales_order_item(sales_order_id, product_code)
+
+            if not existing_item_id:
+                # Create new item
+                new_item_data = self.build_item_create_payload(item, sales_order_id)
+                item_id = self.salesforce_client.safely_create_salesforce('Sales_Order_Item__c', new_item_data)
+                if item_id:
+                    record_logger.info("Created new item %s (Product: %s) for invoice %s", item_id, product_code,
+                                       invoice_number, extra={'sobject': 'Sales_Order_Item__c', 'order_number': order_number,
+                                                              'record_id': item_id})
+                    if bulk_lookup:
+                        self.salesforce_client.register_sales_order_item(item_id, sales_order_id, product_code)
+                    self.mark_synced('item', self.item_state_key(order_number, product_code), item_id)
+                    counts[1] += 1
+                else:
+                    record_logger.error("Failed to create item %s for invoice %s", product_code, invoice_number,
+                                        extra={'sobject': 'Sales_Order_Item__c', 'order_number': order_number})
+                    self.mark_failed('item', self.item_state_key(order_number, product_code))
+            else:
+                # Update existing item with current information
+                update_item_data = self.build_item_update_payload(
+                    item, self.salesforce_client.current_values(existing_item_id))
+                if not update_item_data:
+                    record_logger.info("Existing item %s (Product: %s) is already up to date", existing_item_id, product_code)
+                    self.mark_synced('item', self.item_state_key(order_number, product_code), existing_item_id)
                     continue
+                result = self.salesforce_client.safely_update_salesforce('Sales_Order_Item__c', existing_item_id, update_item_data)
+                if result is not None:
+                    record_logger.info("Updated existing item %s (Product: %s) for invoice %s", existing_item_id, product_code,
+                                       invoice_number, extra={'sobject': 'Sales_Order_Item__c', 'order_number': order_number,
+                                                              'record_id': existing_item_id})
+                    self.salesforce_client.remember_values(existing_item_id, update_item_data)
+                    self.mark_synced('item', self.item_state_key(order_number, product_code), existing_item_id)
+                    counts[3] += 1
+                else:
+                    record_logger.error("Failed to update item %s (Product: %s)", existing_item_id, product_code,
+                                        extra={'sobject': 'Sales_Order_Item__c', 'order_number': order_number,
+                                               'record_id': existing_item_id})
+                    self.mark_failed('item', self.item_state_key(order_number, product_code))
+        return counts
 
-                existing_item_id = self.salesforce_client.check_existing_sales_order_item(sales_order_id, product_code)
+    def resolve_accounts_batched(self, orders_dict):
+        """Validate orders and resolve their Account Ids, creating missing Accounts in one batch.
 
-                if not existing_item_id:
-                    # Create new item
-                    new_item_data = {
-                        'Product_Code__c': product_code,
-                        'Product_Description__c': item.get('ITEM_CODE_DESC', ''),
-                        'Quantity_Ordered__c': self.utils.to_float_if_decimal(item.get('QTY_ORDERED', 0)),
-                        'Quantity_Shipped__c': self.utils.to_float_if_decimal(item.get('QTY_SHIPPED', 0)),
-                        'Unit_Price__c': self.utils.to_float_if_decimal(item.get('UNIT_PRICE', 0.0)),
-                        'Discount_Dollars__c': self.utils.to_float_if_decimal(item.get('DISCOUNT', 0.0)),
-                        'Deduction_Dollars__c': self.utils.to_float_if_decimal(item.get('DEDUCTION', 0.0)),
-                        'LOP_Order_Comments__c': item.get('INVOICE_DETAIL_COMMENT', ''),
-                        'Sales_Order_Number__c': sales_order_id,
-                        'Name': 'TempName'
-                    }
-
-                    item_id = self.salesforce_client.safely_create_salesforce('Sales_Order_Item__c', new_item_data)
-                    if item_id:
-                        logger.info(f"Created new item {item_id} (Product: {product_code}) for invoice {invoice_number}")
-                        total_items_processed += 1
-                    else:
-                        logger.error(f"Failed to create item {product_code} for invoice {invoice_number}")
+        Returns (order_number, order_data, account_id) for every order that has an Account.
+        """
+        sf = self.salesforce_client
+        orders = []
+        new_accounts = {}
+        for order_number, order_data in orders_dict.items():
+            if not order_number:
+                record_logger.warning("Order with empty SALES_ORDER_NUMBER, skipping.")
+                continue
+
+            customer_name = order_data.customer_name.strip()
+            customer_number = order_data.customer_number.strip()
+            ar_division_number = order_data.ar_division_number
+
+            if not customer_number or not ar_division_number:
+                record_logger.warning("Missing CUSTOMER_NUMBER or AR_DIVISION_NUMBER for order %s, skipping.", order_number)
+                continue
+
+            key = f"{customer_number}|{ar_division_number.strip()}"
+            if key not in new_accounts:
+                account_id, _ = sf.find_account_by_customer_data(customer_number, ar_division_number)
+                if not account_id:
+                    account_id, _ = sf.check_existing_account_in_salesforce(customer_number, ar_division_number)
+                if not account_id:
+                    new_accounts[key] = self.build_account_payload(customer_name, customer_number, ar_division_number)
+            orders.append((order_number, order_data, key))
+
+        if new_accounts:
+            keys = list(new_accounts)
+            account_ids = sf.safely_create_salesforce_batch('Account', [new_accounts[key] for key in keys])
+            for key, account_id in zip(keys, account_ids):
+                if account_id:
+                    record_logger.info("Created new Account Name='%s', ID=%s", new_accounts[key]['Name'], account_id,
+                                       extra={'sobject': 'Account', 'record_id': account_id})
+                    sf.register_account(key, account_id, new_accounts[key]['Name'])
                 else:
-                    # Update existing item with current information
-                    update_item_data = {
-                        'Quantity_Shipped__c': self.utils.to_float_if_decimal(item.get('QTY_SHIPPED', 0)),
-                        'Unit_Price__c': self.utils.to_float_if_decimal(item.get('UNIT_PRICE', 0.0)),
-                        'Discount_Dollars__c': self.utils.to_float_if_decimal(item.get('DISCOUNT', 0.0)),
-                        'Deduction_Dollars__c': self.utils.to_float_if_decimal(item.get('DEDUCTION', 0.0)),
-                        'LOP_Order_Comments__c': item.get('INVOICE_DETAIL_COMMENT', '')
-                    }
-                    result = self.salesforce_client.safely_update_salesforce('Sales_Order_Item__c', existing_item_id, update_item_data)
-                    if result is not None:
-                        logger.info(f"Updated existing item {existing_item_id} (Product: {product_code}) for invoice {invoice_number}")
-                        total_items_updated += 1
-                    else:
-                        logger.error(f"Failed to update item {existing_item_id} (Product: {product_code})")
+                    record_logger.error("Failed to create Account for %s", new_accounts[key]['Name'], extra={'sobject': 'Account'})
+
+        resolved = []
+        for order_number, order_data, key in orders:
+            account = sf.accounts_by_lop.get(key)
+            if not account:
+                record_logger.error("No Account for %s, skipping order %s", order_data.customer_name.strip(), order_number)
+                self.mark_failed('order', order_number)
+                continue
+            resolved.append((order_number, order_data, account['Id']))
+        return resolved
+
+    def plan_changes(self, orders_dict):
+        """Turn orders into a ChangeSet of Account, Sales Order and item creates and updates.
+
+        Existing records are resolved from the lookups; records still to be created are referenced
+        symbolically ('Account:<customer>|<division>', 'Sales_Order__c:<order number>'), so an order
+        can point to an Account and an item to a Sales Order that only the executor will create.
+        """
+        sf = self.salesforce_client
+        change_set = ChangeSet()
+        account_ids = {}
+        for order_number, order_data in orders_dict.items():
+            if not order_number:
+                record_logger.warning("Order with empty SALES_ORDER_NUMBER, skipping.")
+                continue
+
+            customer_name = order_data.customer_name.strip()
+            customer_number = order_data.customer_number.strip()
+            ar_division_number = order_data.ar_division_number
+
+            if not customer_number or not ar_division_number:
+                record_logger.warning("Missing CUSTOMER_NUMBER or AR_DIVISION_NUMBER for order %s, skipping.", order_number)
+                continue
+
+            key = f"{customer_number}|{ar_division_number.strip()}"
+            account_ref = f"Account:{key}"
+            if key not in account_ids:
+                account_id, _ = sf.find_account_by_customer_data(customer_number, ar_division_number)
+                if not account_id:
+                    account_id, _ = sf.check_existing_account_in_salesforce(customer_number, ar_division_number)
+                if not account_id:
+                    change_set.add(Change('Account', account_ref, 'create', key=key,
+                                          payload=self.build_account_payload(customer_name, customer_number,
+                                                                             ar_division_number)))
+                account_ids[key] = account_id
+            account_id = account_ids[key]
+
+            order_ref = f"Sales_Order__c:{order_number}"
+            existing_order_id = sf.find_sales_order(order_data.invoice_number, order_number)
+            if existing_order_id:
+                # Like the other write modes, an order is not touched when its new Account could not be created
+                change_set.add(Change('Sales_Order__c', order_ref, 'update', self.build_order_update_payload(order_data),
+                                      key=order_number, record_id=existing_order_id,
+                                      requires=[] if account_id else [account_ref]))
+            else:
+                change_set.add(Change('Sales_Order__c', order_ref, 'create',
+                                      self.build_order_create_payload(order_number, order_data, account_id),
+                                      key=order_number, references={} if account_id else {'Account_Name__c': account_ref}))
+            self.plan_item_changes(change_set, order_number, order_data, existing_order_id, order_ref,
+                                   requires=[] if account_id else [account_ref])
+
+        # Updates are diffed only now, once the rows folded into each of them are merged
+        unchanged = 0
+        for object_name in ('Sales_Order__c', 'Sales_Order_Item__c'):
+            for change in change_set.changes[object_name]:
+                if change.action == 'update':
+                    change.payload = self.changed_fields(change.payload, sf.current_values(change.record_id))
+                    if not change.payload:
+                        change.status = 'unchanged'
+                        unchanged += 1
+        logger.info(f"Planned {len(change_set) - unchanged} changes for {len(orders_dict)} orders; "
+                    f"{unchanged} existing records are already up to date.")
+        return change_set
+
+    def plan_item_changes(self, change_set, order_number, order_data, existing_order_id, order_ref, requires=()):
+        # A product code repeated within one order is folded into a single change, which leaves the
+        # record in the same state as the create-then-update sequence of the record write mode.
+        # requires holds the order's Account ref while it is still to be created: like the order, its
+        # items are not touched when that create fails
+        sf = self.salesforce_client
+        for item in order_data.items:
+            product_code = item.item_code
+            if not product_code:
+                record_logger.warning("Item with no PRODUCT_CODE for invoice %s, skipping.", order_data.invoice_number)
+                continue
+
+            state_key = self.item_state_key(order_number, product_code)
+            existing_item_id = sf.find_sales_order_item(existing_order_id, product_code) if existing_order_id else None
+            if existing_item_id:
+                ref = f"Sales_Order_Item__c:{existing_item_id}"
+            else:
+                ref = f"Sales_Order_Item__c:{existing_order_id or order_ref}|{sf.lookup_key(product_code)}"
+            change = change_set.get(ref)
+            if change is not None:
+                change.payload.update(self.build_item_update_payload(item))
+                change.rows += 1
+            elif existing_item_id:
+                change_set.add(Change('Sales_Order_Item__c', ref, 'update', self.build_item_update_payload(item),
+                                      key=state_key, record_id=existing_item_id, requires=list(requires)))
+            else:
+                change_set.add(Change('Sales_Order_Item__c', ref, 'create',
+                                      self.build_item_create_payload(item, existing_order_id), key=state_key,
+                                      references={} if existing_order_id else {'Sales_Order_Number__c': order_ref},
+                                      requires=list(requires)))
+
+    def book_change_results(self, change_set):
+        """Register created records in the lookup indexes and the sync state after a change set ran.
+        Returns (created orders, created items, updated orders, updated items)."""
+        sf = self.salesforce_client
+        for change in change_set.changes['Account']:
+            if change.status == 'done':
+                record_logger.info("Created new Account Name='%s', ID=%s", change.payload['Name'], change.record_id,
+                                   extra={'sobject': 'Account', 'record_id': change.record_id})
+                sf.register_account(change.key, change.record_id, change.payload['Name'])
+            else:
+                record_logger.error("Failed to create Account for %s", change.payload['Name'], extra={'sobject': 'Account'})
+
+        total_orders_processed = 0
+        total_orders_updated = 0
+        for change in change_set.changes['Sales_Order__c']:
+            order_number = change.key
+            if change.status == 'unchanged':
+                self.mark_synced('order', order_number, change.record_id)
+                continue
+            if change.status == 'done':
+                if change.action == 'create':
+                    sf.register_sales_order(change.record_id, change.payload['Invoice_Number__c'], order_number)
+                    total_orders_processed += 1
+                else:
+                    sf.remember_values(change.record_id, change.payload)
+                    total_orders_updated += 1
+                self.mark_synced('order', order_number, change.record_id)
+                continue
+            if change.status == 'skipped':
+                record_logger.error("No Account for order %s, skipping it.", order_number,
+                                    extra={'sobject': 'Sales_Order__c', 'order_number': order_number})
+            elif change.action == 'create':
+                record_logger.error("Failed to create Sales_Order__c for order %s, skipping items.", order_number,
+                                    extra={'sobject': 'Sales_Order__c', 'order_number': order_number})
+            else:
+                record_logger.error("Failed to update Sales Order %s", change.record_id,
+                                    extra={'sobject': 'Sales_Order__c', 'order_number': order_number,
+                                           'record_id': change.record_id})
+            self.mark_failed('order', order_number)
+
+        total_items_processed = 0
+        total_items_updated = 0
+        for change in change_set.changes['Sales_Order_Item__c']:
+            if change.status == 'unchanged':
+                self.mark_synced('item', change.key, change.record_id)
+                continue
+            if change.status == 'done':
+                if change.action == 'create':
+                    sf.register_sales_order_item(change.record_id, change.payload['Sales_Order_Number__c'],
+                                                 change.payload['Product_Code__c'])
+                    total_items_processed += 1
+                    total_items_updated += change.rows - 1
+                else:
+                    sf.remember_values(change.record_id, change.payload)
+                    total_items_updated += change.rows
+                self.mark_synced('item', change.key, change.record_id)
+                continue
+            if change.status == 'failed':
+                record_logger.error("Failed to %s item %s", change.action, change.record_id or change.key,
+                                    extra={'sobject': 'Sales_Order_Item__c', 'record_id': change.record_id})
+            self.mark_failed('item', change.key)
+        return total_orders_processed, total_items_processed, total_orders_updated, total_items_updated
+
+    def process_orders_batched(self, orders_dict):
+        """Plan the whole set of orders as a ChangeSet, then write it level by level through sObject Collections.
+
+        Accounts are written first, then Sales Orders, then items, because each level needs the Ids of the one before.
+        """
+        self.prefetch_existing_orders(orders_dict)
+        with metrics.phase('plan_changes'):
+            change_set = self.plan_changes(orders_dict)
+        ChangeSetExecutor(self.salesforce_client).execute(change_set)
+        totals = self.book_change_results(change_set)
+        total_orders_processed, total_items_processed, total_orders_updated, total_items_updated = totals
 
         logger.info(
             f"Processing completed: {total_orders_processed} new orders, {total_orders_updated} updated orders, "
             f"{total_items_processed} new items, and {total_items_updated} updated items."
         )
-        return total_orders_processed, total_items_processed, total_orders_updated, total_items_updated
+        return totals
+
+    def dry_run_orders(self, orders_dict):
+        """Plan the orders without writing anything and print the plan with its API-call estimate"""
+        if self.sync_state is not None:
+            with metrics.phase('skip_unchanged'):
+                orders_dict = self.skip_unchanged_orders(orders_dict)
+            self.pending_hashes = {}
+        self.prefetch_existing_orders(orders_dict)
+        with metrics.phase('plan_changes'):
+            change_set = self.plan_changes(orders_dict)
+        print(change_set.describe())
+        return 0, 0, 0, 0
+
+    def process_orders_bulk(self, orders_dict):
+        """Upsert Sales Orders and items with Bulk API 2.0, for backfills too large for the REST path.
+
+        Orders upsert on Sales_Order_Number__c and items on a '<order number>|<product code>' key in
+        bulk_item_external_id, so Salesforce decides create vs. update and no existence lookups are made.
+        Note that an upsert of an existing record writes the full create payload, not just the update fields.
+        """
+        loader = BulkLoader(self.salesforce_client)
+        item_key_field = APP_CONFIG['bulk_item_external_id']
+        with metrics.phase('resolve_accounts'):
+            orders = self.resolve_accounts_batched(orders_dict)
+
+        def order_rows():
+            for order_number, order_data, account_id in orders:
+                yield self.build_order_create_payload(order_number, order_data, account_id)
+
+        def item_rows():
+            for order_number, order_data, _ in orders:
+                rows = {}
+                for item in order_data.items:
+                    product_code = item.item_code
+                    if not product_code:
+                        record_logger.warning("Item with no PRODUCT_CODE for order %s, skipping.", order_number)
+                        continue
+                    item_key = f"{order_number}|{product_code.strip()}"
+                    dedupe_key = self.salesforce_client.lookup_key(item_key)
+                    if dedupe_key in rows:
+                        # Same final state as create-then-update in process_orders
+                        rows[dedupe_key].update(self.build_item_update_payload(item))
+                        continue
+                    row = self.build_item_create_payload(item, None)
+                    del row['Sales_Order_Number__c']
+                    row[self.BULK_ITEM_PARENT_REFERENCE] = order_number
+                    row[item_key_field] = item_key
+                    rows[dedupe_key] = row
+                yield from rows.values()
+
+        with metrics.phase('write_orders'):
+            retried_created, retried_updated, _ = loader.drain_retry_queue('Sales_Order__c', 'Sales_Order_Number__c')
+            orders_created, orders_updated, _ = loader.upsert_rows(
+                'Sales_Order__c', order_rows(), 'Sales_Order_Number__c', self.BULK_ORDER_FIELDS)
+        orders_created += retried_created
+        orders_updated += retried_updated
+
+        with metrics.phase('write_items'):
+            retried_created, retried_updated, _ = loader.drain_retry_queue('Sales_Order_Item__c', item_key_field)
+            items_created, items_updated, _ = loader.upsert_rows(
+                'Sales_Order_Item__c', item_rows(), item_key_field,
+                self.BULK_ITEM_FIELDS + [self.BULK_ITEM_PARENT_REFERENCE, item_key_field])
+        items_created += retried_created
+        items_updated += retried_updated
+
+        logger.info(
+            f"Processing completed: {orders_created} new orders, {orders_updated} updated orders, "
+            f"{items_created} new items, and {items_updated} updated items."
+        )
+        return orders_created, items_created, orders_updated, items_updated
 
     def run_integration_cycle(self):
+        metrics.start_cycle()
+        status = 'error'
+        totals = (0, 0, 0, 0)
         try:
             start_time = time.time()
-            self.salesforce_client.fetch_accounts()
-            orders_dict = self.snowflake_client.fetch_orders()
-            total_orders, total_items, total_orders_updated, total_items_updated = self.process_orders(orders_dict)
+            self.failed_records = set()
+            retry_budget.reset()
+            governor = self.salesforce_client.governor
+            if governor.paused:
+                self.salesforce_client.refresh_api_usage()
+                if governor.paused:
+                    logger.warning(f"Salesforce API budget below the pause threshold, skipping this cycle: {governor.usage()}")
+                    status = 'skipped'
+                    return totals
+            with metrics.phase('fetch_accounts'):
+                self.salesforce_client.fetch_accounts()
+            if self.sync_state is not None and APP_CONFIG['sync_state_retention_days'] > 0 and not APP_CONFIG['dry_run']:
+                self.sync_state.prune(APP_CONFIG['sync_state_retention_days'])
+            # A dry run prints one plan for the whole extract, so it does not stream
+            if APP_CONFIG['stream_orders'] and not APP_CONFIG['dry_run']:
+                # Extraction interleaves with processing; only the time spent producing orders counts as fetch_orders
+                orders = metrics.timed_iter('fetch_orders', self.snowflake_client.iter_orders())
+            else:
+                with metrics.phase('fetch_orders'):
+                    orders = self.snowflake_client.fetch_orders()
+            totals = self.process_orders(orders)
+            total_orders, total_items, total_orders_updated, total_items_updated = totals
+            if self.failed_records:
+                logger.warning(f"{len(self.failed_records)} records failed; the extraction watermark is not advanced.")
+                status = 'partial'
+            elif APP_CONFIG['dry_run']:
+                logger.info("Dry run: nothing was written and the extraction watermark is not advanced.")
+                status = 'dry_run'
+            else:
+                self.snowflake_client.commit_watermark()
+                status = 'ok'
             elapsed_time = time.time() - start_time
             logger.info(
                 f"Processing cycle completed in {elapsed_time:.2f} seconds. "
                 f"Created {total_orders} new orders, updated {total_orders_updated} existing orders, "
                 f"created {total_items} new items, and updated {total_items_updated} existing items. "
-                f"Filter: Sales Order Date OR Posting Date in last 7 days."
+                f"Load method: {APP_CONFIG['LOAD_METHOD']}. API usage: {self.salesforce_client.governor.usage()}. "
+                f"Resilience: {resilience_state()}.",
+                extra={'cycle_seconds': round(elapsed_time, 3), 'orders_created': total_orders,
+                       'orders_updated': total_orders_updated, 'items_created': total_items,
+                       'items_updated': total_items_updated}
             )
-            return total_orders, total_items, total_orders_updated, total_items_updated
+            return totals
+        except (ApiLimitReached, CircuitOpenError) as e:
+            logger.warning(f"Processing cycle stopped early: {e}")
+            status = 'stopped'
+            return 0, 0, 0, 0
         except Exception as e:
             logger.error(f"Error in processing cycle: {e}")
             return 0, 0, 0, 0
+        finally:
+            self.record_cycle_metrics(status, totals)
+
+    def record_cycle_metrics(self, status, totals):
+        try:
+            summary = metrics.finish_cycle(
+                status,
+                records=dict(zip(('orders_created', 'items_created', 'orders_updated', 'items_updated'), totals)),
+                failed_records=len(self.failed_records),
+                api_usage=self.salesforce_client.governor.usage(),
+                resilience=resilience_state())
+        except Exception as e:
+            logger.warning(f"Could not record cycle metrics: {e}")
+            return
+        logger.info("Cycle phases (seconds): %s", summary['phases'], extra={'phases': summary['phases']})
 
     def run(self):
         try:
             logger.info("Starting Salesforce-Snowflake integration service (CREATE/UPDATE MODE - Sales Order Date OR Posting Date in Last 7 Days)")
+            cycle_number = 0
             while True:
+                cycle_number += 1
                 try:
-                    self.run_integration_cycle()
+                    if profiling.should_profile(cycle_number):
+                        profiling.profile_cycle(self.run_integration_cycle, cycle_number)
+                    else:
+                        self.run_integration_cycle()
                     cycle_wait = APP_CONFIG.get('cycle_wait', 300)
                     logger.info(f"Waiting {cycle_wait} seconds for the next execution.")
                     time.sleep(cycle_wait)
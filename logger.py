@@ -1,27 +1,107 @@
 # salesforce_snowflake_sync/logger.py
 
+import atexit
+import datetime
+import itertools
+import json
 import logging
+import logging.handlers
+import queue
 from config import APP_CONFIG
 
+# Per-order and per-item messages go to this child logger, so they can get their own level and sampling
+RECORD_LOGGER = 'sf_snowflake_integration.records'
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread and message, plus the fields passed with extra="""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update((name, value) for name, value in vars(record).items() if name not in STANDARD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Lets through every Nth record below WARNING, and every warning and error"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or next(self.counter) % self.every == 0
+
+
+def stop_listener():
+    """Flush and stop the background log writer, if any"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
 def configure_logger():
     logger = logging.getLogger('sf_snowflake_integration')
     logger.setLevel(getattr(logging, APP_CONFIG['log_level'], logging.INFO))
 
     # Clear any existing handlers
+    stop_listener()
     if logger.handlers:
+        for handler in logger.handlers:
+            handler.close()
         logger.handlers.clear()
 
     # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    if APP_CONFIG['log_format'] == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-    # File handler
-    file_handler = logging.FileHandler(APP_CONFIG['log_file'])
+    # File handler, rotated by size when log_max_bytes is set
+    if APP_CONFIG['log_max_bytes'] > 0:
+        file_handler = logging.handlers.RotatingFileHandler(APP_CONFIG['log_file'], maxBytes=APP_CONFIG['log_max_bytes'],
+                                                            backupCount=APP_CONFIG['log_backup_count'])
+    else:
+        file_handler = logging.FileHandler(APP_CONFIG['log_file'])
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
-    return logger
\ No newline at end of file
+    if APP_CONFIG['log_async']:
+        # Callers only enqueue records; a listener thread formats and writes them
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        global listener
+        listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        listener.start()
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
+
+    record_logger = logging.getLogger(RECORD_LOGGER)
+    record_logger.setLevel(getattr(logging, APP_CONFIG['record_log_level'], logging.NOTSET))
+    record_logger.filters.clear()
+    if APP_CONFIG['record_log_sample'] > 1:
+        record_logger.addFilter(SampleFilter(APP_CONFIG['record_log_sample']))
+
+    return logger
+
+
+atexit.register(stop_listener)
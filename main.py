@@ -1,20 +1,56 @@
 # salesforce_snowflake_sync/__main__.py
 
-from config import SF_CONFIG, SNOWFLAKE_CONFIG
+import argparse
+from config import SF_CONFIG, SNOWFLAKE_CONFIG, APP_CONFIG
 from logger import configure_logger
 from snowflake_client import SnowflakeClient
 from salesforce_client import SalesforceClient
+from sync_state import SyncStateStore
 from integration import SalesforceSnowflakeIntegration
+from snapshots import SnapshotReplaySource
+from metrics import start_metrics_server
 
 logger = configure_logger()
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Salesforce-Snowflake integration service")
+    parser.add_argument('--full-resync', action='store_true',
+                        help="Clear the local sync state and watermark so every order in the window is sent again")
+    parser.add_argument('--profile-every', type=int, metavar='N',
+                        help="Profile the first cycle and every Nth one after it (overrides APP_PROFILE_EVERY)")
+    parser.add_argument('--profile-dir', help="Directory for cycle profiles (overrides APP_PROFILE_DIR)")
+    parser.add_argument('--replay', metavar='SNAPSHOT',
+                        help="Run one cycle on the orders of a recorded extract snapshot instead of querying Snowflake")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Run one cycle that only prints the planned changes and their API-call estimate")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile_every is not None:
+        APP_CONFIG['profile_every'] = args.profile_every
+    if args.profile_dir:
+        APP_CONFIG['profile_dir'] = args.profile_dir
+    if args.dry_run:
+        APP_CONFIG['dry_run'] = True
     try:
         logger.info("Starting Salesforce-Snowflake integration script (UPDATE MODE - Last 7 Days)...")
-        snowflake_client = SnowflakeClient(SNOWFLAKE_CONFIG)
-        salesforce_client = SalesforceClient(SF_CONFIG)
-        integration = SalesforceSnowflakeIntegration(snowflake_client, salesforce_client)
-        integration.run()
+        if APP_CONFIG['metrics_port']:
+            start_metrics_server(APP_CONFIG['metrics_port'])
+        sync_state = SyncStateStore(APP_CONFIG['sync_state_path'])
+        if args.full_resync:
+            sync_state.clear()
+        if args.replay:
+            snowflake_client = SnapshotReplaySource(args.replay)
+        else:
+            snowflake_client = SnowflakeClient(SNOWFLAKE_CONFIG, sync_state)
+        salesforce_client = SalesforceClient(SF_CONFIG, sync_state if APP_CONFIG['account_cache'] else None)
+        integration = SalesforceSnowflakeIntegration(snowflake_client, salesforce_client,
+                                                     sync_state if APP_CONFIG['skip_unchanged'] else None)
+        if args.replay or APP_CONFIG['dry_run']:
+            integration.run_integration_cycle()
+        else:
+            integration.run()
     except Exception as e:
         logger.critical(f"Critical error in main(): {e}")
         return 1
@@ -22,4 +58,4 @@ def main():
 
 if __name__ == "__main__":
     exit_code = main()
-    exit(exit_code)
\ No newline at end of file
+    exit(exit_code)
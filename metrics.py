@@ -0,0 +1,304 @@
+# salesforce_snowflake_sync/metrics.py
+
+import bisect
+import contextlib
+import datetime
+import http.server
+import json
+import logging
+import re
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from config import APP_CONFIG
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+PREFIX = 'sf_snowflake_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PHASE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0)
+# name -> (type, help, buckets)
+METRICS = {
+    'salesforce_requests': ('counter', "Salesforce HTTP requests by operation and sObject", None),
+    'salesforce_records': ('counter', "Records sent in Salesforce create/update/delete requests", None),
+    'salesforce_errors': ('counter', "Salesforce requests that failed or returned an error status", None),
+    'salesforce_request_seconds': ('histogram', "Salesforce request latency", LATENCY_BUCKETS),
+    'snowflake_call_seconds': ('histogram', "Snowflake connect and query execution latency", LATENCY_BUCKETS),
+    'retries': ('counter', "Retries by dependency and call", None),
+    'phase_seconds': ('histogram', "Time per cycle spent in each phase", PHASE_BUCKETS),
+    'cycles': ('counter', "Integration cycles by outcome", None),
+    'last_cycle_seconds': ('gauge', "Duration of the last integration cycle", None),
+}
+QUERY_OBJECT = re.compile(r'\bFROM\s+(\w+)', re.IGNORECASE)
+COLLECTION_TYPE = re.compile(rb'"attributes":\s*\{"type":\s*"(\w+)"')
+COLLECTION_OPERATIONS = {'POST': 'collection_create', 'PATCH': 'collection_update', 'DELETE': 'collection_delete'}
+RECORD_OPERATIONS = {'POST': 'create', 'PATCH': 'update', 'GET': 'retrieve', 'DELETE': 'delete'}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def salesforce_operation(request):
+    """(operation, sObject, records) of a prepared Salesforce request, read from its URL and body"""
+    url = urllib.parse.urlsplit(request.url)
+    path = url.path
+    if '/services/Soap/' in path:
+        return 'login', '', 0
+    if '/query/' in path or '/queryAll/' in path:
+        soql = urllib.parse.parse_qs(url.query).get('q')
+        if not soql:
+            return 'query_more', '', 0
+        match = QUERY_OBJECT.search(soql[0])
+        return 'query', match.group(1) if match else '', 0
+    if path.endswith('/composite/sobjects'):
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if request.method == 'DELETE':
+            ids = urllib.parse.parse_qs(url.query).get('ids', [''])[0]
+            return COLLECTION_OPERATIONS['DELETE'], '', len(ids.split(',')) if ids else 0
+        match = COLLECTION_TYPE.search(body)
+        return (COLLECTION_OPERATIONS.get(request.method, 'collection'), match.group(1).decode() if match else '',
+                body.count(b'"attributes"'))
+    if '/sobjects/' in path:
+        parts = path.split('/sobjects/', 1)[1].strip('/').split('/')
+        operation = RECORD_OPERATIONS.get(request.method, request.method.lower())
+        return operation, parts[0], 1 if operation in ('create', 'update', 'delete') else 0
+    if '/jobs/ingest' in path:
+        return 'bulk', '', 0
+    if path.rstrip('/').endswith('/limits'):
+        return 'limits', '', 0
+    return 'other', '', 0
+
+
+class Metrics:
+    """Counters, histograms and gauges for the whole process, plus per-cycle phase timings.
+
+    Exposed in OpenMetrics text format by render() (and the HTTP endpoint of start_metrics_server),
+    and summarized per cycle by cycle_summary(), which reports what changed since start_cycle().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.cycle_started = None
+        self.cycle_baseline = {}
+        self.phases = {}
+        # Set while a profiled cycle runs under tracemalloc; phases then also record their peak memory
+        self.trace_memory = False
+        self.phase_memory = {}
+
+    def key(self, name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        with self.lock:
+            self.values[self.key(name, labels)] = value
+
+    def observe(self, name, value, labels=None):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, labels=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Add the time spent in the block to the phase's total for this cycle"""
+        start = self.begin_phase()
+        try:
+            yield
+        finally:
+            self.end_phase(phase, start)
+
+    def begin_phase(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        return time.perf_counter()
+
+    def end_phase(self, phase, start):
+        self.add_phase_time(phase, time.perf_counter() - start)
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            with self.lock:
+                self.phase_memory[phase] = max(self.phase_memory.get(phase, 0), peak)
+
+    def add_phase_time(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def timed_iter(self, phase, iterable):
+        """Yield from iterable, counting only the time spent producing items towards the phase"""
+        iterator = iter(iterable)
+        while True:
+            start = self.begin_phase()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.end_phase(phase, start)
+                return
+            self.end_phase(phase, start)
+            yield item
+
+    def observe_salesforce_request(self, request, seconds, status=None):
+        """Count one Salesforce request; status is None when it raised before a response arrived"""
+        operation, sobject, records = salesforce_operation(request)
+        labels = {'operation': operation, 'sobject': sobject}
+        self.inc('salesforce_requests', labels)
+        if records:
+            self.inc('salesforce_records', labels, records)
+        if status is None or status >= 300:
+            self.inc('salesforce_errors', labels)
+        self.observe('salesforce_request_seconds', seconds, {'operation': operation})
+
+    def start_cycle(self):
+        with self.lock:
+            self.cycle_started = time.time()
+            self.phases = {}
+            self.phase_memory = {}
+            self.cycle_baseline = {key: self.snapshot_value(value) for key, value in self.values.items()}
+
+    @staticmethod
+    def snapshot_value(value):
+        if isinstance(value, Histogram):
+            return value.count, value.sum
+        return value
+
+    def finish_cycle(self, status, **details):
+        """Record the cycle's outcome and return its summary; it is appended to metrics_summary_path if set"""
+        duration = time.time() - self.cycle_started
+        for phase, seconds in self.phases.items():
+            self.observe('phase_seconds', seconds, {'phase': phase})
+        self.inc('cycles', {'status': status})
+        self.set('last_cycle_seconds', duration)
+        summary = self.cycle_summary(status, duration, details)
+        path = APP_CONFIG['metrics_summary_path']
+        if path:
+            try:
+                with open(path, 'a') as f:
+                    f.write(json.dumps(summary, default=str) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write cycle metrics to {path}: {e}")
+        return summary
+
+    def cycle_summary(self, status, duration, details):
+        counters = {}
+        latencies = {}
+        with self.lock:
+            for (name, labels), value in self.values.items():
+                kind = METRICS[name][0]
+                if kind == 'gauge' or name == 'phase_seconds':
+                    continue
+                label = ','.join(f"{k}={v}" for k, v in labels if v)
+                before = self.cycle_baseline.get((name, labels))
+                if kind == 'histogram':
+                    count, total = value.count - (before or (0, 0))[0], value.sum - (before or (0, 0))[1]
+                    if count:
+                        latencies.setdefault(name, {})[label] = {'count': count, 'seconds': round(total, 3),
+                                                                 'mean': round(total / count, 4)}
+                elif value - (before or 0):
+                    counters.setdefault(name, {})[label] = value - (before or 0)
+            phases = {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+            phase_memory = {phase: round(peak / 1e6, 1) for phase, peak in self.phase_memory.items()}
+        summary = {
+            'started': datetime.datetime.fromtimestamp(self.cycle_started, datetime.timezone.utc).isoformat(),
+            'status': status,
+            'duration_seconds': round(duration, 3),
+            'phases': phases,
+            'counters': counters,
+            'latency': latencies,
+        }
+        if phase_memory:
+            summary['phase_peak_memory_mb'] = phase_memory
+        return dict(summary, **details)
+
+    def render(self):
+        """All metrics in OpenMetrics text exposition format"""
+        with self.lock:
+            by_name = {}
+            for (name, labels), value in self.values.items():
+                by_name.setdefault(name, []).append((labels, value))
+            lines = []
+            for name, samples in sorted(by_name.items()):
+                kind, help_text, buckets = METRICS[name]
+                full_name = PREFIX + name
+                lines.append(f"# TYPE {full_name} {kind}")
+                lines.append(f"# HELP {full_name} {help_text}")
+                for labels, value in sorted(samples, key=lambda sample: sample[0]):
+                    if kind == 'counter':
+                        lines.append(f"{full_name}_total{format_labels(labels)} {value}")
+                    elif kind == 'gauge':
+                        lines.append(f"{full_name}{format_labels(labels)} {value}")
+                    else:
+                        cumulative = 0
+                        for bound, count in zip(buckets + (float('inf'),), value.counts):
+                            cumulative += count
+                            le = '+Inf' if bound == float('inf') else repr(float(bound))
+                            lines.append(f"{full_name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                        lines.append(f"{full_name}_sum{format_labels(labels)} {value.sum}")
+                        lines.append(f"{full_name}_count{format_labels(labels)} {value.count}")
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{name}="{escape_label(value)}"' for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host=None):
+    """Serve /metrics on a daemon thread; returns the server"""
+    server = http.server.ThreadingHTTPServer((host or APP_CONFIG['metrics_host'], port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving OpenMetrics on http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,70 @@
+# salesforce_snowflake_sync/profiling.py
+
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import tracemalloc
+from config import APP_CONFIG
+from metrics import metrics
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+
+def should_profile(cycle_number):
+    """True for cycles 1, N+1, 2N+1, ... when profile_every is N; never when it is 0"""
+    every = APP_CONFIG['profile_every']
+    return every > 0 and (cycle_number - 1) % every == 0
+
+
+def profile_cycle(func, cycle_number, output_dir=None, trace_memory=None):
+    """Run func() under cProfile and return its result.
+
+    Writes cycle_<n>_<timestamp>.pstats (load with pstats, snakeviz, or flameprof/gprof2dot for a
+    flame graph) and a .txt with the top functions by cumulative time. With trace_memory the cycle
+    also runs under tracemalloc and each metrics phase records its peak memory, which ends up in
+    the cycle's metrics summary. cProfile sees only the calling thread, so with APP_WORKERS > 1
+    the per-record writes of the worker threads show up as time waiting on the pool.
+    """
+    output_dir = output_dir or APP_CONFIG['profile_dir']
+    trace_memory = APP_CONFIG['profile_memory'] if trace_memory is None else trace_memory
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"cycle_{cycle_number:05d}_{datetime.datetime.now():%Y%m%dT%H%M%S}")
+
+    if trace_memory:
+        tracemalloc.start()
+        metrics.trace_memory = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+    finally:
+        peak = None
+        if trace_memory:
+            metrics.trace_memory = False
+            peak = max([tracemalloc.get_traced_memory()[1]] + list(metrics.phase_memory.values()))
+            tracemalloc.stop()
+        write_profile(profiler, base, peak)
+
+
+def write_profile(profiler, base, peak_memory=None):
+    try:
+        profiler.dump_stats(f"{base}.pstats")
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        with open(f"{base}.txt", 'w') as f:
+            if peak_memory is not None:
+                f.write(f"Peak traced memory: {peak_memory / 1e6:.1f} MB\n")
+                for phase, peak in sorted(metrics.phase_memory.items()):
+                    f.write(f"  {phase}: {peak / 1e6:.1f} MB\n")
+            f.write(report.getvalue())
+    except OSError as e:
+        logger.warning(f"Could not write cycle profile {base}: {e}")
+        return
+    memory = f", peak memory {peak_memory / 1e6:.1f} MB" if peak_memory is not None else ''
+    logger.info(f"Cycle profile written to {base}.pstats{memory}.")
@@ -0,0 +1,56 @@
+# salesforce_snowflake_sync/records.py
+
+import sys
+from dataclasses import dataclass, field
+
+
+def intern_value(value):
+    """Intern strings that repeat across many rows so all copies share one object"""
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(slots=True)
+class LineItem:
+    """One line item of an order; fields follow SnowflakeClient.ITEM_COLUMNS"""
+    item_code: str | None
+    item_code_desc: str | None
+    qty_ordered: float | None
+    qty_shipped: float | None
+    unit_price: float | None
+    discount: float | None
+    deduction: float | None
+    invoice_detail_comment: str | None
+
+    @classmethod
+    def from_values(cls, values):
+        """Build from values in ITEM_COLUMNS order, interning the product code and description"""
+        (item_code, item_code_desc, qty_ordered, qty_shipped, unit_price, discount, deduction,
+         invoice_detail_comment) = values
+        return cls(intern_value(item_code), intern_value(item_code_desc), qty_ordered, qty_shipped, unit_price,
+                   discount, deduction, intern_value(invoice_detail_comment))
+
+
+@dataclass(slots=True)
+class Order:
+    """An order header with its line items; fields follow SnowflakeClient.ORDER_COLUMNS"""
+    sales_order_number: str
+    customer_name: str | None
+    customer_account: str | None
+    customer_po_number: str | None
+    customer_number: str | None
+    ar_division_number: str | None
+    sales_order_date: str | None
+    posting_date: str | None
+    invoice_number: str | None
+    gross_sales: float | None
+    net_sales: float | None
+    items: list = field(default_factory=list)
+
+    @classmethod
+    def from_values(cls, sales_order_number, values):
+        """Build from header values in ORDER_COLUMNS order, interning customer, division and date strings"""
+        (customer_name, customer_account, customer_po_number, customer_number, ar_division_number, sales_order_date,
+         posting_date, invoice_number, gross_sales, net_sales) = values
+        return cls(sales_order_number, intern_value(customer_name), intern_value(customer_account), customer_po_number,
+                   intern_value(customer_number), intern_value(ar_division_number), intern_value(sales_order_date),
+                   intern_value(posting_date), invoice_number, gross_sales, net_sales)
@@ -1,29 +1,195 @@
 # salesforce_snowflake_sync/retry.py
 
+import email.utils
 import functools
+import random
+import threading
 import time
 import logging
 from config import APP_CONFIG
+from metrics import metrics
 
 logger = logging.getLogger('sf_snowflake_integration')
 
-def retry(max_retries, wait_time, retry_exceptions):
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+
+class RetryBudget:
+    """Retries allowed per integration cycle, shared by every call so one outage cannot stall a whole cycle"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def consume(self):
+        with self.lock:
+            if self.limit and self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def reset(self):
+        with self.lock:
+            self.used = 0
+
+    def state(self):
+        return {'limit': self.limit, 'used': self.used}
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and fails fast for reset_timeout seconds,
+    then lets one trial call through (half-open) to decide whether to close again."""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through; returns True when it is the half-open trial"""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return False
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+        raise CircuitOpenError(f"Circuit breaker '{self.name}' is open after {self.failures} consecutive failures")
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit breaker '{self.name}' closed.")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.error(f"Circuit breaker '{self.name}' opened after {self.failures} consecutive failures; "
+                             f"failing fast for {self.reset_timeout} seconds.")
+            self.trial_running = False
+
+    def release_trial(self):
+        """End the half-open trial without judging the dependency, so the next call becomes the trial"""
+        with self.lock:
+            self.trial_running = False
+
+    def snapshot(self):
+        return {'state': self.state, 'failures': self.failures, 'times_opened': self.times_opened}
+
+
+retry_budget = RetryBudget(APP_CONFIG['retry_budget'])
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with breakers_lock:
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name, APP_CONFIG['breaker_failure_threshold'],
+                                            APP_CONFIG['breaker_reset_timeout'])
+        return breakers[name]
+
+
+def resilience_state():
+    """Retry budget and circuit breaker state, for monitoring"""
+    return {
+        'retry_budget': retry_budget.state(),
+        'breakers': {name: breaker.snapshot() for name, breaker in breakers.items()},
+    }
+
+
+def backoff_delay(attempt, base, cap=None):
+    """Full-jitter exponential backoff: a random wait up to base * 2^(attempt - 1), capped at cap"""
+    cap = APP_CONFIG['retry_max_wait'] if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_after_seconds(exc):
+    """Seconds from the Retry-After header of the response attached to exc, if any"""
+    response = getattr(exc, 'response', None)
+    value = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(func, max_retries, wait_time, retry_exceptions, breaker=None, budget=True, description=None,
+                    label=None):
+    """Call func(), retrying retry_exceptions with backoff until max_retries attempts, the shared
+    retry budget or the named circuit breaker runs out. Retries are counted in the retries metric
+    under label (default: description)."""
+    description = description or getattr(func, '__name__', 'call')
+    retry_labels = {'dependency': breaker or '', 'call': label or description}
+    circuit = get_breaker(breaker) if breaker else None
+    retries = 0
+    while True:
+        trial = circuit.before_call() if circuit else False
+        try:
+            result = func()
+        except retry_exceptions as e:
+            if circuit:
+                circuit.record_failure()
+            retries += 1
+            if retries >= max_retries:
+                logger.error(f"{description} failed after {max_retries} retries: {e}")
+                raise
+            if circuit and circuit.state != 'closed':
+                raise
+            if budget and not retry_budget.consume():
+                logger.error(f"{description} failed and the retry budget of {retry_budget.limit} is spent: {e}")
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(retries, wait_time)
+            logger.warning(f"Retry {retries}/{max_retries} of {description} after error: {e}. Waiting {delay:.1f} seconds...")
+            metrics.inc('retries', retry_labels)
+            time.sleep(delay)
+            continue
+        except Exception as e:
+            if trial:
+                # Not a dependency failure; release the half-open trial this call held
+                circuit.release_trial()
+            logger.error(f"Unhandled exception in {description}: {e}")
+            raise
+        if circuit:
+            circuit.record_success()
+        return result
+
+
+def retry(max_retries, wait_time, retry_exceptions, breaker=None, budget=True):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except retry_exceptions as e:
-                    retries += 1
-                    if retries >= max_retries:
-                        logger.error(f"Failed after {max_retries} retries: {e}")
-                        raise
-                    logger.warning(f"Retry {retries}/{max_retries} after error: {e}. Waiting {wait_time} seconds...")
-                    time.sleep(wait_time)
-                except Exception as e:
-                    logger.error(f"Unhandled exception in {func.__name__}: {e}")
-                    raise
+            return call_with_retry(lambda: func(*args, **kwargs), max_retries, wait_time, retry_exceptions,
+                                   breaker=breaker, budget=budget, description=func.__name__)
         return wrapper
     return decorator
@@ -1,21 +1,45 @@
 # salesforce_snowflake_sync/salesforce_client.py
 
+import datetime
 import logging
+import threading
 import time
 import requests
 from simple_salesforce import Salesforce, SalesforceMalformedRequest
 from config import APP_CONFIG
 from utils import Utils
-from retry import retry
+from retry import retry, call_with_retry, backoff_delay, retry_budget, CircuitOpenError
+from api_governor import ApiGovernor, GovernedAdapter, ApiLimitReached
+import fake_salesforce
+from metrics import metrics
 
 logger = logging.getLogger('sf_snowflake_integration')
+record_logger = logging.getLogger('sf_snowflake_integration.records')
 
 class SalesforceClient:
-    def __init__(self, config):
+    # sObject Collections accepts at most 200 records per request
+    COLLECTION_MAX_RECORDS = 200
+    # Per-record error codes worth retrying; anything else is a data problem and fails the record
+    TRANSIENT_ERROR_CODES = {'UNABLE_TO_LOCK_ROW', 'SERVER_UNAVAILABLE', 'REQUEST_RUNNING_TOO_LONG'}
+    ACCOUNT_WATERMARK = 'accounts_system_modstamp'
+    ACCOUNT_FULL_REFRESH = 'accounts_full_refresh'
+
+    def __init__(self, config, account_cache=None):
         self.config = config
+        self.account_cache = account_cache
+        self.account_cache_loaded = False
         self.sf = None
         self.utils = Utils()
+        # Guards the lookup indexes below, which worker threads read and extend concurrently
+        self.index_lock = threading.RLock()
         self.accounts_by_lop = {}
+        self.account_keys_by_id = {}
+        self.sales_orders_by_invoice = {}
+        self.sales_orders_by_number = {}
+        self.sales_order_items_by_key = {}
+        # Current field values of the records found by the bulk lookups, by record Id
+        self.record_values = {}
+        self.governor = ApiGovernor()
         self.retry_exceptions = (
             requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
@@ -26,49 +50,162 @@ class SalesforceClient:
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), budget=False)
     def connect(self):
-        logger.info("Connecting to Salesforce...")
+        fake = APP_CONFIG['salesforce_backend'] == 'fake'
+        logger.info(f"Connecting to {'fake ' if fake else ''}Salesforce...")
+        session = requests.Session()
+        transport = fake_salesforce.default_server().adapter() if fake else None
+        # requests keeps 10 connections per host by default; give every worker its own
+        pool_size = max(APP_CONFIG['workers'], 10)
+        session.mount('https://', GovernedAdapter(self.governor, transport=transport,
+                                                  pool_connections=pool_size, pool_maxsize=pool_size))
         self.sf = Salesforce(
             username=self.config['username'],
             password=self.config['password'],
             security_token=self.config['security_token'],
-            domain=self.config['domain']
+            domain='fake' if fake else self.config['domain'],
+            session=session
         )
         logger.info("Successfully connected to Salesforce.")
 
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), breaker='salesforce_query')
+    def refresh_api_usage(self):
+        """Re-read the daily API budget with one call to the limits resource, even while paused"""
+        self.governor.probing = True
+        try:
+            self.sf.limits()
+        finally:
+            self.governor.probing = False
+        return self.governor.usage()
+
+    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+           (requests.exceptions.ConnectionError,
+            requests.exceptions.RequestException,
+            requests.exceptions.HTTPError), breaker='salesforce_query')
     def fetch_accounts(self):
-        query = "SELECT Id, Name, LOP_Customer_Number__c, AR_Div_Number__c FROM Account WHERE IsDeleted = FALSE"
+        """Bring accounts_by_lop up to date.
+
+        Without an account cache every Account is loaded with query_all. With one, the index is
+        restored from the cache once and afterwards only Accounts modified (or deleted) since the
+        cached SystemModstamp watermark are fetched; a full reload still runs every
+        account_full_refresh_hours to reconcile anything the delta cannot see.
+        """
+        if self.account_cache is None:
+            return self.fetch_all_accounts()
+
+        watermark = self.account_cache.get_watermark(self.ACCOUNT_WATERMARK)
+        last_full = self.account_cache.get_watermark(self.ACCOUNT_FULL_REFRESH)
+        full_refresh_due = (not watermark or not last_full or
+                            datetime.datetime.now() - datetime.datetime.fromisoformat(last_full)
+                            >= datetime.timedelta(hours=APP_CONFIG['account_full_refresh_hours']))
+        if full_refresh_due:
+            return self.fetch_all_accounts()
+
+        if not self.account_cache_loaded:
+            for account_id, key, name in self.account_cache.load_accounts():
+                self.register_account(key, account_id, name)
+            self.account_cache_loaded = True
+            logger.info(f"{len(self.accounts_by_lop)} accounts restored from the local account cache.")
+
+        # queryAll also returns deleted Accounts still in the recycle bin
+        query = ("SELECT Id, Name, LOP_Customer_Number__c, AR_Div_Number__c, SystemModstamp, IsDeleted FROM Account "
+                 f"WHERE SystemModstamp >= {watermark}")
+        accounts = self.sf.query_all(query, include_deleted=True)['records']
+
+        changed = []
+        deleted_ids = []
+        for acc in accounts:
+            if acc.get('IsDeleted'):
+                self.unregister_account(acc['Id'])
+                deleted_ids.append(acc['Id'])
+                continue
+            key = self.account_key(acc)
+            if key:
+                self.register_account(key, acc['Id'], acc.get('Name', ''))
+                changed.append((acc['Id'], key, acc.get('Name', ''), acc['SystemModstamp']))
+            else:
+                self.unregister_account(acc['Id'])
+                deleted_ids.append(acc['Id'])
+
+        self.account_cache.save_accounts(changed, deleted_ids)
+        self.save_account_watermark(accounts, watermark)
+        logger.info(f"Account cache refreshed: {len(changed)} changed and {len(deleted_ids)} removed since {watermark}.")
+        return self.accounts_by_lop
+
+    def fetch_all_accounts(self):
+        query = ("SELECT Id, Name, LOP_Customer_Number__c, AR_Div_Number__c, SystemModstamp FROM Account "
+                 "WHERE IsDeleted = FALSE")
         accounts = self.sf.query_all(query)['records']
 
+        with self.index_lock:
+            self.accounts_by_lop = {}
+            self.account_keys_by_id = {}
+        cached = []
         for acc in accounts:
-            lop = acc.get('LOP_Customer_Number__c', '')
-            ar_div = acc.get('AR_Div_Number__c', '')
-            if lop:
-                key = f"{lop.strip()}|{ar_div.strip() if ar_div else ''}"
-                self.accounts_by_lop[key] = {
-                    'Id': acc['Id'],
-                    'Name': acc.get('Name', '')
-                }
+            key = self.account_key(acc)
+            if key:
+                self.register_account(key, acc['Id'], acc.get('Name', ''))
+                cached.append((acc['Id'], key, acc.get('Name', ''), acc['SystemModstamp']))
 
         logger.info(f"{len(accounts)} accounts loaded from Salesforce.")
+        if self.account_cache is not None:
+            self.account_cache.save_accounts(cached, replace=True)
+            self.save_account_watermark(accounts, None)
+            self.account_cache.set_watermark(self.ACCOUNT_FULL_REFRESH, datetime.datetime.now().isoformat(timespec='seconds'))
+            self.account_cache_loaded = True
         return self.accounts_by_lop
 
+    @staticmethod
+    def account_key(account):
+        lop = account.get('LOP_Customer_Number__c', '')
+        ar_div = account.get('AR_Div_Number__c', '')
+        if not lop:
+            return None
+        return f"{lop.strip()}|{ar_div.strip() if ar_div else ''}"
+
+    def save_account_watermark(self, accounts, previous):
+        # SystemModstamp comes back as '2024-05-01T10:20:30.000+0000'; SOQL wants '2024-05-01T10:20:30Z'.
+        # Dropping the milliseconds is why the delta query uses >=.
+        stamps = [acc['SystemModstamp'] for acc in accounts if acc.get('SystemModstamp')]
+        if stamps:
+            self.account_cache.set_watermark(self.ACCOUNT_WATERMARK, max(stamps)[:19] + 'Z')
+        elif previous is None:
+            self.account_cache.set_watermark(self.ACCOUNT_WATERMARK,
+                                             datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+
     def find_account_by_customer_data(self, customer_number, ar_division_number):
         if not customer_number or not ar_division_number:
             return None, None
         key = f"{customer_number.strip()}|{ar_division_number.strip()}"
-        return (self.accounts_by_lop.get(key, {}).get('Id'),
-                self.accounts_by_lop.get(key, {}).get('Name')) if key in self.accounts_by_lop else (None, None)
+        with self.index_lock:
+            account = self.accounts_by_lop.get(key)
+        return (account['Id'], account['Name']) if account else (None, None)
+
+    def register_account(self, key, account_id, account_name):
+        with self.index_lock:
+            previous_key = self.account_keys_by_id.get(account_id)
+            if previous_key and previous_key != key and self.accounts_by_lop.get(previous_key, {}).get('Id') == account_id:
+                del self.accounts_by_lop[previous_key]
+            self.account_keys_by_id[account_id] = key
+            self.accounts_by_lop[key] = {
+                'Id': account_id,
+                'Name': account_name
+            }
+
+    def unregister_account(self, account_id):
+        with self.index_lock:
+            key = self.account_keys_by_id.pop(account_id, None)
+            if key and self.accounts_by_lop.get(key, {}).get('Id') == account_id:
+                del self.accounts_by_lop[key]
 
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), breaker='salesforce_query')
     def check_existing_account_in_salesforce(self, customer_number, ar_division_number):
         if not customer_number or not ar_division_number:
             return None, None
@@ -85,12 +222,11 @@ class SalesforceClient:
                 account_id = result[0]['Id']
                 account_name = result[0].get('Name', '')
                 key = f"{customer_number}|{ar_division_number}"
-                self.accounts_by_lop[key] = {
-                    'Id': account_id,
-                    'Name': account_name
-                }
+                self.register_account(key, account_id, account_name)
                 return account_id, account_name
             return None, None
+        except (ApiLimitReached, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Error checking for existing account: {e}")
             return None, None
@@ -98,39 +234,39 @@ class SalesforceClient:
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), breaker='salesforce_query')
     def check_existing_sales_order_by_invoice(self, invoice_number, order_number=None):
         if not invoice_number:
             # For open orders without invoice numbers, check by Sales_Order_Number__c
             if order_number:
                 so_query = f"SELECT Id FROM Sales_Order__c WHERE Sales_Order_Number__c = '{order_number}' LIMIT 1"
-                logger.info(f"Checking for existing Sales Order with Sales_Order_Number__c = '{order_number}' (open order)")
+                record_logger.info("Checking for existing Sales Order with Sales_Order_Number__c = '%s' (open order)", order_number)
                 result = self.sf.query_all(so_query)['records']
                 return result[0]['Id'] if result else None
             return None
         
         so_query = f"SELECT Id FROM Sales_Order__c WHERE Invoice_Number__c = '{invoice_number}' LIMIT 1"
-        logger.info(f"Checking for existing Sales Order with Invoice_Number__c = '{invoice_number}'")
+        record_logger.info("Checking for existing Sales Order with Invoice_Number__c = '%s'", invoice_number)
         result = self.sf.query_all(so_query)['records']
         return result[0]['Id'] if result else None
 
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), breaker='salesforce_query')
     def check_existing_sales_order_by_number(self, order_number):
         """Check for existing sales order by Sales_Order_Number__c field"""
         if not order_number:
             return None
         so_query = f"SELECT Id FROM Sales_Order__c WHERE Sales_Order_Number__c = '{order_number}' LIMIT 1"
-        logger.info(f"Checking for existing Sales Order with Sales_Order_Number__c = '{order_number}'")
+        record_logger.info("Checking for existing Sales Order with Sales_Order_Number__c = '%s'", order_number)
         result = self.sf.query_all(so_query)['records']
         return result[0]['Id'] if result else None
 
     @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
            (requests.exceptions.ConnectionError,
             requests.exceptions.RequestException,
-            requests.exceptions.HTTPError))
+            requests.exceptions.HTTPError), breaker='salesforce_query')
     def check_existing_sales_order_item(self, parent_id, product_code):
         soi_query = (
             "SELECT Id FROM Sales_Order_Item__c "
@@ -139,55 +275,254 @@ class SalesforceClient:
         result = self.sf.query_all(soi_query)['records']
         return result[0]['Id'] if result else None
 
+    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+           (requests.exceptions.ConnectionError,
+            requests.exceptions.RequestException,
+            requests.exceptions.HTTPError), breaker='salesforce_query')
+    def query_records(self, query):
+        return self.sf.query_all(query)['records']
+
+    def iter_query_records(self, query):
+        """Yield the records of a query page by page (queryMore), without holding the full result"""
+        return self.sf.query_all_iter(query)
+
+    def _in_clause_chunks(self, values):
+        """Split values into quoted IN (...) lists no longer than soql_in_max_length characters"""
+        max_length = APP_CONFIG['soql_in_max_length']
+        chunk = []
+        length = 0
+        for value in values:
+            quoted = f"'{self.utils.escape_soql(value)}'"
+            if chunk and length + len(quoted) + 1 > max_length:
+                yield ','.join(chunk)
+                chunk = []
+                length = 0
+            chunk.append(quoted)
+            length += len(quoted) + 1
+        if chunk:
+            yield ','.join(chunk)
+
+    @staticmethod
+    def lookup_key(value):
+        # SOQL string comparisons are case-insensitive, so the in-memory index is as well
+        return str(value).strip().lower()
+
+    def prefetch_sales_orders(self, invoice_numbers, order_numbers, fields=()):
+        """Load existing Sales Orders for the given invoice and order numbers into the in-memory index,
+        keeping the current values of `fields` for current_values()"""
+        self.sales_orders_by_invoice = {}
+        self.sales_orders_by_number = {}
+        self.record_values = {}
+        select = ', '.join(['Id', 'Invoice_Number__c', 'Sales_Order_Number__c'] +
+                           [name for name in fields if name not in ('Invoice_Number__c', 'Sales_Order_Number__c')])
+
+        for in_list in self._in_clause_chunks(sorted(set(invoice_numbers))):
+            query = f"SELECT {select} FROM Sales_Order__c WHERE Invoice_Number__c IN ({in_list})"
+            for record in self.query_records(query):
+                key = self.lookup_key(record['Invoice_Number__c'])
+                self.sales_orders_by_invoice.setdefault(key, record['Id'])
+                self.keep_values(record, fields)
+
+        for in_list in self._in_clause_chunks(sorted(set(order_numbers))):
+            query = f"SELECT {select} FROM Sales_Order__c WHERE Sales_Order_Number__c IN ({in_list})"
+            for record in self.query_records(query):
+                key = self.lookup_key(record['Sales_Order_Number__c'])
+                self.sales_orders_by_number.setdefault(key, record['Id'])
+                self.keep_values(record, fields)
+
+        logger.info(f"{len(self.sales_orders_by_invoice)} Sales Orders matched by invoice and "
+                    f"{len(self.sales_orders_by_number)} by order number.")
+
+    def keep_values(self, record, fields):
+        if fields:
+            self.record_values[record['Id']] = {name: record.get(name) for name in fields}
+
+    def current_values(self, record_id):
+        """Field values of a record as read by the last bulk lookup, or None when they are unknown"""
+        return self.record_values.get(record_id)
+
+    def remember_values(self, record_id, values):
+        """Fold values just written to a record into its known current values"""
+        with self.index_lock:
+            if record_id in self.record_values:
+                self.record_values[record_id] = dict(self.record_values[record_id], **values)
+
+    def find_sales_order(self, invoice_number, order_number=None):
+        # Same precedence as check_existing_sales_order_by_invoice: the invoice number decides when present
+        if invoice_number:
+            return self.sales_orders_by_invoice.get(self.lookup_key(invoice_number))
+        if order_number:
+            return self.sales_orders_by_number.get(self.lookup_key(order_number))
+        return None
+
+    def register_sales_order(self, sales_order_id, invoice_number, order_number):
+        with self.index_lock:
+            if invoice_number:
+                self.sales_orders_by_invoice[self.lookup_key(invoice_number)] = sales_order_id
+            if order_number:
+                self.sales_orders_by_number.setdefault(self.lookup_key(order_number), sales_order_id)
+
+    def prefetch_sales_order_items(self, parent_ids, fields=()):
+        """Load existing Sales Order Items of the given Sales Orders into the (parent Id, product code) index,
+        keeping the current values of `fields` for current_values()"""
+        self.sales_order_items_by_key = {}
+
+        for record in self.iter_sales_order_items(parent_ids, fields):
+            if not record.get('Product_Code__c'):
+                continue
+            key = (record['Sales_Order_Number__c'], self.lookup_key(record['Product_Code__c']))
+            self.sales_order_items_by_key.setdefault(key, record['Id'])
+            self.keep_values(record, fields)
+
+        logger.info(f"{len(self.sales_order_items_by_key)} existing Sales Order Items loaded for "
+                    f"{len(set(parent_ids))} Sales Orders.")
+
+    def iter_sales_order_items(self, parent_ids, fields=()):
+        """Yield Id, Sales_Order_Number__c, Product_Code__c and `fields` of the items of the given Sales Orders"""
+        select = ', '.join(['Id', 'Sales_Order_Number__c', 'Product_Code__c'] +
+                           [name for name in fields if name not in ('Sales_Order_Number__c', 'Product_Code__c')])
+        for in_list in self._in_clause_chunks(sorted(set(parent_ids))):
+            query = f"SELECT {select} FROM Sales_Order_Item__c WHERE Sales_Order_Number__c IN ({in_list})"
+            yield from self.query_records(query)
+
+    def find_sales_order_item(self, parent_id, product_code):
+        return self.sales_order_items_by_key.get((parent_id, self.lookup_key(product_code)))
+
+    def register_sales_order_item(self, item_id, parent_id, product_code):
+        with self.index_lock:
+            self.sales_order_items_by_key.setdefault((parent_id, self.lookup_key(product_code)), item_id)
+
     def safely_create_salesforce(self, object_name, data):
-        retries = 0
-        max_retries = APP_CONFIG['max_retries']
-        retry_wait = APP_CONFIG['retry_wait']
         sf_object = getattr(self.sf, object_name)
-
-        while retries < max_retries:
-            try:
-                result = sf_object.create(data)
-                return result['id'] if result.get('id') else None
-            except SalesforceMalformedRequest as e:
-                logger.error(f"Salesforce error (create {object_name}): {e.content}")
-                return None
-            except (requests.exceptions.ConnectionError, requests.exceptions.RequestException) as e:
-                retries += 1
-                if retries < max_retries:
-                    logger.error(f"Connection error (create {object_name}): {e}. Retry {retries}/{max_retries} in {retry_wait} seconds...")
-                    time.sleep(retry_wait)
-                else:
-                    logger.error(f"Failed to create {object_name} after {max_retries} retries: {e}")
-                    return None
-            except Exception as e:
-                logger.error(f"Unexpected error (create {object_name}): {e}")
-                return None
+        try:
+            result = self.call_write(lambda: sf_object.create(data), f"create {object_name}")
+            return result['id'] if result.get('id') else None
+        except SalesforceMalformedRequest as e:
+            logger.error(f"Salesforce error (create {object_name}): {e.content}")
+            return None
+        except (ApiLimitReached, CircuitOpenError):
+            # End the cycle instead of failing every remaining record
+            raise
+        except Exception as e:
+            logger.error(f"Failed to create {object_name}: {e}")
+            return None
 
     def safely_update_salesforce(self, object_name, record_id, data):
-        retries = 0
-        max_retries = APP_CONFIG['max_retries']
-        retry_wait = APP_CONFIG['retry_wait']
         sf_object = getattr(self.sf, object_name)
+        try:
+            result = self.call_write(lambda: sf_object.update(record_id, data), f"update {object_name}")
+            return result if result else None
+        except SalesforceMalformedRequest as e:
+            logger.error(f"Salesforce error (update {object_name}): {e.content}")
+            return None
+        except (ApiLimitReached, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Failed to update {object_name}: {e}")
+            return None
+
+    def call_write(self, func, description, label=None):
+        return call_with_retry(func, APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+                               (requests.exceptions.ConnectionError, requests.exceptions.RequestException),
+                               breaker='salesforce_write', description=description, label=label)
+
+    def safely_create_salesforce_batch(self, object_name, records):
+        """Create records through sObject Collections. Returns the new Ids (None on failure) in input order."""
+        return self._safely_write_collection('POST', 'create', object_name, records)
+
+    def safely_update_salesforce_batch(self, object_name, updates):
+        """Update (record_id, data) pairs through sObject Collections. Returns the record Ids (None on failure) in input order."""
+        records = [dict(data, Id=record_id) for record_id, data in updates]
+        return self._safely_write_collection('PATCH', 'update', object_name, records)
+
+    def safely_delete_salesforce_batch(self, object_name, record_ids):
+        """Delete records through sObject Collections. Returns the record Ids (None on failure) in input order;
+        records that were already deleted count as deleted."""
+        records = [{'Id': record_id} for record_id in record_ids]
+        return self._safely_write_collection('DELETE', 'delete', object_name, records)
 
-        while retries < max_retries:
-            try:
-                result = sf_object.update(record_id, data)
-                return result if result else None
-            except SalesforceMalformedRequest as e:
-                logger.error(f"Salesforce error (update {object_name}): {e.content}")
-                return None
-            except (requests.exceptions.ConnectionError, requests.exceptions.RequestException) as e:
-                retries += 1
-                if retries < max_retries:
-                    logger.error(f"Connection error (update {object_name}): {e}. Retry {retries}/{max_retries} in {retry_wait} seconds...")
-                    time.sleep(retry_wait)
+    def _safely_write_collection(self, method, action, object_name, records):
+        results = [None] * len(records)
+        batch_size = min(APP_CONFIG['collection_batch_size'], self.COLLECTION_MAX_RECORDS)
+
+        for start in range(0, len(records), batch_size):
+            pending = list(range(start, min(start + batch_size, len(records))))
+            attempts = 0
+            max_retries = APP_CONFIG['max_retries']
+
+            while pending:
+                if method == 'DELETE':
+                    # Deletes take the Ids as a query parameter instead of a body
+                    request = {'params': {'ids': ','.join(records[i]['Id'] for i in pending), 'allOrNone': 'false'}}
                 else:
-                    logger.error(f"Failed to update {object_name} after {max_retries} retries: {e}")
-                    return None
-            except Exception as e:
-                logger.error(f"Unexpected error (update {object_name}): {e}")
-                return None
+                    request = {'json': {
+                        'allOrNone': False,
+                        'records': [dict(records[i], attributes={'type': object_name}) for i in pending]
+                    }}
+                try:
+                    response = self.call_write(lambda: self.sf.restful('composite/sobjects', method=method, **request),
+                                               f"{action} {object_name} batch of {len(pending)}",
+                                               f"{action} {object_name} batch")
+                except SalesforceMalformedRequest as e:
+                    logger.error(f"Salesforce error ({action} {object_name} batch of {len(pending)}): {e.content}")
+                    break
+                except (ApiLimitReached, CircuitOpenError):
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to {action} {object_name} batch of {len(pending)}: {e}")
+                    break
+
+                transient = []
+                for index, result in zip(pending, response or []):
+                    if result.get('success'):
+                        results[index] = result.get('id') or records[index].get('Id')
+                        continue
+                    errors = result.get('errors', [])
+                    if method == 'DELETE' and errors and all(error.get('statusCode') == 'ENTITY_IS_DELETED' for error in errors):
+                        results[index] = records[index]['Id']
+                        continue
+                    if any(error.get('statusCode') in self.TRANSIENT_ERROR_CODES for error in errors):
+                        transient.append(index)
+                    else:
+                        label = records[index].get('Id') or records[index].get('Name', '')
+                        record_logger.error("Salesforce error (%s %s %s): %s", action, object_name, label, errors,
+                                            extra={'sobject': object_name, 'errors': errors})
+
+                if not transient:
+                    break
+                attempts += 1
+                if attempts >= max_retries or not retry_budget.consume():
+                    logger.error(f"Failed to {action} {len(transient)} {object_name} records after {attempts} retries.")
+                    break
+                delay = backoff_delay(attempts, APP_CONFIG['retry_wait'])
+                metrics.inc('retries', {'dependency': 'salesforce_records', 'call': f"{action} {object_name}"},
+                            len(transient))
+                logger.warning(f"{len(transient)} {object_name} records failed transiently ({action}). "
+                               f"Retry {attempts}/{max_retries} in {delay:.1f} seconds...")
+                time.sleep(delay)
+                pending = transient
+
+        succeeded = sum(1 for result in results if result)
+        logger.info(f"Batch {action} {object_name}: {succeeded}/{len(records)} succeeded.")
+        return results
+
+    def bulk_upsert(self, object_name, csv_path, external_id_field):
+        """Upsert a CSV file with Bulk API 2.0 and wait for its ingest jobs to finish"""
+        bulk_object = getattr(self.sf.bulk2, object_name)
+        return bulk_object.upsert(csv_file=csv_path, external_id_field=external_id_field,
+                                  wait=APP_CONFIG['bulk_poll_interval'])
+
+    def bulk_hard_delete(self, object_name, csv_path):
+        """Hard-delete the Ids of a CSV file with Bulk API 2.0; the records skip the recycle bin"""
+        bulk_object = getattr(self.sf.bulk2, object_name)
+        return bulk_object.hard_delete(csv_file=csv_path, wait=APP_CONFIG['bulk_poll_interval'])
+
+    def download_bulk_results(self, object_name, job_id, results_type, path):
+        bulk_object = getattr(self.sf.bulk2, object_name)
+        if results_type == 'failedResults':
+            bulk_object.get_failed_records(job_id, file=path)
+        else:
+            bulk_object.get_successful_records(job_id, file=path)
 
     def close(self):
         logger.info("Salesforce session ended.")
@@ -0,0 +1,187 @@
+# salesforce_snowflake_sync/snapshots.py
+
+import dataclasses
+import datetime
+import json
+import logging
+import operator
+import os
+import shutil
+from config import APP_CONFIG
+from records import Order, LineItem
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+MANIFEST_NAME = 'manifest.json'
+DATA_FILES = {'arrow': 'orders.arrow', 'parquet': 'orders.parquet'}
+# Record fields in SnowflakeClient.ORDER_COLUMNS / ITEM_COLUMNS order; snapshot columns are their upper-case names
+ORDER_FIELDS = [f.name for f in dataclasses.fields(Order) if f.name not in ('sales_order_number', 'items')]
+ITEM_FIELDS = [f.name for f in dataclasses.fields(LineItem)]
+FLOAT_FIELDS = {f.name for f in dataclasses.fields(Order) + dataclasses.fields(LineItem) if f.type == float | None}
+order_values = operator.attrgetter(*ORDER_FIELDS)
+item_values = operator.attrgetter(*ITEM_FIELDS)
+
+
+def snapshot_schema():
+    """One row per line item with its order header repeated, like VW_SALES_ORDER_INVOICING_SUMMARY"""
+    return pyarrow.schema([('SALES_ORDER_NUMBER', pyarrow.string())] + [
+        (name.upper(), pyarrow.float64() if name in FLOAT_FIELDS else pyarrow.string())
+        for name in ORDER_FIELDS + ITEM_FIELDS])
+
+
+class SnapshotWriter:
+    """Records extracted orders to <directory>/<UTC time>/ as an Arrow IPC file or Parquet file plus
+    a manifest.json describing the extract.
+
+    Orders are written in the order they are added, each as a run of rows, so a replay rebuilds them
+    in one pass. The manifest is written last, by close(); a directory without one is an extract
+    that never finished.
+    """
+
+    def __init__(self, directory, data_format, **details):
+        if data_format not in DATA_FILES:
+            raise ValueError(f"Unknown snapshot format '{data_format}'; use one of {', '.join(DATA_FILES)}")
+        self.created = datetime.datetime.now(datetime.timezone.utc)
+        self.path = os.path.join(directory, self.created.strftime('%Y%m%dT%H%M%S%fZ'))
+        os.makedirs(self.path)
+        self.data_format = data_format
+        self.details = details
+        self.data_path = os.path.join(self.path, DATA_FILES[data_format])
+        self.schema = snapshot_schema()
+        self.sink = None
+        if data_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.data_path, self.schema, compression='zstd')
+        else:
+            self.sink = pyarrow.OSFile(self.data_path, 'wb')
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+        self.batch_rows = APP_CONFIG['fetch_batch_size']
+        self.columns = [[] for _ in self.schema]
+        self.orders = 0
+        self.rows = 0
+
+    def add(self, son, order):
+        header = (son,) + order_values(order)
+        for item in order.items:
+            for column, value in zip(self.columns, header + item_values(item)):
+                column.append(value)
+        self.orders += 1
+        if len(self.columns[0]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.columns[0]:
+            return
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(self.columns, self.schema)]
+        self.writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+        self.rows += len(self.columns[0])
+        self.columns = [[] for _ in self.schema]
+
+    def close(self, watermark=None, complete=True):
+        """Finish the data file and write the manifest; returns the manifest path"""
+        self.flush()
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+        if isinstance(watermark, (datetime.date, datetime.datetime)):
+            watermark = watermark.isoformat(sep=' ') if isinstance(watermark, datetime.datetime) else watermark.isoformat()
+        manifest = dict({
+            'version': 1,
+            'created': self.created.isoformat(),
+            'format': self.data_format,
+            'file': DATA_FILES[self.data_format],
+            'complete': complete,
+            'orders': self.orders,
+            'rows': self.rows,
+            'bytes': os.path.getsize(self.data_path),
+            'watermark': None if watermark is None else str(watermark),
+            'columns': {field.name: str(field.type) for field in self.schema},
+        }, **self.details)
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        state = '' if complete else ' (incomplete: the extract was not read to the end)'
+        logger.info(f"Extract snapshot of {self.orders} orders, {self.rows} rows written to {self.path}{state}.")
+        return manifest_path
+
+
+def prune_snapshots(directory, keep):
+    """Delete all but the newest `keep` snapshots in directory; 0 keeps all"""
+    if keep <= 0:
+        return
+    snapshots = sorted(name for name in os.listdir(directory)
+                       if os.path.isfile(os.path.join(directory, name, MANIFEST_NAME)))
+    for name in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class SnapshotReplaySource:
+    """Serves the orders of a recorded snapshot in place of SnowflakeClient, without touching Snowflake.
+
+    path is a snapshot directory or its manifest.json. Arrow IPC snapshots are memory-mapped and
+    read batch by batch without copying the file into memory; Parquet snapshots are read one row
+    group at a time. The watermark is never advanced by a replay.
+    """
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise ImportError("Replaying extract snapshots requires pyarrow (install the 'arrow' extra)")
+        self.manifest_path = path if os.path.isfile(path) else os.path.join(path, MANIFEST_NAME)
+        with open(self.manifest_path) as f:
+            self.manifest = json.load(f)
+        self.data_path = os.path.join(os.path.dirname(self.manifest_path), self.manifest['file'])
+        self.pending_watermark = None
+        if not self.manifest['complete']:
+            logger.warning(f"Snapshot {self.manifest_path} is incomplete; only its first "
+                           f"{self.manifest['orders']} orders will be replayed.")
+        logger.info(f"Replaying extract snapshot {self.manifest_path} ({self.manifest['orders']} orders, "
+                    f"{self.manifest['format']}, recorded {self.manifest['created']}).")
+
+    def iter_batches(self):
+        if self.manifest['format'] == 'parquet':
+            yield from pyarrow.parquet.ParquetFile(self.data_path, memory_map=True).iter_batches()
+            return
+        with pyarrow.memory_map(self.data_path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    def iter_orders(self):
+        """Yield (order_number, order_data) in the order they were recorded"""
+        order_columns = [name.upper() for name in ORDER_FIELDS]
+        item_columns = [name.upper() for name in ITEM_FIELDS]
+        current_son = None
+        current_order = None
+        total_orders = 0
+        for batch in self.iter_batches():
+            columns = batch.to_pydict()
+            headers = zip(*(columns[name] for name in order_columns))
+            items = zip(*(columns[name] for name in item_columns))
+            for son, header, item in zip(columns['SALES_ORDER_NUMBER'], headers, items):
+                if current_order is None or son != current_son:
+                    if current_order is not None:
+                        total_orders += 1
+                        yield current_son, current_order
+                    current_son = son
+                    current_order = Order.from_values(son, header)
+                current_order.items.append(LineItem.from_values(item))
+        if current_order is not None:
+            total_orders += 1
+            yield current_son, current_order
+        logger.info(f"{total_orders} orders replayed from snapshot.")
+
+    def fetch_orders(self):
+        return dict(self.iter_orders())
+
+    def commit_watermark(self):
+        logger.info("Replayed snapshot; the extraction watermark is not advanced.")
+
+    def close(self):
+        pass
@@ -1,20 +1,46 @@
 # salesforce_snowflake_sync/snowflake_client.py
 
 import datetime
+import json
 import logging
+import operator
+import queue
+import threading
 import snowflake.connector
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from config import APP_CONFIG
 from utils import Utils
 from retry import retry
+from snowflake_pool import SnowflakeConnectionPool
+from records import Order, LineItem
+from metrics import metrics
+import snapshots
+
+try:
+    import pyarrow
+    import pyarrow.compute
+except ImportError:
+    pyarrow = None
 
 logger = logging.getLogger('sf_snowflake_integration')
 
 class SnowflakeClient:
-    def __init__(self, config):
+    WATERMARK_NAME = 'VW_SALES_ORDER_INVOICING_SUMMARY'
+    ORDER_COLUMNS = ['CUSTOMER_NAME', 'CUSTOMER_ACCOUNT', 'CUSTOMER_PO_NUMBER', 'CUSTOMER_NUMBER', 'AR_DIVISION_NUMBER',
+                     'SALES_ORDER_DATE', 'POSTING_DATE', 'INVOICE_NUMBER', 'GROSS_SALES', 'NET_SALES']
+    ITEM_COLUMNS = ['ITEM_CODE', 'ITEM_CODE_DESC', 'QTY_ORDERED', 'QTY_SHIPPED', 'UNIT_PRICE', 'DISCOUNT', 'DEDUCTION',
+                    'INVOICE_DETAIL_COMMENT']
+    DECIMAL_COLUMNS = ['GROSS_SALES', 'NET_SALES', 'QTY_ORDERED', 'QTY_SHIPPED', 'UNIT_PRICE', 'DISCOUNT', 'DEDUCTION']
+    DATE_COLUMNS = ['SALES_ORDER_DATE', 'POSTING_DATE']
+
+    def __init__(self, config, sync_state=None, pool=None):
         self.config = config
-        self.conn = None
+        self.pool = pool or SnowflakeConnectionPool(config)
         self.utils = Utils()
+        self.sync_state = sync_state
+        self.pending_watermark = None
+        self.watermark_lock = threading.Lock()
         self.retry_exceptions = (
             snowflake.connector.errors.OperationalError,
             snowflake.connector.errors.DatabaseError,
@@ -22,42 +48,35 @@ class SnowflakeClient:
         )
         self.connect()
 
-    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
-           (snowflake.connector.errors.OperationalError,
-            snowflake.connector.errors.DatabaseError,
-            requests.exceptions.RequestException))
     def connect(self):
-        logger.info("Connecting to Snowflake...")
-        self.conn = snowflake.connector.connect(
-            user=self.config['user'],
-            password=self.config['password'],
-            account=self.config['account'],
-            warehouse=self.config['warehouse'],
-            database=self.config['database'],
-            schema=self.config['schema'],
-            role=self.config['role']
-        )
-        logger.info("Successfully connected to Snowflake.")
+        """Open the first pooled connection up front so bad credentials fail at startup"""
+        self.pool.checkin(self.pool.checkout())
 
-    def ensure_connection(self):
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
-            cursor.close()
-        except Exception:
-            logger.info("Reconnecting to Snowflake...")
-            self.connect()
+    def build_orders_filter(self):
+        """WHERE clause for the configured LOAD_METHOD ('last_7_days' or 'incremental')"""
+        seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
+        last_7_days = (f"(SALES_ORDER_DATE >= '{seven_days_ago}' AND SALES_ORDER_DATE IS NOT NULL)\n"
+                       f"           OR (POSTING_DATE >= '{seven_days_ago}' AND POSTING_DATE IS NOT NULL)")
 
-    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
-           (snowflake.connector.errors.OperationalError,
-            snowflake.connector.errors.DatabaseError,
-            requests.exceptions.RequestException))
-    def fetch_orders(self):
-        self.ensure_connection()
+        if APP_CONFIG['LOAD_METHOD'] == 'incremental':
+            if self.sync_state is None:
+                raise ValueError("LOAD_METHOD 'incremental' requires a sync state store for the watermark")
+            watermark_column = APP_CONFIG['watermark_column']
+            watermark = self.sync_state.get_watermark(self.WATERMARK_NAME)
+            if watermark:
+                # >= re-reads rows sharing the boundary value; the sync state skips them if unchanged
+                logger.info(f"Using incremental filter {watermark_column} >= '{watermark}'.")
+                return f"{watermark_column} >= '{watermark}'"
+            logger.info("No watermark stored yet; bootstrapping incremental load from the last 7 days.")
+        else:
+            logger.info(f"Using filter for orders with Sales Order Date OR Posting Date in the past 7 days (since {seven_days_ago}).")
+        return last_7_days
 
-        seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
-        query = f"""
+    def build_orders_query(self, orders_filter=None):
+        watermark_select = ''
+        if APP_CONFIG['LOAD_METHOD'] == 'incremental':
+            watermark_select = f",\n            {APP_CONFIG['watermark_column']} AS WATERMARK_VALUE"
+        return f"""
         SELECT
             SALES_ORDER_NUMBER,
             CUSTOMER_NAME,
@@ -77,67 +96,372 @@ class SnowflakeClient:
             UNIT_PRICE,
             DISCOUNT,
             DEDUCTION,
-            INVOICE_DETAIL_COMMENT
+            INVOICE_DETAIL_COMMENT{watermark_select}
+        FROM SALESFORCE_INTEGRATION.VW_SALES_ORDER_INVOICING_SUMMARY
+        WHERE {orders_filter or self.build_orders_filter()}
+        """
+
+    def build_aggregated_orders_query(self, orders_filter=None):
+        """One row per order: header columns plus its line items as an ARRAY of OBJECTs (VARIANT)"""
+        # Every header column is taken from the same row, like the row mode does: the one with the lowest
+        # hash of all header columns. Rows tying on that hash have the same header, so any of them will do.
+        header_hash = f"HASH({', '.join(self.ORDER_COLUMNS)})"
+        header_select = ',\n            '.join(f"MIN_BY({name}, {header_hash}) AS {name}" for name in self.ORDER_COLUMNS)
+        # Items are keyed by their position in ITEM_COLUMNS to keep the VARIANT small. Numeric fields
+        # are cast to FLOAT so they come back as JSON floats, matching the row mode.
+        item_fields = ',\n                '.join(
+            f"'{i}', {name}::FLOAT" if name in self.DECIMAL_COLUMNS else f"'{i}', {name}"
+            for i, name in enumerate(self.ITEM_COLUMNS))
+        watermark_select = ''
+        if APP_CONFIG['LOAD_METHOD'] == 'incremental':
+            watermark_select = f",\n            MAX({APP_CONFIG['watermark_column']}) AS WATERMARK_VALUE"
+        return f"""
+        SELECT
+            SALES_ORDER_NUMBER,
+            {header_select},
+            ARRAY_AGG(OBJECT_CONSTRUCT_KEEP_NULL(
+                {item_fields}
+            )) AS ITEMS{watermark_select}
         FROM SALESFORCE_INTEGRATION.VW_SALES_ORDER_INVOICING_SUMMARY
-        WHERE (SALES_ORDER_DATE >= '{seven_days_ago}' AND SALES_ORDER_DATE IS NOT NULL)
-           OR (POSTING_DATE >= '{seven_days_ago}' AND POSTING_DATE IS NOT NULL)
+        WHERE {orders_filter or self.build_orders_filter()}
+        GROUP BY SALES_ORDER_NUMBER
         """
-        logger.info(f"Using filter for orders with Sales Order Date OR Posting Date in the past 7 days (since {seven_days_ago}).")
 
-        cursor = self.conn.cursor()
-        cursor.execute(query)
-        rows = cursor.fetchall()
+    def iter_aggregated_orders(self, cursor):
+        """Yield (order_number, order_data) from the rows of the aggregated query"""
         cols = [c[0] for c in cursor.description]
-        orders_dict = {}
-
-        for r in rows:
-            record = dict(zip(cols, r))
-            record['SALES_ORDER_DATE'] = self.utils.normalize_date(record.get('SALES_ORDER_DATE'))
-            record['POSTING_DATE'] = self.utils.normalize_date(record.get('POSTING_DATE'))
-
-            record['GROSS_SALES'] = self.utils.to_float_if_decimal(record.get('GROSS_SALES', 0.0))
-            record['NET_SALES'] = self.utils.to_float_if_decimal(record.get('NET_SALES', 0.0))
-            record['QTY_ORDERED'] = self.utils.to_float_if_decimal(record.get('QTY_ORDERED', 0))
-            record['QTY_SHIPPED'] = self.utils.to_float_if_decimal(record.get('QTY_SHIPPED', 0))
-            record['UNIT_PRICE'] = self.utils.to_float_if_decimal(record.get('UNIT_PRICE', 0.0))
-            record['DISCOUNT'] = self.utils.to_float_if_decimal(record.get('DISCOUNT', 0.0))
-            record['DEDUCTION'] = self.utils.to_float_if_decimal(record.get('DEDUCTION', 0.0))
-
-            son = record['SALES_ORDER_NUMBER'] or ''
-
-            if son not in orders_dict:
-                orders_dict[son] = {
-                    'SALES_ORDER_NUMBER': son,
-                    'CUSTOMER_NAME': record.get('CUSTOMER_NAME', ''),
-                    'CUSTOMER_ACCOUNT': record.get('CUSTOMER_ACCOUNT', ''),
-                    'CUSTOMER_PO_NUMBER': record.get('CUSTOMER_PO_NUMBER', ''),
-                    'CUSTOMER_NUMBER': record.get('CUSTOMER_NUMBER', ''),
-                    'AR_DIVISION_NUMBER': record.get('AR_DIVISION_NUMBER', ''),
-                    'SALES_ORDER_DATE': record.get('SALES_ORDER_DATE', ''),
-                    'POSTING_DATE': record.get('POSTING_DATE', ''),
-                    'INVOICE_NUMBER': record.get('INVOICE_NUMBER', ''),
-                    'GROSS_SALES': record.get('GROSS_SALES', 0.0),
-                    'NET_SALES': record.get('NET_SALES', 0.0),
-                    'ITEMS': []
-                }
-
-            item_data = {
-                'ITEM_CODE': record.get('ITEM_CODE', ''),
-                'ITEM_CODE_DESC': record.get('ITEM_CODE_DESC', ''),
-                'QTY_ORDERED': record.get('QTY_ORDERED', 0),
-                'QTY_SHIPPED': record.get('QTY_SHIPPED', 0),
-                'UNIT_PRICE': record.get('UNIT_PRICE', 0.0),
-                'DISCOUNT': record.get('DISCOUNT', 0.0),
-                'DEDUCTION': record.get('DEDUCTION', 0.0),
-                'INVOICE_DETAIL_COMMENT': record.get('INVOICE_DETAIL_COMMENT', '')
-            }
-            orders_dict[son]['ITEMS'].append(item_data)
+        batch_size = APP_CONFIG['fetch_batch_size']
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for r in rows:
+                record = dict(zip(cols, r))
+                items = record.pop('ITEMS')
+                # The connector returns VARIANT columns as JSON text
+                if isinstance(items, str):
+                    items = json.loads(items)
+                record = self.normalize_record(record)
+                son = record['SALES_ORDER_NUMBER'] or ''
+                order = self.build_order(son, self.order_values(record))
+                positions = [str(i) for i in range(len(self.ITEM_COLUMNS))]
+                order.items = [LineItem.from_values([item.get(position) for position in positions]) for item in items]
+                yield son, order
 
-        logger.info(f"{len(orders_dict)} distinct orders loaded from Snowflake (including open and posted orders).")
+    def track_watermark(self, value):
+        if value is None:
+            return
+        # Partitions are read concurrently and all report to this one high-water mark
+        with self.watermark_lock:
+            if self.pending_watermark is None or value > self.pending_watermark:
+                self.pending_watermark = value
+
+    def commit_watermark(self):
+        """Persist the high-water mark of the last fetch; call only after its orders were processed"""
+        if APP_CONFIG['LOAD_METHOD'] != 'incremental' or self.pending_watermark is None:
+            return
+        watermark = self.pending_watermark
+        if isinstance(watermark, (datetime.date, datetime.datetime)):
+            watermark = watermark.isoformat(sep=' ') if isinstance(watermark, datetime.datetime) else watermark.isoformat()
+        self.sync_state.set_watermark(self.WATERMARK_NAME, str(watermark))
+        logger.info(f"Watermark advanced to {watermark}.")
+        self.pending_watermark = None
+
+    def normalize_record(self, record):
+        self.track_watermark(record.get('WATERMARK_VALUE'))
+        record['SALES_ORDER_DATE'] = self.utils.normalize_date(record.get('SALES_ORDER_DATE'))
+        record['POSTING_DATE'] = self.utils.normalize_date(record.get('POSTING_DATE'))
+
+        record['GROSS_SALES'] = self.utils.to_float_if_decimal(record.get('GROSS_SALES', 0.0))
+        record['NET_SALES'] = self.utils.to_float_if_decimal(record.get('NET_SALES', 0.0))
+        record['QTY_ORDERED'] = self.utils.to_float_if_decimal(record.get('QTY_ORDERED', 0))
+        record['QTY_SHIPPED'] = self.utils.to_float_if_decimal(record.get('QTY_SHIPPED', 0))
+        record['UNIT_PRICE'] = self.utils.to_float_if_decimal(record.get('UNIT_PRICE', 0.0))
+        record['DISCOUNT'] = self.utils.to_float_if_decimal(record.get('DISCOUNT', 0.0))
+        record['DEDUCTION'] = self.utils.to_float_if_decimal(record.get('DEDUCTION', 0.0))
+        return record
+
+    order_values = operator.itemgetter(*ORDER_COLUMNS)
+    item_values = operator.itemgetter(*ITEM_COLUMNS)
+
+    def build_order(self, son, order_values):
+        """Order from header values in ORDER_COLUMNS order"""
+        return Order.from_values(son, order_values)
+
+    def build_item(self, record):
+        return LineItem.from_values(self.item_values(record))
+
+    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+           (snowflake.connector.errors.OperationalError,
+            snowflake.connector.errors.DatabaseError,
+            requests.exceptions.RequestException), breaker='snowflake')
+    def execute_orders_query(self, order_by='', orders_filter=None):
+        """Run the orders query on a pooled connection. Returns (pooled connection, cursor); the
+        caller closes the cursor and checks the connection back in."""
+        pooled = self.pool.checkout()
+        try:
+            cursor = pooled.conn.cursor()
+            with metrics.timer('snowflake_call_seconds', {'call': 'execute'}):
+                cursor.execute(self.build_selected_query(orders_filter) + order_by)
+        except BaseException:
+            self.pool.checkin(pooled, discard=True)
+            raise
+        return pooled, cursor
+
+    def build_selected_query(self, orders_filter=None):
+        if APP_CONFIG['query_mode'] == 'aggregated':
+            return self.build_aggregated_orders_query(orders_filter)
+        return self.build_orders_query(orders_filter)
+
+    @staticmethod
+    def partition_filter(orders_filter, partition, partitions):
+        """Narrow orders_filter to one hash partition; all rows of an order share SALES_ORDER_NUMBER, so
+        every order falls into exactly one partition"""
+        return f"({orders_filter})\n          AND MOD(ABS(HASH(SALES_ORDER_NUMBER)), {partitions}) = {partition}"
+
+    def partition_filters(self, partitions):
+        orders_filter = self.build_orders_filter()
+        logger.info(f"Extracting orders in {partitions} partitions by hash of SALES_ORDER_NUMBER.")
+        return [self.partition_filter(orders_filter, partition, partitions) for partition in range(partitions)]
+
+    @staticmethod
+    def arrow_enabled():
+        return pyarrow is not None and APP_CONFIG['arrow_fetch']
+
+    def iter_row_records(self, cursor):
+        """Yield (order number, order values, item) per row, normalizing values one row at a time"""
+        cols = [c[0] for c in cursor.description]
+        batch_size = APP_CONFIG['fetch_batch_size']
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for r in rows:
+                record = self.normalize_record(dict(zip(cols, r)))
+                yield record['SALES_ORDER_NUMBER'] or '', self.order_values(record), self.build_item(record)
+
+    def normalize_arrow_batch(self, table):
+        """Cast DECIMAL columns to float64 and DATE columns to ISO strings, column-wise"""
+        columns = {}
+        for name in table.column_names:
+            column = table[name]
+            if name in self.DECIMAL_COLUMNS and pyarrow.types.is_decimal(column.type):
+                # Going through the decimal text gives the same float as float(Decimal); a direct
+                # decimal-to-float64 cast can be off by one ulp (5.35 -> 5.3500000000000005)
+                column = pyarrow.compute.cast(pyarrow.compute.cast(column, pyarrow.string()), pyarrow.float64())
+            elif name in self.DATE_COLUMNS and pyarrow.types.is_date(column.type):
+                column = pyarrow.compute.cast(column, pyarrow.string())
+            elif name in self.DATE_COLUMNS and not pyarrow.types.is_string(column.type):
+                columns[name] = [self.utils.normalize_date(value) for value in column.to_pylist()]
+                continue
+            columns[name] = column.to_pylist()
+        return columns
+
+    def iter_arrow_records(self, cursor):
+        """Yield (order number, order values, item) from the connector's Arrow result batches"""
+        for table in cursor.fetch_arrow_batches():
+            if 'WATERMARK_VALUE' in table.column_names:
+                self.track_watermark(pyarrow.compute.max(table['WATERMARK_VALUE']).as_py())
+            columns = self.normalize_arrow_batch(table)
+            order_columns = [columns[name] for name in self.ORDER_COLUMNS]
+            item_columns = [columns[name] for name in self.ITEM_COLUMNS]
+            order_rows = zip(*order_columns)
+            for son, order_row, item_row in zip(columns['SALES_ORDER_NUMBER'], order_rows, zip(*item_columns)):
+                yield son or '', order_row, LineItem.from_values(item_row)
+
+    def iter_records(self, cursor):
+        if self.arrow_enabled():
+            return self.iter_arrow_records(cursor)
+        return self.iter_row_records(cursor)
+
+    def group_sorted_records(self, records):
+        """Assemble orders from records sorted by order number, yielding each as its run ends"""
+        current_son = None
+        current_order = None
+        for son, order_values, item in records:
+            if current_order is None or son != current_son:
+                if current_order is not None:
+                    yield current_son, current_order
+                current_son = son
+                current_order = self.build_order(son, order_values)
+            current_order.items.append(item)
+        if current_order is not None:
+            yield current_son, current_order
+
+    def iter_orders(self):
+        """Yield (order_number, order_data) one fully assembled order at a time.
+
+        Rows are sorted by SALES_ORDER_NUMBER in Snowflake and read batch by batch (Arrow result
+        batches when pyarrow is installed, fetchmany otherwise), so memory stays bounded by one batch
+        and the first order is available after the first batch. In the 'aggregated' query mode every
+        row already is a whole order. With extract_partitions > 1 the partitions are streamed
+        concurrently and their orders interleave.
+        """
+        self.pending_watermark = None
+        partitions = APP_CONFIG['extract_partitions']
+        if partitions > 1:
+            orders = self.iter_partitioned_orders(self.partition_filters(partitions))
+        else:
+            orders = self.iter_query_orders()
+        total_orders = 0
+        for son, order in self.snapshot_orders(orders):
+            total_orders += 1
+            yield son, order
+
+        logger.info(f"{total_orders} distinct orders streamed from Snowflake (including open and posted orders).")
+
+    def iter_query_orders(self, orders_filter=None):
+        """Stream the orders of one query on its own pooled connection"""
+        pooled, cursor = self.execute_orders_query("ORDER BY SALES_ORDER_NUMBER\n", orders_filter)
+        try:
+            if APP_CONFIG['query_mode'] == 'aggregated':
+                orders = self.iter_aggregated_orders(cursor)
+            else:
+                orders = self.group_sorted_records(self.iter_records(cursor))
+            yield from orders
+        except BaseException:
+            cursor.close()
+            self.pool.checkin(pooled, discard=True)
+            raise
         cursor.close()
+        self.pool.checkin(pooled)
+
+    def iter_partitioned_orders(self, orders_filters):
+        """Stream every filter on its own thread and connection, yielding orders as they complete.
+
+        Orders pass through a queue of stream_chunk_orders entries, so readers wait for the consumer
+        instead of buffering whole partitions. The first error of any partition is raised here, and
+        closing the generator stops all readers.
+        """
+        results = queue.Queue(maxsize=APP_CONFIG['stream_chunk_orders'])
+        stop = threading.Event()
+        finished = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_partition(orders_filter):
+            orders = self.iter_query_orders(orders_filter)
+            try:
+                for order in orders:
+                    if not put(order):
+                        return
+                put(finished)
+            except BaseException as e:
+                put(e)
+            finally:
+                orders.close()
+
+        with ThreadPoolExecutor(max_workers=len(orders_filters), thread_name_prefix='extract') as executor:
+            for orders_filter in orders_filters:
+                executor.submit(read_partition, orders_filter)
+            try:
+                remaining = len(orders_filters)
+                while remaining:
+                    item = results.get()
+                    if item is finished:
+                        remaining -= 1
+                    elif isinstance(item, BaseException):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stop.set()
+
+    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+           (snowflake.connector.errors.OperationalError,
+            snowflake.connector.errors.DatabaseError,
+            requests.exceptions.RequestException), breaker='snowflake')
+    def fetch_orders(self):
+        self.pending_watermark = None
+        partitions = APP_CONFIG['extract_partitions']
+        if partitions > 1:
+            # Partitions hold disjoint sets of orders, so their dicts merge without overlap
+            orders_dict = {}
+            with ThreadPoolExecutor(max_workers=partitions, thread_name_prefix='extract') as executor:
+                for partition_orders in executor.map(self.fetch_query_orders, self.partition_filters(partitions)):
+                    orders_dict.update(partition_orders)
+        else:
+            orders_dict = self.fetch_query_orders()
+        logger.info(f"{len(orders_dict)} distinct orders loaded from Snowflake (including open and posted orders).")
+        for _ in self.snapshot_orders(orders_dict.items()):
+            pass
+        return orders_dict
+
+    def start_snapshot(self):
+        """SnapshotWriter for the extract about to be read, or None when snapshots are off or unavailable"""
+        directory = APP_CONFIG['snapshot_dir']
+        if not directory:
+            return None
+        if pyarrow is None:
+            logger.warning("APP_SNAPSHOT_DIR is set but pyarrow is not installed; the extract is not recorded.")
+            return None
+        details = {'load_method': APP_CONFIG['LOAD_METHOD'], 'query_mode': APP_CONFIG['query_mode'],
+                   'extract_partitions': APP_CONFIG['extract_partitions']}
+        if APP_CONFIG['LOAD_METHOD'] == 'incremental' and self.sync_state is not None:
+            details['since_watermark'] = self.sync_state.get_watermark(self.WATERMARK_NAME)
+        try:
+            return snapshots.SnapshotWriter(directory, APP_CONFIG['snapshot_format'], **details)
+        except (OSError, pyarrow.ArrowException) as e:
+            logger.warning(f"Could not start an extract snapshot in {directory}: {e}")
+            return None
+
+    def snapshot_orders(self, orders):
+        """Pass orders through, recording them to a snapshot when APP_SNAPSHOT_DIR is set.
+
+        A snapshot failure only costs the snapshot, never the cycle. If the orders are not read to
+        the end, the snapshot is still closed but marked incomplete.
+        """
+        writer = self.start_snapshot()
+        if writer is None:
+            yield from orders
+            return
+        complete = False
+        try:
+            for son, order in orders:
+                if writer is not None:
+                    try:
+                        writer.add(son, order)
+                    except (OSError, pyarrow.ArrowException) as e:
+                        logger.warning(f"Extract snapshot {writer.path} abandoned: {e}")
+                        writer = None
+                yield son, order
+            complete = True
+        finally:
+            if writer is not None:
+                try:
+                    writer.close(self.pending_watermark, complete)
+                    snapshots.prune_snapshots(APP_CONFIG['snapshot_dir'], APP_CONFIG['snapshot_keep'])
+                except (OSError, pyarrow.ArrowException) as e:
+                    logger.warning(f"Could not finish extract snapshot {writer.path}: {e}")
+
+    def fetch_query_orders(self, orders_filter=None):
+        """Load the orders of one query on its own pooled connection into a dict"""
+        query = self.build_selected_query(orders_filter)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            with metrics.timer('snowflake_call_seconds', {'call': 'execute'}):
+                cursor.execute(query)
+            orders_dict = {}
+
+            if APP_CONFIG['query_mode'] == 'aggregated':
+                for son, order in self.iter_aggregated_orders(cursor):
+                    orders_dict[son] = order
+            else:
+                for son, order_values, item in self.iter_records(cursor):
+                    if son not in orders_dict:
+                        orders_dict[son] = self.build_order(son, order_values)
+                    orders_dict[son].items.append(item)
+
+            cursor.close()
         return orders_dict
 
     def close(self):
-        if self.conn:
-            self.conn.close()
-            logger.info("Snowflake connection closed.")
+        self.pool.close()
+        logger.info("Snowflake connections closed.")
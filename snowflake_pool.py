@@ -0,0 +1,137 @@
+# salesforce_snowflake_sync/snowflake_pool.py
+
+import contextlib
+import logging
+import threading
+import time
+import snowflake.connector
+import requests
+from config import APP_CONFIG
+from retry import retry
+import fake_snowflake
+from metrics import metrics
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+
+class PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created_at
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.last_used
+
+
+class SnowflakeConnectionPool:
+    """A small pool of Snowflake connections.
+
+    Sessions are opened with client_session_keep_alive so they survive the wait between cycles.
+    Connections older than snowflake_pool_max_age or idle longer than snowflake_pool_max_idle are
+    closed on checkout instead of reused. A connection idle for snowflake_liveness_interval or more
+    is checked with the connector's session heartbeat, which does not use the warehouse. Up to
+    snowflake_pool_size connections can be checked out at once; further checkouts block.
+    """
+
+    def __init__(self, config, size=None, max_age=None, max_idle=None, liveness_interval=None):
+        self.config = config
+        self.size = size or APP_CONFIG['snowflake_pool_size']
+        self.max_age = APP_CONFIG['snowflake_pool_max_age'] if max_age is None else max_age
+        self.max_idle = APP_CONFIG['snowflake_pool_max_idle'] if max_idle is None else max_idle
+        self.liveness_interval = (APP_CONFIG['snowflake_liveness_interval']
+                                  if liveness_interval is None else liveness_interval)
+        self.idle_connections = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.size)
+
+    @retry(APP_CONFIG['max_retries'], APP_CONFIG['retry_wait'],
+           (snowflake.connector.errors.OperationalError,
+            snowflake.connector.errors.DatabaseError,
+            requests.exceptions.RequestException), budget=False)
+    def connect(self):
+        if APP_CONFIG['snowflake_backend'] == 'fake':
+            logger.info(f"Connecting to fake Snowflake at {APP_CONFIG['fake_snowflake_path']}...")
+            return PooledConnection(fake_snowflake.connect(APP_CONFIG['fake_snowflake_path']))
+        logger.info("Connecting to Snowflake...")
+        conn = snowflake.connector.connect(
+            user=self.config['user'],
+            password=self.config['password'],
+            account=self.config['account'],
+            warehouse=self.config['warehouse'],
+            database=self.config['database'],
+            schema=self.config['schema'],
+            role=self.config['role'],
+            client_session_keep_alive=True
+        )
+        logger.info("Successfully connected to Snowflake.")
+        return PooledConnection(conn)
+
+    def checkout(self):
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    pooled = self.idle_connections.pop() if self.idle_connections else None
+                if pooled is None:
+                    with metrics.timer('snowflake_call_seconds', {'call': 'connect'}):
+                        return self.connect()
+                if self.is_usable(pooled):
+                    return pooled
+                self.discard(pooled)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def checkin(self, pooled, discard=False):
+        try:
+            if discard or pooled.conn.is_closed():
+                self.discard(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                with self.lock:
+                    self.idle_connections.append(pooled)
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Check out a connection for the block; it is discarded instead of returned if the block raises"""
+        pooled = self.checkout()
+        try:
+            yield pooled.conn
+        except BaseException:
+            self.checkin(pooled, discard=True)
+            raise
+        self.checkin(pooled)
+
+    def is_usable(self, pooled):
+        if pooled.conn.is_closed():
+            return False
+        if pooled.age >= self.max_age:
+            logger.info(f"Recycling Snowflake connection after {pooled.age:.0f} seconds.")
+            return False
+        if pooled.idle >= self.max_idle:
+            logger.info(f"Recycling Snowflake connection idle for {pooled.idle:.0f} seconds.")
+            return False
+        if pooled.idle >= self.liveness_interval and not pooled.conn.is_valid():
+            logger.info("Snowflake session failed its heartbeat; reconnecting.")
+            return False
+        return True
+
+    def discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing Snowflake connection: {e}")
+
+    def close(self):
+        with self.lock:
+            idle_connections, self.idle_connections = self.idle_connections, []
+        for pooled in idle_connections:
+            self.discard(pooled)
@@ -0,0 +1,133 @@
+# salesforce_snowflake_sync/sync_state.py
+
+import datetime
+import hashlib
+import itertools
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger('sf_snowflake_integration')
+
+
+class SyncStateStore:
+    """Local SQLite record of what was last written to Salesforce.
+
+    Each synced record is stored under (kind, key) with its Salesforce Id and a hash of the
+    payload that was sent, so unchanged records can be skipped on the next cycle.
+    """
+    # Keys per IN (...) lookup, below SQLite's bound-parameter limit
+    KEY_CHUNK = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced_records ("
+            " kind TEXT NOT NULL,"
+            " record_key TEXT NOT NULL,"
+            " sf_id TEXT,"
+            " payload_hash TEXT NOT NULL,"
+            " synced_at TEXT NOT NULL,"
+            " PRIMARY KEY (kind, record_key))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " name TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS account_cache ("
+            " account_id TEXT PRIMARY KEY,"
+            " lop_key TEXT NOT NULL,"
+            " name TEXT,"
+            " system_modstamp TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def payload_hash(payload):
+        encoded = json.dumps(payload, sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def load_hashes(self, kind, keys=None):
+        """{record_key: payload_hash} of one kind, limited to keys when given"""
+        if keys is None:
+            cursor = self.conn.execute(
+                "SELECT record_key, payload_hash FROM synced_records WHERE kind = ?", (kind,))
+            return dict(cursor.fetchall())
+        hashes = {}
+        for chunk in itertools.batched(keys, self.KEY_CHUNK):
+            cursor = self.conn.execute(
+                "SELECT record_key, payload_hash FROM synced_records "
+                f"WHERE kind = ? AND record_key IN ({','.join('?' * len(chunk))})", (kind, *chunk))
+            hashes.update(cursor.fetchall())
+        return hashes
+
+    def save(self, records):
+        """Upsert (kind, key, sf_id, payload_hash) tuples in one transaction"""
+        if not records:
+            return
+        synced_at = datetime.datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO synced_records (kind, record_key, sf_id, payload_hash, synced_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, record_key) DO UPDATE SET "
+                "sf_id = excluded.sf_id, payload_hash = excluded.payload_hash, synced_at = excluded.synced_at",
+                [(kind, key, sf_id, payload_hash, synced_at) for kind, key, sf_id, payload_hash in records]
+            )
+
+    def prune(self, days):
+        """Forget records not synced in the last `days` days; they are only sent again if extracted again"""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat(timespec='seconds')
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM synced_records WHERE synced_at < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"{deleted} sync state records older than {days} days pruned.")
+        return deleted
+
+    def get_watermark(self, name):
+        row = self.conn.execute("SELECT value FROM watermarks WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, name, value):
+        updated_at = datetime.datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO watermarks (name, value, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (name, value, updated_at)
+            )
+
+    def load_accounts(self):
+        """Cached Accounts as (account_id, lop_key, name) rows"""
+        return self.conn.execute("SELECT account_id, lop_key, name FROM account_cache").fetchall()
+
+    def save_accounts(self, accounts, deleted_ids=(), replace=False):
+        """Upsert (account_id, lop_key, name, system_modstamp) rows and drop deleted Ids in one transaction.
+
+        With replace=True the cache is emptied first, for a full reload.
+        """
+        with self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM account_cache")
+            self.conn.executemany(
+                "INSERT INTO account_cache (account_id, lop_key, name, system_modstamp) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (account_id) DO UPDATE SET "
+                "lop_key = excluded.lop_key, name = excluded.name, system_modstamp = excluded.system_modstamp",
+                accounts
+            )
+            self.conn.executemany("DELETE FROM account_cache WHERE account_id = ?",
+                                  [(account_id,) for account_id in deleted_ids])
+
+    def clear(self):
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM synced_records").rowcount
+            self.conn.execute("DELETE FROM watermarks")
+            self.conn.execute("DELETE FROM account_cache")
+        logger.info(f"Sync state and watermarks cleared ({deleted} records); the next cycle does a full resync.")
+
+    def close(self):
+        self.conn.close()
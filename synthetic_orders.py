@@ -0,0 +1,86 @@
+# salesforce_snowflake_sync/synthetic_orders.py
+
+import datetime
+import random
+from decimal import Decimal
+
+# Columns of VW_SALES_ORDER_INVOICING_SUMMARY in the order generate_rows yields them
+VIEW_COLUMNS = ['SALES_ORDER_NUMBER', 'CUSTOMER_NAME', 'CUSTOMER_ACCOUNT', 'CUSTOMER_PO_NUMBER', 'CUSTOMER_NUMBER',
+                'AR_DIVISION_NUMBER', 'SALES_ORDER_DATE', 'POSTING_DATE', 'INVOICE_NUMBER', 'GROSS_SALES', 'NET_SALES',
+                'ITEM_CODE', 'ITEM_CODE_DESC', 'QTY_ORDERED', 'QTY_SHIPPED', 'UNIT_PRICE', 'DISCOUNT', 'DEDUCTION',
+                'INVOICE_DETAIL_COMMENT', 'LAST_MODIFIED_DATE']
+CENTS = Decimal('0.01')
+COMMENTS = ['Backordered', 'Ship complete', 'Partial shipment', 'Customer pickup']
+
+
+class SyntheticOrderGenerator:
+    """Rows shaped like VW_SALES_ORDER_INVOICING_SUMMARY: one per line item, header repeated.
+
+    orders_per_day orders are dated on each of the last `days` days (today included). A
+    posted_ratio share of them is posted, with a posting date, invoice number and shipped
+    quantities; the rest are open. Items per order vary around items_per_order. Money and
+    quantities are Decimals, as the connector returns NUMBER columns, and optional columns are
+    NULL at null_rate. The same seed gives the same rows.
+    """
+
+    def __init__(self, orders_per_day=200, days=10, items_per_order=8, posted_ratio=0.7, null_rate=0.02,
+                 customers=500, products=5000, seed=7, today=None):
+        self.orders_per_day = orders_per_day
+        self.days = days
+        self.items_per_order = items_per_order
+        self.posted_ratio = posted_ratio
+        self.null_rate = null_rate
+        self.customers = customers
+        self.products = products
+        self.seed = seed
+        self.today = today or datetime.date.today()
+
+    @property
+    def order_count(self):
+        return self.orders_per_day * self.days
+
+    def maybe_null(self, rng, value):
+        return None if rng.random() < self.null_rate else value
+
+    def generate_rows(self):
+        """Yield row tuples in VIEW_COLUMNS order, sorted by order date then order number"""
+        rng = random.Random(self.seed)
+        number = 0
+        for day in range(self.days - 1, -1, -1):
+            order_date = self.today - datetime.timedelta(days=day)
+            for _ in range(self.orders_per_day):
+                number += 1
+                yield from self.order_rows(rng, number, order_date)
+
+    def order_rows(self, rng, number, order_date):
+        customer = rng.randrange(self.customers)
+        posted = rng.random() < self.posted_ratio
+        posting_date = min(order_date + datetime.timedelta(days=rng.randrange(3)), self.today) if posted else None
+        modified = datetime.datetime.combine(posting_date or order_date, datetime.time()) + datetime.timedelta(
+            seconds=rng.randrange(86400))
+
+        items = []
+        for _ in range(rng.randint(1, 2 * self.items_per_order - 1)):
+            qty_ordered = Decimal(rng.randint(1, 50))
+            if not posted:
+                qty_shipped = Decimal(0)
+            elif rng.random() < 0.9:
+                qty_shipped = qty_ordered
+            else:
+                qty_shipped = Decimal(rng.randint(0, int(qty_ordered)))
+            unit_price = Decimal(rng.uniform(1, 200)).quantize(CENTS)
+            discount = (unit_price * qty_ordered * Decimal(rng.choice((0, 0, 0, 5, 10))) / 100).quantize(CENTS)
+            deduction = Decimal(rng.uniform(0, 5)).quantize(CENTS) if rng.random() < 0.3 else Decimal('0.00')
+            product = rng.randrange(self.products)
+            items.append((f"ITEM{product:05d}", self.maybe_null(rng, f"Product {product}"), qty_ordered, qty_shipped,
+                          unit_price, self.maybe_null(rng, discount), self.maybe_null(rng, deduction),
+                          rng.choice(COMMENTS) if rng.random() < 0.2 else None))
+
+        gross = sum(item[2] * item[4] for item in items)
+        net = gross - sum(item[5] or 0 for item in items) - sum(item[6] or 0 for item in items)
+        header = (f"SO{number:09d}", f"Customer {customer}", self.maybe_null(rng, f"ACCT{customer:05d}"),
+                  self.maybe_null(rng, f"PO-{rng.randrange(10 ** 6):06d}"), f"C{customer:05d}",
+                  f"{customer % 3 + 1:02d}", order_date, posting_date, f"INV{number:09d}" if posted else None,
+                  gross.quantize(CENTS), net.quantize(CENTS))
+        for item in items:
+            yield header + item + (modified,)
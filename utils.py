@@ -3,6 +3,8 @@ import re
 import datetime
 from decimal import Decimal
 
+ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
 class Utils:
     @staticmethod
     def normalize_string(value):
@@ -27,6 +29,31 @@ class Utils:
                 return d
         return d
 
+    @staticmethod
+    def same_value(current, new, tolerance=0.0):
+        """Whether a field value read from Salesforce matches a source value: blanks match null, numbers
+        match within tolerance, and a date matches a datetime on the same day"""
+        if current in (None, '') or new in (None, ''):
+            return current in (None, '') and new in (None, '')
+        if isinstance(new, datetime.date):
+            new = new.isoformat()
+        numeric = (int, float, Decimal)
+        if isinstance(new, numeric) or isinstance(current, numeric):
+            try:
+                return abs(float(current) - float(new)) <= tolerance
+            except (TypeError, ValueError):
+                return False
+        current, new = str(current).strip(), str(new).strip()
+        if current == new:
+            return True
+        if ISO_DATE.match(current) and ISO_DATE.match(new) and (len(current) == 10 or len(new) == 10):
+            return current[:10] == new[:10]
+        return False
+
+    @staticmethod
+    def escape_soql(value):
+        return str(value).replace('\\', '\\\\').replace("'", "\\'")
+
     @staticmethod
     def to_float_if_decimal(value):
         if isinstance(value, Decimal):